@@ -3,17 +3,48 @@ OMNI-OPS BRAIN SERVER v2.0
 Production-grade AI Backend for Electron Game
 
 Serves on localhost:8080 with CORS headers.
-Zero telemetry. Zero dependencies. Pure HTTP.
+No external telemetry: spans go to a local OTLP-JSON file (see setup_tracing)
+unless a collector is configured. Zero required dependencies. Pure HTTP.
+Replies come from built-in keyword responses unless BRAIN_AI_MODEL names a model,
+which is then called through the shared LLM gateway (llm_gateway.py).
+Serving: threaded, HTTP/1.1 keep-alive (BRAIN_SERVER_MODE=single for the legacy server).
 Endpoints:
   GET  /health     → Returns {"status": "ready"}
-  POST /chat       → Accepts {"prompt": "..."}, returns AI response
+  POST /chat       → Accepts {"prompt": "...", "context": {...}?}, returns AI response
+                     (+ "cache": "hit"|"miss"; hit ratio reported by /health)
+  POST /chat/batch → Accepts {"prompts": [{"id", "prompt", "context"?}, ...]}, results in order
+  POST /chat/stream → Same body as /chat (or /chat with "stream": true); replies with
+                     Server-Sent Events over chunked transfer: "token" events carrying
+                     {"text": "..."} as the reply is produced, then one "done" event
+                     with the full /chat-style JSON
+
+OmniAgent (see OMNI AGENT below) is the workspace-aware coding assistant used by
+coding_assistant.py, personal_assistant.py, task_manager.py, run_diagnostics.py and
+ai_collaborative_bridge.py; all agents in a process share one workspace index.
+
+Trace report:
+  python agent_with_tracing.py --trace-summary [traces/omni-ops-traces.jsonl]
 """
 
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
 import json
 import sys
 import os
-from typing import Dict, Any
+import signal
+import threading
+import time
+import queue
+import random
+import hashlib
+import functools
+import contextvars
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional
 from urllib.parse import urlparse, parse_qs
 import traceback
 
@@ -25,6 +56,10 @@ CONFIG = {
         "HOST": "127.0.0.1",
         "PORT": 8080,
         "TIMEOUT": 30,
+        "MODE": "threaded",          # "threaded" (concurrent, keep-alive) or "single" (legacy)
+        "MAX_CONNECTIONS": 64,       # Open connections before new ones get 503
+        "KEEPALIVE_TIMEOUT": 5,      # Seconds an idle keep-alive connection stays open
+        "DRAIN_TIMEOUT": 10,         # Seconds to let in-flight requests finish on shutdown
     },
     "CORS": {
         "ALLOW_ORIGIN": "*",
@@ -33,9 +68,70 @@ CONFIG = {
     },
     "AI": {
         "ENABLED": True,
-        "MODEL": "fallback",  # Can be extended for real LLM integration
+        # "fallback" = built-in keyword replies; any other value is a model name sent
+        # through the shared LLM gateway (llm_gateway.py, interactive lane)
+        "MODEL": os.environ.get("BRAIN_AI_MODEL", "fallback"),
+        "MAX_TOKENS": 150,
+        "SYSTEM_PROMPT": (
+            "You are ARIA, the tactical AI of OMNI-OPS. Answer the soldier in one or two "
+            "short sentences, in character, always starting with 'ARIA:'."
+        ),
         "MAX_PROMPT_LENGTH": 2000,
-    }
+        "MAX_BODY_BYTES": 1024 * 100,         # /chat request body limit
+        "MAX_BATCH_BODY_BYTES": 1024 * 1024,  # /chat/batch request body limit
+        "MAX_BATCH_SIZE": 64,                 # Prompts per /chat/batch request
+        "BATCH_CONCURRENCY": 8,               # Distinct prompts generated in parallel
+        "STREAM_TOKEN_DELAY": 0.0,            # Seconds between fallback tokens (0 = no pacing)
+        "CACHE": {
+            "ENABLED": True,
+            "MAX_ENTRIES": 512,   # LRU bound on distinct normalized prompts
+            "TTL_SECONDS": 300,   # Cached replies expire so a real model can vary over time
+        },
+    },
+    "AGENT": {
+        # OmniAgent replies: "fallback" = built from the workspace index and issue scan
+        # alone; any other value is a model name sent through the shared LLM gateway
+        # (background lane). OmniAgent(use_local=False) uses the gateway's default model.
+        "MODEL": os.environ.get("OMNI_AGENT_MODEL", "fallback"),
+        "MAX_TOKENS": 1500,
+        "MAX_FILE_CHARS": 24000,   # File text sent with one analysis prompt
+        "CONTEXT_FILES": 8,        # Workspace files listed with include_context
+        "SNIPPETS_PER_FILE": 3,    # Matching lines quoted per context file
+        "REFERENCE_LOOKUPS": 8,    # Functions of an analyzed file looked up elsewhere
+        "SYSTEM_PROMPT": (
+            "You are a senior developer on OMNI-OPS, a browser FPS (JavaScript) with Python "
+            "AI tooling. Be specific: name files, functions and line numbers."
+        ),
+    },
+    "TRACING": {
+        # Local OTLP-JSON lines - one ExportTraceServiceRequest per line
+        "TRACE_FILE": os.environ.get(
+            "OMNI_TRACE_FILE",
+            str(Path(__file__).parent / "traces" / "omni-ops-traces.jsonl"),
+        ),
+        # Also ship to a collector when one is configured (e.g. http://localhost:4318/v1/traces)
+        "OTLP_ENDPOINT": os.environ.get("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT")
+                         or os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"),
+        "INSTRUMENT_REQUESTS": True,  # Client spans + traceparent for outgoing `requests` calls
+    },
+    "LOGGING": {
+        # Request log, one JSON object per line, written off the request path
+        "FILE": os.environ.get(
+            "BRAIN_REQUEST_LOG",
+            str(Path(__file__).parent / "logs" / "brain-requests.jsonl"),
+        ),
+        "CONSOLE": True,          # Also echo a one-line summary (from the writer thread)
+        "QUEUE_SIZE": 10000,      # Records buffered before new ones are dropped
+        "FLUSH_INTERVAL": 1.0,    # Seconds between file flushes
+        "SAMPLING": {             # Fraction of successful requests logged per route
+            "/health": 0.01,
+            "/alive": 0.01,
+            "/api/*": 0.1,
+            "/chat": 1.0,
+            "*": 1.0,
+        },
+        "RATE_LIMIT_PER_SEC": 20,  # Per-route cap on logged records (errors included)
+    },
 }
 
 # ============================================================================
@@ -51,16 +147,614 @@ FALLBACK_RESPONSES = {
         "uptime_ms": 0,
     }
 }
+# ============================================================================
+# TRACING — Local OpenTelemetry spans (opentelemetry is optional)
+# ============================================================================
+_tracing_state = {
+    "provider": None,
+    "service_name": None,
+    "trace_file": None,
+}
+
+
+def _otel_trace():
+    """The opentelemetry.trace module, or None when OpenTelemetry is not installed."""
+    try:
+        from opentelemetry import trace
+        return trace
+    except ImportError:
+        return None
+
+
+def _otlp_value(value) -> Dict[str, Any]:
+    """Python attribute value → OTLP/JSON AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in (attributes or {}).items()]
+
+
+def _otlp_span(span) -> Dict[str, Any]:
+    ctx = span.get_span_context()
+    return {
+        "traceId": format(ctx.trace_id, "032x"),
+        "spanId": format(ctx.span_id, "016x"),
+        "parentSpanId": format(span.parent.span_id, "016x") if span.parent else "",
+        "name": span.name,
+        "kind": span.kind.value + 1,  # OTLP enum is offset by SPAN_KIND_UNSPECIFIED
+        "startTimeUnixNano": str(span.start_time),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": _otlp_attributes(span.attributes),
+        "events": [
+            {
+                "timeUnixNano": str(event.timestamp),
+                "name": event.name,
+                "attributes": _otlp_attributes(event.attributes),
+            }
+            for event in span.events
+        ],
+        "status": {
+            "code": span.status.status_code.value,
+            "message": span.status.description or "",
+        },
+    }
+
+
+class JsonlSpanExporter:
+    """
+    Span exporter that appends OTLP/JSON (one ExportTraceServiceRequest per line)
+    to a local file. Same shape the OpenTelemetry Collector file exporter writes,
+    so the file can be replayed into any OTLP backend later.
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+    
+    def export(self, spans):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+        
+        # Group by resource → instrumentation scope, as OTLP does
+        grouped = {}
+        for span in spans:
+            resource_key = id(span.resource)
+            scope = span.instrumentation_scope
+            scope_key = (scope.name, scope.version) if scope else ("", None)
+            entry = grouped.setdefault(resource_key, {"resource": span.resource, "scopes": {}})
+            entry["scopes"].setdefault(scope_key, []).append(_otlp_span(span))
+        
+        request = {"resourceSpans": [
+            {
+                "resource": {"attributes": _otlp_attributes(entry["resource"].attributes)},
+                "scopeSpans": [
+                    {"scope": {"name": name, "version": version or ""}, "spans": otlp_spans}
+                    for (name, version), otlp_spans in entry["scopes"].items()
+                ],
+            }
+            for entry in grouped.values()
+        ]}
+        
+        line = json.dumps(request, separators=(",", ":")) + "\n"
+        try:
+            with self.lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            return SpanExportResult.SUCCESS
+        except OSError as err:
+            print(f"[Tracing] Could not write {self.path}: {err}")
+            return SpanExportResult.FAILURE
+    
+    def shutdown(self):
+        pass
+    
+    def force_flush(self, timeout_millis: int = 30000):
+        return True
+
+
+def setup_tracing(service_name: str = None, trace_file: str = None, otlp_endpoint: str = None):
+    """
+    Configure OpenTelemetry for this process.
+    
+    Spans always go to a local OTLP/JSON-lines file (CONFIG["TRACING"]["TRACE_FILE"],
+    override with OMNI_TRACE_FILE). When an OTLP collector endpoint is configured
+    (argument or OTEL_EXPORTER_OTLP_[TRACES_]ENDPOINT) spans are exported there too.
+    Safe to call more than once; without OpenTelemetry installed it is a no-op and
+    every trace_span() below costs nothing.
+    
+    Returns the TracerProvider, or None when tracing is unavailable.
+    """
+    if _tracing_state["provider"] is not None:
+        return _tracing_state["provider"]
+    
+    trace = _otel_trace()
+    if trace is None:
+        print("[Tracing] opentelemetry not installed - tracing disabled (pip install -r requirements.txt)")
+        return None
+    
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    
+    cfg = CONFIG["TRACING"]
+    service_name = service_name or Path(sys.argv[0]).stem or "omni-ops"
+    trace_file = trace_file or cfg["TRACE_FILE"]
+    
+    provider = TracerProvider(resource=Resource.create({
+        "service.name": service_name,
+        "service.namespace": "omni-ops",
+        "process.pid": os.getpid(),
+    }))
+    provider.add_span_processor(BatchSpanProcessor(JsonlSpanExporter(trace_file)))
+    
+    # An explicit endpoint is used verbatim; the env-configured one is read by the
+    # exporter itself (which appends /v1/traces to OTEL_EXPORTER_OTLP_ENDPOINT)
+    collector = otlp_endpoint or cfg["OTLP_ENDPOINT"]
+    if collector:
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            exporter = OTLPSpanExporter(endpoint=otlp_endpoint) if otlp_endpoint else OTLPSpanExporter()
+            provider.add_span_processor(BatchSpanProcessor(exporter))
+        except ImportError:
+            print("[Tracing] OTLP exporter not installed - writing local trace file only")
+            collector = None
+    
+    trace.set_tracer_provider(provider)
+    
+    if cfg["INSTRUMENT_REQUESTS"]:
+        try:
+            from opentelemetry.instrumentation.requests import RequestsInstrumentor
+            RequestsInstrumentor().instrument()
+        except Exception:
+            pass  # requests or its instrumentation missing - nothing to instrument
+    
+    _tracing_state.update(provider=provider, service_name=service_name, trace_file=trace_file)
+    print(f"[Tracing] {service_name} → {trace_file}" + (f" + OTLP {collector}" if collector else ""))
+    return provider
+
+
+def get_tracer(name: str = "omni-ops"):
+    """Tracer for `name` (a no-op tracer until setup_tracing() has run)."""
+    trace = _otel_trace()
+    return trace.get_tracer(name) if trace else None
+
+
+@contextmanager
+def trace_span(name: str, attributes: Dict[str, Any] = None, kind: str = None):
+    """
+    `with trace_span("llm.messages.create", {"llm.model": model}) as span:`
+    
+    Yields the span (None without OpenTelemetry). Exceptions are recorded on the
+    span and re-raised. `kind` is an OpenTelemetry SpanKind name: "server",
+    "client", "producer", "consumer" or "internal" (default).
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    
+    from opentelemetry.trace import SpanKind
+    span_kind = getattr(SpanKind, (kind or "internal").upper())
+    clean = {k: v for k, v in (attributes or {}).items() if v is not None}
+    with tracer.start_as_current_span(name, kind=span_kind, attributes=clean) as span:
+        yield span
+
+
+def traced(name: str = None, **attributes):
+    """Decorator form of trace_span(); span name defaults to the function's qualname."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace_span(span_name, attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_flask_app(app):
+    """Open a SERVER span for every Flask request (continuing incoming traceparent headers)."""
+    trace = _otel_trace()
+    if trace is None:
+        return app
+    
+    from flask import request, g
+    from opentelemetry import context, propagate
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+    
+    @app.before_request
+    def _otel_start_span():
+        parent = propagate.extract(dict(request.headers))
+        route = request.url_rule.rule if request.url_rule else request.path
+        span = get_tracer("flask").start_span(
+            f"HTTP {request.method} {route}",
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={
+                "http.method": request.method,
+                "http.route": route,
+                "http.target": request.full_path.rstrip("?"),
+                "http.request_content_length": request.content_length or 0,
+            },
+        )
+        g._otel_span = span
+        g._otel_token = context.attach(trace.set_span_in_context(span, parent))
+    
+    @app.after_request
+    def _otel_record_status(response):
+        span = g.get("_otel_span")
+        if span is not None:
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.set_status(Status(StatusCode.ERROR))
+        return response
+    
+    @app.teardown_request
+    def _otel_end_span(exc):
+        span = g.pop("_otel_span", None)
+        token = g.pop("_otel_token", None)
+        if span is not None:
+            if exc is not None:
+                span.record_exception(exc)
+                span.set_status(Status(StatusCode.ERROR, str(exc)))
+            span.end()
+        if token is not None:
+            context.detach(token)
+    
+    return app
+
+
+def summarize_traces(trace_file: str = None, top: int = 25) -> List[Dict[str, Any]]:
+    """
+    Aggregate a JSONL trace file by span name: count, total and self time.
+    Self time = span duration minus its direct children, i.e. where wall time really went.
+    """
+    trace_file = trace_file or CONFIG["TRACING"]["TRACE_FILE"]
+    spans = {}
+    with open(trace_file, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource in json.loads(line).get("resourceSpans", []):
+                for scope in resource.get("scopeSpans", []):
+                    for span in scope.get("spans", []):
+                        duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+                        spans[(span["traceId"], span["spanId"])] = {
+                            "name": span["name"],
+                            "parent": (span["traceId"], span["parentSpanId"]) if span["parentSpanId"] else None,
+                            "ms": duration,
+                            "child_ms": 0.0,
+                        }
+    
+    for span in spans.values():
+        parent = spans.get(span["parent"]) if span["parent"] else None
+        if parent is not None:
+            parent["child_ms"] += span["ms"]
+    
+    summary = {}
+    for span in spans.values():
+        row = summary.setdefault(span["name"], {"name": span["name"], "count": 0, "total_ms": 0.0, "self_ms": 0.0, "max_ms": 0.0})
+        row["count"] += 1
+        row["total_ms"] += span["ms"]
+        row["self_ms"] += max(0.0, span["ms"] - span["child_ms"])
+        row["max_ms"] = max(row["max_ms"], span["ms"])
+    
+    return sorted(summary.values(), key=lambda r: r["self_ms"], reverse=True)[:top]
+
+
+# ============================================================================
+# REQUEST LOGGING — Sampled, rate-limited, JSONL, never blocks a request
+# ============================================================================
+class StructuredRequestLogger:
+    """
+    Queue-backed structured logger for the request hot path.
+    
+    log() only makes a sampling/rate-limit decision and does a put_nowait();
+    formatting, console output and file I/O happen on a background thread.
+    Every record carries the sample rate it was kept at, so counts can be
+    re-weighted later. Requests with status >= 400 bypass sampling but still
+    respect the per-route rate limit.
+    """
+    
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or CONFIG["LOGGING"]
+        self.queue = queue.Queue(maxsize=self.config["QUEUE_SIZE"])
+        self.buckets = {}  # route → [tokens, last_refill]
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {"logged": 0, "sampled_out": 0, "rate_limited": 0, "dropped": 0}
+    
+    @staticmethod
+    def route_key(path: str) -> str:
+        return "/api/*" if path.startswith("/api/") else path
+    
+    def sample_rate(self, route: str) -> float:
+        sampling = self.config["SAMPLING"]
+        return sampling.get(route, sampling.get("*", 1.0))
+    
+    def _take_token(self, route: str) -> bool:
+        rate = self.config["RATE_LIMIT_PER_SEC"]
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(route)
+            if bucket is None:
+                bucket = self.buckets[route] = [float(rate), now]
+            bucket[0] = min(float(rate), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                return False
+            bucket[0] -= 1.0
+            return True
+    
+    def log(self, path: str, status: int, **fields) -> bool:
+        """Record one request. Returns True if it was queued for writing."""
+        route = self.route_key(path)
+        rate = 1.0 if status >= 400 else self.sample_rate(route)
+        
+        if rate < 1.0 and random.random() >= rate:
+            self.stats["sampled_out"] += 1
+            return False
+        if not self._take_token(route):
+            self.stats["rate_limited"] += 1
+            return False
+        
+        record = {"ts": time.time(), "route": route, "path": path, "status": status, "sample_rate": rate}
+        record.update(fields)
+        
+        if self.thread is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+    
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._writer_loop, name="brain-request-log", daemon=True)
+                self.thread.start()
+        return self
+    
+    def close(self, timeout: float = 2.0):
+        """Flush what is queued and stop the writer thread."""
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+    
+    def _writer_loop(self):
+        path = Path(self.config["FILE"])
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            out = open(path, "a", encoding="utf-8")
+        except OSError as err:
+            print(f"[BrainServer::Log] Cannot open {path}: {err} - console only")
+            out = None
+        
+        last_flush = time.monotonic()
+        try:
+            while True:
+                try:
+                    record = self.queue.get(timeout=self.config["FLUSH_INTERVAL"])
+                except queue.Empty:
+                    record = False
+                
+                if record is None:
+                    break
+                if record:
+                    self.stats["logged"] += 1
+                    if out is not None:
+                        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    if self.config["CONSOLE"]:
+                        print(f"[BrainServer::Request] {record.get('method', '')} {record['path']} → "
+                              f"{record['status']} ({record.get('duration_ms', 0):.1f}ms)"
+                              + (f" | {record['prompt']}" if record.get("prompt") else ""))
+                
+                if out is not None and time.monotonic() - last_flush >= self.config["FLUSH_INTERVAL"]:
+                    out.flush()
+                    last_flush = time.monotonic()
+        finally:
+            if out is not None:
+                out.close()
+
+
+request_logger = StructuredRequestLogger()
+
+
+# ============================================================================
+# RESPONSE CACHE — Repeated ARIA prompts served from memory
+# ============================================================================
+class ResponseCache:
+    """
+    LRU + TTL cache for /chat replies.
+    
+    Keys are the prompt case-folded and whitespace-collapsed, plus an optional
+    fingerprint of the request `context`, so "Status report" and
+    "  status   REPORT " share one entry but the same words asked in a different
+    game context do not.
+    """
+    
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        cfg = CONFIG["AI"]["CACHE"]
+        self.max_entries = max_entries or cfg["MAX_ENTRIES"]
+        self.ttl_seconds = cfg["TTL_SECONDS"] if ttl_seconds is None else ttl_seconds
+        self.entries = OrderedDict()  # key → (expires_at, response)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(prompt: str, context: Any = None) -> str:
+        key = " ".join(prompt.casefold().split())
+        if context:
+            fingerprint = hashlib.sha1(
+                json.dumps(context, sort_keys=True, default=str).encode("utf-8")
+            ).hexdigest()[:16]
+            key = f"{key}#{fingerprint}"
+        return key
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, response: Dict[str, Any]):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+chat_cache = ResponseCache()
+
+# Shared workers for /chat/batch - bounds prompt generation across all connections
+batch_executor = ThreadPoolExecutor(
+    max_workers=CONFIG["AI"]["BATCH_CONCURRENCY"],
+    thread_name_prefix="brain-batch",
+)
+
+
 # ============================================================================
 # HTTP REQUEST HANDLER — All endpoints here
 # ============================================================================
 class BrainRequestHandler(BaseHTTPRequestHandler):
     """HTTP handler for game ↔ AI server communication."""
     
+    # HTTP/1.1 so the game can reuse one connection for health polls, /api/* and /chat.
+    # Every response therefore MUST carry Content-Length.
+    protocol_version = "HTTP/1.1"
+    
+    # Idle keep-alive connections are closed after this many seconds
+    timeout = CONFIG["SERVER"]["KEEPALIVE_TIMEOUT"]
+    
+    # Headers and body go out as separate writes - don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+    
     def log_message(self, format, *args):
         """Suppress default logging noise."""
         pass
     
+    def parse_request(self):
+        """Request line arrived - this connection is busy until the response is sent."""
+        busy = getattr(self.server, "busy_connections", None)
+        if busy is not None:
+            busy.add(self.request)
+        self._started = time.perf_counter()
+        ok = super().parse_request()
+        if ok:
+            self._start_request_span()
+        return ok
+    
+    def handle_one_request(self):
+        self._request_span = None
+        self._started = None
+        self._status = None
+        self._log_fields = {}
+        self._streaming = False
+        try:
+            super().handle_one_request()
+        finally:
+            self._end_request_span()
+            if self._started is not None and self._status is not None:
+                request_logger.log(
+                    urlparse(self.path).path,
+                    self._status,
+                    method=self.command,
+                    duration_ms=(time.perf_counter() - self._started) * 1000,
+                    **self._log_fields,
+                )
+            busy = getattr(self.server, "busy_connections", None)
+            if busy is not None:
+                busy.discard(self.request)
+    
+    def _start_request_span(self):
+        """One SERVER span per request; LLM/handler spans nest under it."""
+        tracer = get_tracer("omni-ops-brain")
+        if tracer is None:
+            return
+        from opentelemetry import propagate, trace
+        from opentelemetry.trace import SpanKind
+        path = urlparse(self.path).path
+        parent = propagate.extract(dict(self.headers))
+        span = tracer.start_span(
+            f"HTTP {self.command} {path}",
+            context=parent,
+            kind=SpanKind.SERVER,
+            attributes={"http.method": self.command, "http.target": path},
+        )
+        self._request_span = trace.use_span(span, end_on_exit=True)
+        self._request_span.__enter__()
+    
+    def _end_request_span(self):
+        if getattr(self, "_request_span", None) is not None:
+            self._request_span.__exit__(None, None, None)
+            self._request_span = None
+    
+    def send_response(self, code, message=None):
+        self._status = code
+        if getattr(self, "_request_span", None) is not None:
+            from opentelemetry import trace
+            trace.get_current_span().set_attribute("http.status_code", code)
+        super().send_response(code, message)
+    
+    def _finish_headers(self, body_length: int):
+        """Content-Length + keep-alive/close negotiation, then end headers."""
+        self.send_header("Content-Length", str(body_length))
+        if getattr(self.server, "draining", False) or not getattr(self.server, "keep_alive", False):
+            # Single-threaded mode or shutting down - one request per connection
+            self.close_connection = True
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        else:
+            self.send_header("Connection", "keep-alive")
+        self.end_headers()
+    
+    def _discard_body(self):
+        """Consume an unused request body so the next keep-alive request parses cleanly."""
+        length = self.headers.get("Content-Length")
+        if not length:
+            return
+        try:
+            remaining = int(length)
+        except ValueError:
+            self.close_connection = True
+            return
+        while remaining > 0:
+            chunk = self.rfile.read(min(remaining, 64 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+    
     def _send_json_response(self, status_code: int, data: Dict[str, Any]):
         """
         Send a JSON response with MANDATORY CORS, MIME-Type, and JSON encoding.
@@ -84,13 +778,13 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
             # 3. Send MANDATORY MIME-Type header
             self.send_header("Content-Type", "application/json; charset=utf-8")
             
-            # 4. Terminate header section
-            self.end_headers()
-            
-            # 5. Encode response as JSON (using json.dumps for double quotes, RFC 8259)
+            # 4. Encode response as JSON (using json.dumps for double quotes, RFC 8259)
             response_json = json.dumps(data, ensure_ascii=False)
             response_bytes = response_json.encode('utf-8')
             
+            # 5. Content-Length (required for keep-alive) and terminate header section
+            self._finish_headers(len(response_bytes))
+            
             # 6. Write JSON body to client
             self.wfile.write(response_bytes)
             
@@ -141,9 +835,15 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
         
         if path == "/chat":
             self._handle_chat()
+        elif path == "/chat/stream":
+            self._handle_chat(stream=True)
+        elif path == "/chat/batch":
+            self._handle_chat_batch()
         elif path.startswith("/api/"):
+            self._discard_body()
             self._handle_api_universal(path)
         else:
+            self._discard_body()
             # 404 response MUST also include CORS + JSON
             self._send_json_response(404, {
                 "error": "Not Found",
@@ -166,7 +866,7 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
         self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
         self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.end_headers()
+        self._finish_headers(2)
         # Send empty JSON object for consistency with other endpoints
         self.wfile.write(b'{}')
     
@@ -187,9 +887,12 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
             "service": "omni-ops-brain",
             "version": "2.0",
             "protocols": ["json", "cors", "mime-type"],
+            "chat_cache": chat_cache.stats(),
         }
+        if CONFIG["AI"]["MODEL"] != "fallback":
+            from llm_gateway import get_gateway
+            response["llm_gateway"] = get_gateway().stats()
         self._send_json_response(200, response)
-        print("[BrainServer::Health] GET /health → 200 OK (JSON + CORS + MIME enforced)")
     
     def _handle_api_universal(self, path: str):
         """
@@ -213,11 +916,11 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
             "timestamp": __import__('time').time(),
         }
         self._send_json_response(200, response)
-        print(f"[BrainServer::API] {path} → 200 OK (CORS + JSON enforced)")
     
-    def _handle_chat(self):
+    def _handle_chat(self, stream: bool = False):
         """
         POST /chat → Accept prompt, return AI response.
+        POST /chat/stream (or "stream": true) → Same, as SSE tokens + a final "done" frame.
         
         PROTOCOL ENFORCEMENT:
           ✓ All error responses include CORS + JSON + MIME-Type
@@ -227,72 +930,346 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
         This is the primary endpoint for Electron client ↔ AI Brain communication.
         """
         try:
-            # Read request body
-            content_length = self.headers.get("Content-Length")
-            if not content_length:
+            data = self._read_json_body(CONFIG["AI"]["MAX_BODY_BYTES"])
+            if data is None:
+                return
+            
+            # Validate prompt
+            prompt = data.get("prompt")
+            error = self._validate_prompt(prompt)
+            if error:
                 self._send_json_response(400, {
-                    "error": "Missing Content-Length header",
+                    "error": error,
                     "status": "error",
                 })
                 return
             
-            content_length = int(content_length)
-            if content_length > 1024 * 100:  # 100KB limit
-                self._send_json_response(413, {
-                    "error": "Payload too large (max 100KB)",
-                    "status": "error",
-                })
+            if stream or data.get("stream") is True:
+                self._stream_chat(prompt, data.get("context"))
                 return
             
-            body = self.rfile.read(content_length)
+            # Generate response (with fallback), served from cache when possible
+            response = self._cached_ai_response(prompt, data.get("context"))
+            self._log_fields["prompt"] = prompt[:50]
+            self._log_fields["cache"] = response.get("cache")
+            self._send_json_response(200, response)
+        
+        except Exception as err:
+            print(f"[BrainServer::_handle_chat] CRITICAL ERROR: {err}")
+            traceback.print_exc()
+            self._log_fields["error"] = str(err)[:200]
+            if self._streaming:
+                # SSE headers are already out - a JSON response would be a second status line
+                self._abort_event_stream(err)
+                return
+            # Even on exception, send properly-formatted JSON response
+            self._send_json_response(500, {
+                "response": "ARIA: Critical system error. Retrying connection...",
+                "status": "error",
+                "error": str(err)[:100],
+            })
+    
+    def _stream_chat(self, prompt: str, context: Any = None):
+        """Write one chat reply as SSE over chunked transfer - first word goes out as soon as it exists."""
+        self._log_fields["prompt"] = prompt[:50]
+        self._log_fields["stream"] = True
+        self._start_event_stream()
+        
+        tokens = self._stream_ai_response(prompt, context)
+        try:
+            while True:
+                try:
+                    text = next(tokens)
+                except StopIteration as done:
+                    final = done.value
+                    break
+                if "first_token_ms" not in self._log_fields:
+                    self._log_fields["first_token_ms"] = round((time.perf_counter() - self._started) * 1000, 2)
+                self._send_event("token", {"text": text})
             
-            # Parse JSON
-            try:
-                data = json.loads(body.decode('utf-8'))
-            except json.JSONDecodeError as err:
-                self._send_json_response(400, {
-                    "error": f"Invalid JSON: {str(err)}",
-                    "status": "error",
-                })
+            self._log_fields["cache"] = final.get("cache")
+            self._send_event("done", final)
+        
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-reply - nothing left to tell it
+            self._log_fields["error"] = "client disconnected"
+            self.close_connection = True
+            tokens.close()
+            return
+        
+        except Exception as err:
+            print(f"[BrainServer::_stream_chat] CRITICAL ERROR: {err}")
+            traceback.print_exc()
+            self._log_fields["error"] = str(err)[:200]
+            tokens.close()
+            self._abort_event_stream(err)
+            return
+        
+        self._end_event_stream()
+    
+    def _start_event_stream(self):
+        """Headers for a chunked text/event-stream response (no Content-Length)."""
+        self._streaming = True  # From here on, errors must end the stream, not send a new response
+        self.send_response(200)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        if getattr(self.server, "draining", False) or not getattr(self.server, "keep_alive", False):
+            self.close_connection = True
+        self.send_header("Connection", "close" if self.close_connection else "keep-alive")
+        self.end_headers()
+    
+    def _send_event(self, event: str, data: Dict[str, Any]):
+        """One SSE frame as one HTTP chunk, flushed immediately."""
+        frame = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+        self.wfile.flush()
+    
+    def _end_event_stream(self):
+        try:
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except OSError:
+            self.close_connection = True
+    
+    def _abort_event_stream(self, err: Exception):
+        """Finish a failed stream with the fallback reply as its final "done" frame."""
+        try:
+            self._send_event("done", dict(FALLBACK_RESPONSES["chat"], error=str(err)[:100]))
+        except OSError:
+            self.close_connection = True
+            return
+        self._end_event_stream()
+    
+    def _handle_chat_batch(self):
+        """
+        POST /chat/batch → Many prompts, one round trip.
+        
+        Body: {"prompts": [{"id": "npc_1", "prompt": "...", "context": {...}?}, ...]}
+        Reply: {"status": "ok", "results": [...]} in request order, one entry per
+        prompt, each with its "id". Identical prompts (same cache key) are generated
+        once; distinct ones run concurrently, up to BATCH_CONCURRENCY at a time.
+        A bad item gets {"status": "error", "error": ...} without failing the batch.
+        """
+        try:
+            data = self._read_json_body(CONFIG["AI"]["MAX_BATCH_BODY_BYTES"])
+            if data is None:
                 return
             
-            # Validate prompt
-            prompt = data.get("prompt")
-            if not prompt or not isinstance(prompt, str):
+            items = data.get("prompts")
+            if not isinstance(items, list):
                 self._send_json_response(400, {
-                    "error": "Missing or invalid 'prompt' field",
+                    "error": "Missing or invalid 'prompts' array",
                     "status": "error",
                 })
                 return
             
-            if len(prompt) > CONFIG["AI"]["MAX_PROMPT_LENGTH"]:
-                self._send_json_response(400, {
-                    "error": f"Prompt exceeds {CONFIG['AI']['MAX_PROMPT_LENGTH']} characters",
+            if len(items) > CONFIG["AI"]["MAX_BATCH_SIZE"]:
+                self._send_json_response(413, {
+                    "error": f"Batch exceeds {CONFIG['AI']['MAX_BATCH_SIZE']} prompts",
                     "status": "error",
                 })
                 return
             
-            # Generate response (with fallback)
-            response = self._generate_ai_response(prompt)
-            self._send_json_response(200, response)
-            print(f"[BrainServer::Chat] POST /chat → 200 OK (JSON + CORS enforced) | Prompt: {prompt[:50]}...")
+            results = [None] * len(items)
+            unique = OrderedDict()  # cache key → (prompt, context, [result indexes])
+            
+            for index, item in enumerate(items):
+                item_id = item.get("id", index) if isinstance(item, dict) else index
+                prompt = item.get("prompt") if isinstance(item, dict) else None
+                error = self._validate_prompt(prompt)
+                if error:
+                    results[index] = {"id": item_id, "status": "error", "error": error}
+                    continue
+                
+                context = item.get("context")
+                key = ResponseCache.make_key(prompt, context)
+                unique.setdefault(key, (prompt, context, []))[2].append(index)
+            
+            # Run each distinct prompt once, in the caller's trace context (copied here,
+            # on the request thread - a pool worker only has its own empty context)
+            futures = {
+                key: batch_executor.submit(contextvars.copy_context().run, self._cached_ai_response, prompt, context)
+                for key, (prompt, context, _) in unique.items()
+            }
+            
+            for key, (prompt, context, indexes) in unique.items():
+                try:
+                    response = futures[key].result()
+                except Exception as err:
+                    response = {"status": "error", "error": str(err)[:100]}
+                for n, index in enumerate(indexes):
+                    item = items[index]
+                    result = dict(response, id=item.get("id", index))
+                    if n > 0 and result.get("status") == "ok":
+                        result["cache"] = "dedup"
+                    results[index] = result
+            
+            self._log_fields["batch_size"] = len(items)
+            self._log_fields["batch_unique"] = len(unique)
+            self._send_json_response(200, {
+                "status": "ok",
+                "count": len(results),
+                "unique": len(unique),
+                "results": results,
+            })
         
         except Exception as err:
-            print(f"[BrainServer::_handle_chat] CRITICAL ERROR: {err}")
+            print(f"[BrainServer::_handle_chat_batch] CRITICAL ERROR: {err}")
             traceback.print_exc()
-            # Even on exception, send properly-formatted JSON response
+            self._log_fields["error"] = str(err)[:200]
             self._send_json_response(500, {
-                "response": "ARIA: Critical system error. Retrying connection...",
                 "status": "error",
                 "error": str(err)[:100],
             })
     
+    def _read_json_body(self, max_bytes: int) -> Optional[Dict[str, Any]]:
+        """Read and parse a JSON object body; on failure send the error response and return None."""
+        content_length = self.headers.get("Content-Length")
+        if not content_length:
+            self._send_json_response(400, {
+                "error": "Missing Content-Length header",
+                "status": "error",
+            })
+            return None
+        
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            content_length = -1
+        if content_length < 0:
+            # Body length unknown - this connection cannot be reused
+            self.close_connection = True
+            self._send_json_response(400, {
+                "error": "Invalid Content-Length header",
+                "status": "error",
+            })
+            return None
+        if content_length > max_bytes:
+            # Body is left unread - this connection cannot be reused
+            self.close_connection = True
+            self._send_json_response(413, {
+                "error": f"Payload too large (max {max_bytes // 1024}KB)",
+                "status": "error",
+            })
+            return None
+        
+        body = self.rfile.read(content_length)
+        
+        # Parse JSON
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except json.JSONDecodeError as err:
+            self._send_json_response(400, {
+                "error": f"Invalid JSON: {str(err)}",
+                "status": "error",
+            })
+            return None
+        
+        if not isinstance(data, dict):
+            self._send_json_response(400, {
+                "error": "JSON body must be an object",
+                "status": "error",
+            })
+            return None
+        
+        return data
+    
+    @staticmethod
+    def _validate_prompt(prompt: Any) -> Optional[str]:
+        """Error message for an unusable prompt, or None."""
+        if not prompt or not isinstance(prompt, str):
+            return "Missing or invalid 'prompt' field"
+        if len(prompt) > CONFIG["AI"]["MAX_PROMPT_LENGTH"]:
+            return f"Prompt exceeds {CONFIG['AI']['MAX_PROMPT_LENGTH']} characters"
+        return None
+    
+    def _cached_ai_response(self, prompt: str, context: Any = None) -> Dict[str, Any]:
+        """_generate_ai_response() behind the LRU+TTL chat cache; adds "cache": "hit"|"miss"."""
+        if not CONFIG["AI"]["CACHE"]["ENABLED"]:
+            return dict(self._generate_ai_response(prompt), cache="miss")
+        
+        key = ResponseCache.make_key(prompt, context)
+        cached = chat_cache.get(key)
+        if cached is not None:
+            return dict(cached, cache="hit")
+        
+        response = self._generate_ai_response(prompt)
+        if response.get("status") == "ok":
+            chat_cache.put(key, response)
+        return dict(response, cache="miss")
+    
+    def _stream_ai_response(self, prompt: str, context: Any = None):
+        """
+        Generator form of _cached_ai_response(): yields text pieces, returns the final response dict.
+        
+        A configured model streams through the LLM gateway. The fallback responder has its
+        whole reply at once, so it is split into words here; a cache hit goes out as one piece.
+        """
+        if CONFIG["AI"]["CACHE"]["ENABLED"]:
+            key = ResponseCache.make_key(prompt, context)
+            cached = chat_cache.get(key)
+            if cached is not None:
+                yield cached["response"]
+                return dict(cached, cache="hit")
+        
+        response = None
+        if CONFIG["AI"]["MODEL"] != "fallback":
+            pieces = []
+            try:
+                from llm_gateway import get_gateway
+                for text in get_gateway().stream(**self._llm_request(prompt)):
+                    pieces.append(text)
+                    yield text
+                response = {"response": "".join(pieces), "status": "ok", "confidence": 1.0}
+            except Exception as err:
+                if pieces:
+                    raise  # Part of the reply is already out - can't switch to the fallback
+                print(f"[BrainServer::_stream_ai_response] LLM unavailable, using fallback: {err}")
+        
+        if response is None:
+            response = self._fallback_response(prompt)
+            delay = CONFIG["AI"]["STREAM_TOKEN_DELAY"]
+            for n, token in enumerate(re.findall(r"\S+\s*", response.get("response", ""))):
+                if delay and n:
+                    time.sleep(delay)
+                yield token
+        
+        if CONFIG["AI"]["CACHE"]["ENABLED"] and response.get("status") == "ok":
+            chat_cache.put(key, response)
+        return dict(response, cache="miss")
+    
+    @staticmethod
+    def _llm_request(prompt: str) -> Dict[str, Any]:
+        """Gateway arguments for one ARIA reply."""
+        return {
+            "messages": [{"role": "user", "content": prompt}],
+            "lane": "interactive",
+            "model": CONFIG["AI"]["MODEL"],
+            "max_tokens": CONFIG["AI"]["MAX_TOKENS"],
+            "system": CONFIG["AI"]["SYSTEM_PROMPT"],
+            "purpose": "brain_chat",
+        }
+    
+    @traced("brain.generate_response")
     def _generate_ai_response(self, prompt: str) -> Dict[str, Any]:
         """Generate AI response with fallback."""
+        if CONFIG["AI"]["MODEL"] != "fallback":
+            try:
+                from llm_gateway import get_gateway
+                text = get_gateway().complete(**self._llm_request(prompt))
+                return {"response": text, "status": "ok", "confidence": 1.0}
+            except Exception as err:
+                print(f"[BrainServer::_generate_ai_response] LLM unavailable, using fallback: {err}")
+        
+        return self._fallback_response(prompt)
+    
+    def _fallback_response(self, prompt: str) -> Dict[str, Any]:
+        """Keyword-based ARIA replies - no model needed."""
         try:
-            # For now, use intelligent fallback responses based on prompt context.
-            # This can be extended with real LLM integration (OpenAI, local model, etc.)
-            
             prompt_lower = prompt.lower()
             
             # Simple keyword-based responses for flavor
@@ -323,7 +1300,7 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
                 }
         
         except Exception as err:
-            print(f"[BrainServer::_generate_ai_response] Error: {err}")
+            print(f"[BrainServer::_fallback_response] Error: {err}")
             return FALLBACK_RESPONSES["chat"]
 
 
@@ -331,35 +1308,172 @@ class BrainRequestHandler(BaseHTTPRequestHandler):
 # SERVER LIFECYCLE
 # ============================================================================
 class GracefulBrainServer(HTTPServer):
-    """HTTP Server for OMNI-OPS BRAIN."""
+    """HTTP Server for OMNI-OPS BRAIN (one request at a time)."""
+    
+    keep_alive = False
+    draining = False
     
     def server_bind(self):
         """Allow immediate reuse of socket."""
         import socket
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         super().server_bind()
+    
+    def drain(self, timeout: float = 0):
+        """Nothing in flight once serve_forever() has returned."""
+        return True
 
 
-def start_brain_server():
+class ThreadedBrainServer(ThreadingMixIn, GracefulBrainServer):
+    """
+    Concurrent OMNI-OPS BRAIN server.
+    
+    One thread per connection, HTTP/1.1 keep-alive, a hard cap on open
+    connections (extra connections get an immediate 503) and graceful drain:
+    on shutdown the listener stops accepting, in-flight requests finish and
+    idle keep-alive connections are closed.
+    """
+    
+    keep_alive = True
+    daemon_threads = True
+    block_on_close = False
+    
+    def __init__(self, server_address, handler_class, max_connections: int = None):
+        self.max_connections = max_connections or CONFIG["SERVER"]["MAX_CONNECTIONS"]
+        self.connection_slots = threading.BoundedSemaphore(self.max_connections)
+        self.active_connections = set()
+        self.busy_connections = set()
+        self.connections_lock = threading.Lock()
+        self.draining = False
+        super().__init__(server_address, handler_class)
+    
+    def process_request(self, request, client_address):
+        """Admit the connection if a slot is free, otherwise reject with 503."""
+        if self.draining or not self.connection_slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        with self.connections_lock:
+            self.active_connections.add(request)
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._release(request)
+            raise
+    
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._release(request)
+    
+    def _release(self, request):
+        with self.connections_lock:
+            if request not in self.active_connections:
+                return
+            self.active_connections.discard(request)
+        self.connection_slots.release()
+    
+    def _reject(self, request):
+        body = b'{"error": "Server busy", "status": "error"}'
+        try:
+            request.sendall(
+                b"HTTP/1.1 503 Service Unavailable\r\n"
+                b"Access-Control-Allow-Origin: *\r\n"
+                b"Content-Type: application/json; charset=utf-8\r\n"
+                b"Retry-After: 1\r\n"
+                b"Connection: close\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+    
+    def drain(self, timeout: float = None) -> bool:
+        """Wait for in-flight requests to finish; close idle keep-alives and stragglers."""
+        import socket
+        timeout = CONFIG["SERVER"]["DRAIN_TIMEOUT"] if timeout is None else timeout
+        self.draining = True
+        deadline = time.time() + timeout
+        
+        while time.time() < deadline:
+            with self.connections_lock:
+                if not self.active_connections:
+                    return True
+                idle = [r for r in self.active_connections if r not in self.busy_connections]
+            # Idle keep-alive connections are waiting on the next request line -
+            # end their read side so the handler thread exits right away
+            for request in idle:
+                try:
+                    request.shutdown(socket.SHUT_RD)
+                except OSError:
+                    pass
+            time.sleep(0.05)
+        
+        with self.connections_lock:
+            leftovers = list(self.active_connections)
+        for request in leftovers:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        return False
+
+
+def create_brain_server(host: str = None, port: int = None, mode: str = None):
+    """Build the brain server for the configured serving mode."""
+    host = host or CONFIG["SERVER"]["HOST"]
+    port = CONFIG["SERVER"]["PORT"] if port is None else port
+    mode = mode or CONFIG["SERVER"]["MODE"]
+    
+    if mode == "threaded":
+        return ThreadedBrainServer((host, port), BrainRequestHandler)
+    if mode == "single":
+        return GracefulBrainServer((host, port), BrainRequestHandler)
+    raise ValueError(f"Unknown server mode: {mode!r} (expected 'threaded' or 'single')")
+
+
+def start_brain_server(mode: str = None):
     """Start the OMNI-OPS Brain Server."""
     host = CONFIG["SERVER"]["HOST"]
     port = CONFIG["SERVER"]["PORT"]
+    mode = mode or os.environ.get("BRAIN_SERVER_MODE") or CONFIG["SERVER"]["MODE"]
+    
+    setup_tracing(service_name="omni-ops-brain")
     
     try:
-        server = GracefulBrainServer((host, port), BrainRequestHandler)
+        server = create_brain_server(host, port, mode)
         print("\n" + "="*70)
         print("✓ OMNI-OPS BRAIN ONLINE: Listening on Port 8080")
         print("="*70)
         print(f"  Host: {host}")
         print(f"  Port: {port}")
+        print(f"  Mode: {mode}" + (f" (max {server.max_connections} connections, HTTP/1.1 keep-alive)" if mode == "threaded" else ""))
         print(f"  Endpoints:")
         print(f"    GET  /health     → Check server status (HUD bar GREEN)")
         print(f"    POST /chat       → Send prompt, get AI response")
         print(f"    POST /chat       → (ARIA talks)")
+        print(f"    POST /chat/batch → Many prompts (NPC barks) in one request")
+        print(f"    POST /chat/stream → ARIA reply as Server-Sent Events, word by word")
         print("="*70 + "\n")
         
+        # SIGTERM drains like Ctrl+C instead of killing in-flight requests
+        def _on_sigterm(signum, frame):
+            raise KeyboardInterrupt
+        try:
+            signal.signal(signal.SIGTERM, _on_sigterm)
+        except ValueError:
+            pass  # Not on the main thread
+        
         # Serve until Ctrl+C
-        server.serve_forever()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n[BrainServer] Shutdown signal received. Draining connections...")
+            drained = server.drain()
+            server.server_close()
+            request_logger.close()
+            print("[BrainServer] " + ("All requests completed." if drained else "Drain timeout - closed remaining connections.") + " Goodbye.")
+            sys.exit(0)
     
     except OSError as err:
         print(f"\n[FATAL] Could not start server on {host}:{port}")
@@ -368,18 +1482,251 @@ def start_brain_server():
         print(f"  → Try: lsof -i :{port} (macOS/Linux) or netstat -ano | findstr :{port} (Windows)")
         sys.exit(1)
     
-    except KeyboardInterrupt:
-        print("\n[BrainServer] Shutdown signal received. Goodbye.")
-        sys.exit(0)
-    
     except Exception as err:
         print(f"\n[FATAL] Unexpected error: {err}")
         traceback.print_exc()
         sys.exit(1)
 
 
+# ============================================================================
+# OMNI AGENT — Coding assistant over the shared workspace index
+# ============================================================================
+class OmniAgent:
+    """
+    Workspace-aware coding assistant.
+    
+    codebase_context, get_file_content, scan_for_issues and search_code come from
+    shared, incrementally updated caches (workspace_index.py, codebase_scan.py,
+    trigram_search.py), so any number of agents in one process cost a single tree walk.
+    """
+    
+    _FUNCTION_PATTERN = re.compile(
+        r"^\s*(?:async\s+)?function\s*\*?\s*(\w+)"                   # function name(
+        r"|^\s*(?:(?:const|let|var)\s+)?(\w+)\s*[:=]\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>)"
+        r"|^\s*(?:async\s+)?def\s+(\w+)"                               # Python def
+        r"|^\s*class\s+(\w+)",
+        re.MULTILINE,
+    )
+    
+    def __init__(self, use_local: bool = True, workspace_path: str = None):
+        from workspace_index import get_workspace_index
+        self.use_local = use_local
+        self.workspace_path = os.path.abspath(workspace_path or os.getcwd())
+        self.index = get_workspace_index(self.workspace_path)
+        model = CONFIG["AGENT"]["MODEL"]
+        self.model = None if (model == "fallback" and not use_local) else model
+    
+    @property
+    def codebase_context(self) -> Dict[str, Any]:
+        """{"root", "version", "file_count", "total_lines", "total_bytes", "files": {path: meta}}"""
+        return self.index.context()
+    
+    @traced("agent.get_file_content")
+    def get_file_content(self, file_path: str) -> str:
+        return self.index.get_text(file_path)
+    
+    @traced("agent.scan_for_issues")
+    def scan_for_issues(self) -> Dict[str, List[Dict[str, Any]]]:
+        from codebase_scan import get_scanner
+        return get_scanner(self.workspace_path).scan()
+    
+    @property
+    def search_index(self):
+        from trigram_search import get_search_index
+        return get_search_index(self.workspace_path)
+    
+    @traced("agent.search_code")
+    def search_code(self, query: str, regex: bool = False, ignore_case: bool = False,
+                    limit: int = None) -> Dict[str, Any]:
+        """Literal or regex search over js/, ai/, scripts/, ai_context/, docs/ (trigram indexed)"""
+        return self.search_index.search(query, regex=regex, ignore_case=ignore_case, limit=limit)
+    
+    def _resolve(self, file_path: str) -> str:
+        """Workspace path for `file_path`, also accepting a unique file name ("omni-core-game.js")"""
+        rel = self.index.relpath(file_path)
+        files = self.index.files
+        if rel in files:
+            return rel
+        matches = [path for path in files if path.rsplit("/", 1)[-1] == file_path]
+        if len(matches) == 1:
+            return matches[0]
+        raise FileNotFoundError(f"Not in workspace: {file_path}"
+                                + (f" (ambiguous: {', '.join(sorted(matches)[:5])})" if matches else ""))
+    
+    def _ask(self, prompt: str, purpose: str) -> Optional[str]:
+        """Model reply through the gateway, or None in fallback mode / when the model is unavailable"""
+        if self.model == "fallback":
+            return None
+        try:
+            from llm_gateway import get_gateway
+            return get_gateway().complete(
+                [{"role": "user", "content": prompt}],
+                lane="background",
+                model=self.model,
+                max_tokens=CONFIG["AGENT"]["MAX_TOKENS"],
+                system=CONFIG["AGENT"]["SYSTEM_PROMPT"],
+                purpose=purpose,
+            )
+        except Exception as err:
+            print(f"[OmniAgent] LLM unavailable, using local analysis: {err}")
+            return None
+    
+    def _inspect(self, rel: str) -> Dict[str, Any]:
+        from codebase_scan import scan_text
+        text = self.get_file_content(rel)
+        functions = [next(name for name in match.groups() if name)
+                     for match in self._FUNCTION_PATTERN.finditer(text)]
+        issues = scan_text(rel, text)
+        return {"text": text, "meta": self.index.files.get(rel, {}), "functions": functions,
+                "issues": self._by_severity([issue for found in issues.values() for issue in found]),
+                "references": self._references(rel, functions)}
+    
+    def _references(self, rel: str, functions: List[str]) -> List[Dict[str, Any]]:
+        """Calls to the file's functions from other indexed files"""
+        references = []
+        # Longer names are more specific; "init" or "update" would match everywhere
+        names = sorted((name for name in dict.fromkeys(functions) if len(name) >= 4), key=len, reverse=True)
+        for name in names[:CONFIG["AGENT"]["REFERENCE_LOOKUPS"]]:
+            found = self.search_code(rf"\b{name}\s*\(", regex=True, limit=20)["matches"]
+            references += [dict(match, name=name) for match in found if match["file"] != rel][:3]
+        return references
+    
+    @staticmethod
+    def _by_severity(issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        rank = {"high": 0, "medium": 1, "low": 2}
+        return sorted(issues, key=lambda issue: (rank.get(issue["severity"], 3), issue["line"]))
+    
+    @traced("agent.analyze_code")
+    def analyze_code(self, file_path: str) -> str:
+        """Review of one file: model analysis when configured, else structure + issue report"""
+        rel = self._resolve(file_path)
+        with trace_span("agent.inspect", {"agent.file": rel}):
+            info = self._inspect(rel)
+        
+        limit = CONFIG["AGENT"]["MAX_FILE_CHARS"]
+        reply = self._ask(
+            f"Analyze {rel} for bugs, performance problems and risky patterns.\n"
+            f"Static checks already found: {self._issue_lines(info['issues'], 20) or 'nothing'}\n"
+            f"Called from other files:\n{self._snippet_lines(info['references']) or '  (none found)'}\n\n"
+            f"```\n{info['text'][:limit]}\n```" + ("\n(truncated)" if len(info["text"]) > limit else ""),
+            purpose="agent_analyze",
+        )
+        if reply:
+            return reply
+        
+        meta = info["meta"]
+        lines = [f"{rel}: {meta.get('lines', 0)} lines, {meta.get('size', 0)} bytes, "
+                 f"{len(info['functions'])} functions/classes"]
+        if info["functions"]:
+            shown = ", ".join(info["functions"][:15])
+            lines.append(f"Defines: {shown}" + (" ..." if len(info["functions"]) > 15 else ""))
+        if info["references"]:
+            lines.append("Called from other files:")
+            lines.append(self._snippet_lines(info["references"]))
+        if info["issues"]:
+            lines.append(f"Issues ({len(info['issues'])}):")
+            lines.append(self._issue_lines(info["issues"], 25))
+        else:
+            lines.append("No issues found by the static checks.")
+        return "\n".join(lines)
+    
+    @staticmethod
+    def _snippet_lines(matches: List[Dict[str, Any]]) -> str:
+        return "\n".join(f"  {match['file']}:{match['line']}: {match['text']}" for match in matches)
+    
+    @staticmethod
+    def _issue_lines(issues: List[Dict[str, Any]], limit: int) -> str:
+        return "\n".join(f"  - line {issue['line']} [{issue['severity']}] {issue['message']}"
+                         for issue in issues[:limit])
+    
+    @traced("agent.auto_improve_code")
+    def auto_improve_code(self, file_path: str) -> Dict[str, Any]:
+        """{"file", "issues", "analysis"} - improvement suggestions for one file"""
+        rel = self._resolve(file_path)
+        with trace_span("agent.inspect", {"agent.file": rel}):
+            info = self._inspect(rel)
+        
+        limit = CONFIG["AGENT"]["MAX_FILE_CHARS"]
+        reply = self._ask(
+            f"Suggest concrete improvements for {rel}, most valuable first, with code where useful.\n"
+            f"Static checks found: {self._issue_lines(info['issues'], 20) or 'nothing'}\n\n"
+            f"```\n{info['text'][:limit]}\n```",
+            purpose="agent_improve",
+        )
+        if not reply:
+            if info["issues"]:
+                reply = f"Suggested fixes for {rel}, highest severity first:\n" + self._issue_lines(info["issues"], 25)
+            else:
+                reply = f"{rel}: the static checks found nothing to fix."
+        return {"file": rel, "issues": info["issues"], "analysis": reply}
+    
+    def _relevant(self, query: str) -> List[tuple]:
+        """(path, matching lines) for the files most related to the query.
+        
+        Files are scored by the query words in their path and their content; a word
+        found in most indexed files says little, so content hits are weighted by rarity.
+        """
+        words = list(dict.fromkeys(re.findall(r"[a-z0-9_]{4,}", query.lower())))
+        files = self.index.files
+        scores, snippets = {}, {}
+        for path in files:
+            hits = sum(word in path.lower() for word in words)
+            if hits:
+                scores[path] = 3.0 * hits
+        with trace_span("agent.context_search", {"agent.words": len(words)}):
+            for word in words:
+                result = self.search_code(word, ignore_case=True, limit=200)
+                # Document frequency from the trigram candidates (every file that can contain
+                # the word), not from the match list, which stops at `limit`
+                holders = result["candidates"]
+                if not result["matches"] or holders > result["files"] / 2:
+                    continue
+                weight = 1.0 + (result["files"] / holders) ** 0.5
+                for match in result["matches"]:
+                    scores[match["file"]] = scores.get(match["file"], 0.0) + weight / 4
+                    found = snippets.setdefault(match["file"], [])
+                    if len(found) < CONFIG["AGENT"]["SNIPPETS_PER_FILE"] and match not in found:
+                        found.append(match)
+        ranked = sorted(scores, key=lambda path: (-scores[path], path))[:CONFIG["AGENT"]["CONTEXT_FILES"]]
+        return [(path, snippets.get(path, [])) for path in ranked]
+    
+    @traced("agent.process_query")
+    def process_query(self, query: str, include_context: bool = True) -> str:
+        """Answer a free-form question; include_context adds the relevant files and matching lines"""
+        context = self.codebase_context
+        listing = ""
+        if include_context or self.model == "fallback":
+            listing = "\n".join(f"  {path} ({context['files'][path]['lines']} lines)"
+                                + ("\n" + self._snippet_lines(found) if found else "")
+                                for path, found in self._relevant(query) if path in context['files'])
+        prompt = query
+        if include_context:
+            prompt = (f"Workspace: {context['file_count']} files, {context['total_lines']} lines.\n"
+                      + (f"Relevant files and matching lines:\n{listing}\n" if listing else "")
+                      + f"\nQuestion: {query}")
+        reply = self._ask(prompt, purpose="agent_query")
+        if reply:
+            return reply
+        
+        lines = [f"(Local mode: set OMNI_AGENT_MODEL to answer with a model.)",
+                 f"Workspace: {context['file_count']} files, {context['total_lines']} lines."]
+        if listing:
+            lines.append("Files related to your question:")
+            lines.append(listing)
+        else:
+            lines.append("No workspace files match your question; try `analyze <file>`.")
+        return "\n".join(lines)
+
+
 # ============================================================================
 # ENTRY POINT
 # ============================================================================
 if __name__ == "__main__":
-    start_brain_server()
+    if len(sys.argv) > 1 and sys.argv[1] == "--trace-summary":
+        # python agent_with_tracing.py --trace-summary [trace_file]
+        rows = summarize_traces(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"{'SPAN':<50} {'COUNT':>7} {'TOTAL ms':>11} {'SELF ms':>11} {'MAX ms':>9}")
+        for row in rows:
+            print(f"{row['name'][:50]:<50} {row['count']:>7} {row['total_ms']:>11.1f} {row['self_ms']:>11.1f} {row['max_ms']:>9.1f}")
+    else:
+        start_brain_server()
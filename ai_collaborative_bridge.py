@@ -3,19 +3,81 @@ AI Collaborative Bridge
 Connects multiple AI agents for collaborative problem solving
 """
 
-from agent_with_tracing import OmniAgent, setup_tracing
-from flask import Flask, request, jsonify
+from agent_with_tracing import OmniAgent, setup_tracing, instrument_flask_app
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+import gzip
 import json
+import os
+import re
+import sys
 import threading
 import time
+import zlib
+from npc_behaviors import get_behaviors
+from npc_decision_memo import DecisionMemo
+from npc_shard_pool import ShardPool
+from npc_spatial_index import NPCWorld
+from npc_lod_scheduler import LODScheduler
+from npc_decision_stream import DecisionStream, StreamFull, HEARTBEAT
+from conversation_store import ConversationStore
+from codebase_scan import get_scanner
+from trigram_search import get_search_index
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for browser access
+instrument_flask_app(app)
 
 # Global agent instance
 agent = None
-conversation_history = []
+# Persistent /query history (conversation_store.py), opened on first use
+history_store = None
+history_store_lock = threading.Lock()
+
+def get_history_store():
+    """Open the conversation history store on first use"""
+    global history_store
+    with history_store_lock:
+        if history_store is None:
+            history_store = ConversationStore()
+        return history_store
+
+# Compiled NPC behavior rules (npc_behaviors.json, hot-reloaded)
+behaviors = get_behaviors()
+
+# Server-side NPC/player positions for proximity + threat (see /world/update)
+world = NPCWorld()
+# Which NPCs get a decision each tick, by distance tier under a global budget (see /world/tick)
+lod_scheduler = LODScheduler()
+# Changed decisions pushed to /npc-stream subscribers
+decision_stream = DecisionStream()
+# Winning rule per NPC situation, so /npc-decisions only evaluates situations it hasn't seen
+decision_memo = DecisionMemo()
+# Worker processes for large /world/update and /world/tick requests (in-process below MIN_NPCS)
+shard_pool = ShardPool()
+
+# Upper bound on NPCs per /npc-decisions request
+MAX_NPC_BATCH = 5000
+# /workspace paging: files per page by default / at most, and the smallest body worth gzipping
+WORKSPACE_PAGE_SIZE = 100
+WORKSPACE_MAX_PAGE = 1000
+GZIP_MIN_BYTES = 1024
+# Top-level codebase_context keys /workspace may return (never the absolute root path)
+WORKSPACE_SUMMARY_FIELDS = ('version', 'file_count', 'total_lines', 'total_bytes')
+
+def process_stats():
+    """Resident memory of this process (sampled by npc_load_benchmark.py)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return {"rss_bytes": int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')}
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource  # Not on Windows
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"max_rss_bytes": peak if sys.platform == 'darwin' else peak * 1024}
+    except (ImportError, OSError):
+        return None
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -23,7 +85,12 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "service": "AI Collaborative Bridge",
-        "agent_ready": agent is not None
+        "agent_ready": agent is not None,
+        "workspace": agent.index.report() if agent is not None else None,
+        "behaviors": behaviors.report(),
+        "decision_memo": decision_memo.report(),
+        "history": history_store.report() if history_store is not None else None,
+        "process": process_stats()
     })
 
 @app.route('/query', methods=['POST'])
@@ -41,16 +108,12 @@ def process_query():
         response = agent.process_query(query, include_context=include_context)
         
         # Store in history
-        conversation_history.append({
+        get_history_store().append({
             "timestamp": time.time(),
             "query": query,
             "response": response
         })
         
-        # Keep only last 100 messages
-        if len(conversation_history) > 100:
-            conversation_history.pop(0)
-        
         return jsonify({
             "status": "success",
             "query": query,
@@ -84,9 +147,10 @@ def analyze_file():
 
 @app.route('/scan', methods=['GET'])
 def scan_issues():
-    """Scan codebase for issues"""
+    """Scan codebase for issues (incremental - only changed files are rescanned)"""
     try:
-        issues = agent.scan_for_issues()
+        scanner = get_scanner()
+        issues = scanner.scan()
         
         return jsonify({
             "status": "success",
@@ -96,12 +160,38 @@ def scan_issues():
                 "bugs": len(issues['bugs']),
                 "security": len(issues['security']),
                 "code_quality": len(issues['code_quality'])
-            }
+            },
+            "scan": scanner.report()
         })
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/search', methods=['GET'])
+def search_code():
+    """Search js/, ai/, scripts/, ai_context/ and docs/ through the trigram index
+
+    Query params: q (required), regex=1, i=1 (ignore case), path (prefix), limit
+    """
+    try:
+        query = request.args.get('q', '')
+        if not query:
+            return jsonify({"error": "No query provided"}), 400
+        flag = lambda name: request.args.get(name, '').lower() in ('1', 'true', 'yes')
+        result = get_search_index().search(
+            query,
+            regex=flag('regex'),
+            ignore_case=flag('i'),
+            limit=request.args.get('limit', type=int),
+            path=request.args.get('path')
+        )
+        return jsonify({"status": "success", "query": query, **result})
+    
+    except re.error as e:
+        return jsonify({"error": f"Invalid regex: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/improve', methods=['POST'])
 def suggest_improvements():
     """Get improvement suggestions for a file"""
@@ -122,26 +212,100 @@ def suggest_improvements():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def json_response(payload, etag=None):
+    """JSON response with a weak ETag (hash of the body when none is given),
+    If-None-Match -> 304, and gzip when the client accepts it"""
+    body = app.json.dumps(payload).encode('utf-8')
+    if etag is None:
+        etag = format(zlib.crc32(body), '08x')
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+        if len(body) >= GZIP_MIN_BYTES and request.accept_encodings['gzip']:
+            response.set_data(gzip.compress(body, compresslevel=5))
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/workspace', methods=['GET'])
 def get_workspace_info():
-    """Get workspace information"""
+    """Get workspace information
+
+    Query params:
+        summary=1       counts only (WORKSPACE_SUMMARY_FIELDS, no file entries)
+        offset, limit   page of files, sorted by path (default 0, WORKSPACE_PAGE_SIZE)
+        fields=a,b      keep only these keys in each file entry
+    The ETag follows the workspace index version, so an unchanged index answers 304.
+    """
     try:
-        return jsonify({
-            "status": "success",
-            "workspace": agent.codebase_context
-        })
+        context = agent.codebase_context
+        version = context.get('version')
+        etag = None
+        if version is not None:
+            etag = f"{version}-{zlib.crc32(request.query_string):08x}"
+            if request.if_none_match.contains_weak(etag):
+                return json_response(None, etag)
+        
+        files = context.get('files', {})
+        workspace = {key: context[key] for key in WORKSPACE_SUMMARY_FIELDS if key in context}
+        workspace.setdefault('file_count', len(files))
+        payload = {"status": "success", "workspace": workspace}
+        
+        if request.args.get('summary', '').lower() not in ('', '0', 'false'):
+            return json_response(payload, etag)
+        
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', WORKSPACE_PAGE_SIZE, type=int)
+        if offset < 0 or limit < 1:
+            return jsonify({"error": "offset must be >= 0 and limit >= 1"}), 400
+        limit = min(limit, WORKSPACE_MAX_PAGE)
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+        
+        paths = sorted(files)[offset:offset + limit]
+        if fields:
+            page = {path: {f: files[path][f] for f in fields if f in files[path]} for path in paths}
+        else:
+            page = {path: files[path] for path in paths}
+        workspace['files'] = page
+        payload["page"] = {
+            "offset": offset,
+            "limit": limit,
+            "total": len(files),
+            "next_offset": offset + limit if offset + limit < len(files) else None
+        }
+        return json_response(payload, etag)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/history', methods=['GET'])
 def get_history():
-    """Get conversation history"""
-    limit = request.args.get('limit', 20, type=int)
-    return jsonify({
-        "status": "success",
-        "history": conversation_history[-limit:]
-    })
+    """Get conversation history
+
+    Query params: limit (default 20), q (keywords, all must match),
+    since / until (unix seconds), cursor (next_cursor from the previous page).
+    Returns the newest matching entries, oldest first; pass next_cursor to page back.
+    """
+    try:
+        page = get_history_store().query(
+            since=request.args.get('since', type=float),
+            until=request.args.get('until', type=float),
+            keyword=request.args.get('q'),
+            cursor=request.args.get('cursor', type=int),
+            limit=request.args.get('limit', 20, type=int)
+        )
+        return jsonify({
+            "status": "success",
+            "count": len(page["entries"]),
+            "history": page["entries"],
+            "next_cursor": page["next_cursor"]
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/npc-decision', methods=['POST'])
 def npc_decision():
@@ -162,86 +326,215 @@ def npc_decision():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def generate_npc_decision(state, context):
-    """Generate intelligent NPC decision based on state and context"""
-    npc_type = state.get('type', 'CITIZEN')
-    health = state.get('health', 100)
-    threat_level = context.get('threat_level', 0)
-    nearby_players = context.get('nearby_players', [])
-    time_of_day = context.get('time_of_day', 12)
+def _attach_decisions(response, decisions, changed, data):
+    """Full decisions in the response, unless the caller reads them from /npc-stream"""
+    if isinstance(data, dict) and data.get('stream'):
+        response["changed"] = changed
+    else:
+        response["decisions"] = decisions
+
+@app.route('/npc-decisions', methods=['POST'])
+def npc_decisions():
+    """Batched NPC decisions - one request for a whole crowd
+
+    Body: [{"id": ..., "state": {...}, "context": {...}}, ...]
+          (or {"npcs": [...]})
+    Situations seen before are answered from the decision memo
+    (npc_decision_memo.py); the rest are decided as one batch by the
+    vectorized rules (npc_decision_engine.py).
+    Returns decisions keyed by id; NPCs whose input is malformed are
+    reported under "errors" instead of failing the batch. With
+    {"npcs": [...], "stream": true} decisions are only pushed to /npc-stream
+    (when changed) and the response just counts them.
+    """
+    try:
+        data = request.get_json(silent=True)
+        npcs = data.get('npcs') if isinstance(data, dict) else data
+        
+        if not isinstance(npcs, list):
+            return jsonify({"error": "Expected an array of {id, state, context}"}), 400
+        
+        if len(npcs) > MAX_NPC_BATCH:
+            return jsonify({"error": f"Too many NPCs in one request (max {MAX_NPC_BATCH})"}), 413
+        
+        ids, pairs, errors = [], [], {}
+        for index, item in enumerate(npcs):
+            if not isinstance(item, dict):
+                errors[str(index)] = "Expected {id, state, context}"
+                continue
+            ids.append(str(item.get('id', index)))
+            pairs.append((item.get('state') or {}, item.get('context') or {}))
+        decisions, bad = decision_memo.decide_many(pairs, ids)
+        errors.update(bad)
+        
+        changed = decision_stream.publish(decisions)
+        response = {
+            "status": "success",
+            "count": len(decisions)
+        }
+        _attach_decisions(response, decisions, changed, data)
+        if errors:
+            response["errors"] = errors
+        return jsonify(response)
     
-    decision = {
-        "action": "IDLE",
-        "target": None,
-        "priority": 0,
-        "reasoning": ""
-    }
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def _apply_world_update(data):
+    """Shared by /world/update and /world/tick - removed NPCs also leave the LOD schedule"""
+    removed = data.get('removed', [])
+    summary = world.update(
+        npcs=data.get('npcs', []),
+        players=data.get('players', []),
+        removed=removed,
+        removed_players=data.get('removed_players', [])
+    )
+    lod_scheduler.remove(removed)
+    return summary
+
+def _json_response(response):
+    """jsonify(response), except bytes values are JSON the shard pool already encoded - spliced in as is"""
+    encoded = {key: value for key, value in response.items() if isinstance(value, bytes)}
+    head = json.dumps({key: value for key, value in response.items() if key not in encoded}, separators=(',', ':'))
+    parts = [head[:-1].encode()]
+    parts += [b',' + json.dumps(key).encode() + b':' + value for key, value in encoded.items()]
+    return Response(b''.join(parts) + b'}', mimetype='application/json')
+
+@app.route('/world/update', methods=['POST'])
+def world_update():
+    """Raw positions in, proximity/threat (and decisions) for every NPC out
+
+    Body: {"npcs": [{"id", "position", "faction"?, "health"?, "state"?, "type"?}],
+           "players": [{"id", "position", "health"?}],
+           "removed": [npc ids], "removed_players": [player ids],
+           "time_of_day": 14, "decide": true, "ids": [only these NPCs]?,
+           "stream": false}
+    Only the entities and fields sent are changed; the rest keep their last values.
+    Decisions are also published to /npc-stream; "stream": true leaves them out
+    of the response. Large requests are split across the shard pool's worker
+    processes (npc_shard_pool.py).
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        
+        summary = _apply_world_update(data)
+        decide = data.get('decide', True)
+        result = shard_pool.decide_world(world, data.get('ids'), data.get('time_of_day', 12), decide)
+        
+        response = {
+            "status": "success",
+            "world": summary,
+            "contexts": result['contexts']
+        }
+        
+        if decide:
+            decisions = {str(npc_id): decision for npc_id, decision in result['decisions'].items()}
+            changed = decision_stream.publish(decisions, data.get('removed', []))
+            _attach_decisions(response, result['decisions_json'], changed, data)
+            if result['errors']:
+                response["errors"] = {str(npc_id): error for npc_id, error in result['errors'].items()}
+        
+        return _json_response(response)
     
-    # Threat assessment
-    if threat_level > 70 or health < 30:
-        decision["action"] = "FLEE"
-        decision["priority"] = 10
-        decision["reasoning"] = "High threat or low health - retreating to safety"
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad world update: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/world/tick', methods=['POST'])
+def world_tick():
+    """One scheduler tick: decisions only for the NPCs whose LOD tier says they are due
+
+    Body: same as /world/update (all fields optional) plus "time_of_day".
+    Returns the tick's worklist with decisions + contexts, how many due NPCs
+    were deferred by the budget, and the next update time (server epoch
+    seconds) for the NPCs whose schedule changed this tick: the worklist,
+    new NPCs and NPCs promoted to a faster tier. Clients keep the last value
+    for everyone else. Decisions are published to /npc-stream too.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a JSON object"}), 400
+        
+        summary = _apply_world_update(data)
+        now = time.time()
+        rescheduled = lod_scheduler.assign(world.nearest_player_distances(), now)
+        work = lod_scheduler.tick(now)
+        
+        result = shard_pool.decide_world(world, work['worklist'], data.get('time_of_day', 12))
+        threat = result['threat']
+        decisions = {}
+        for npc_id, decision in result['decisions'].items():
+            lod_scheduler.record_decision(npc_id, decision, threat[npc_id], now)
+            decisions[str(npc_id)] = decision
+        
+        changed = decision_stream.publish(decisions, data.get('removed', []))
+        response = {
+            "status": "success",
+            "world": summary,
+            "time": now,
+            "worklist": [str(npc_id) for npc_id in work['worklist']],
+            "deferred": work['deferred'],
+            "contexts": result['contexts'],
+            "next_update": {str(npc_id): t for npc_id, t in
+                            lod_scheduler.next_updates(set(rescheduled).union(work['worklist'])).items()}
+        }
+        _attach_decisions(response, result['decisions_json'], changed, data)
+        if result['errors']:
+            response["errors"] = {str(npc_id): error for npc_id, error in result['errors'].items()}
+        return _json_response(response)
     
-    elif threat_level > 40 and npc_type in ["GUARD", "RAIDER"]:
-        decision["action"] = "COMBAT"
-        decision["priority"] = 8
-        decision["target"] = nearby_players[0] if nearby_players else None
-        decision["reasoning"] = "Combat-trained NPC engaging threat"
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Bad world update: {e}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/npc-stream', methods=['GET'])
+def npc_stream():
+    """Server-sent events: NPC decisions, only when action/target/priority change
+
+    event: keyframe  data: {"seq", "decisions": {id: decision}}   (on connect + periodically)
+    event: delta     data: {"seq", "changed": {id: decision}, "removed": [ids]?}
+    A delta's seq is one more than the previous event's; on a gap, wait for the next keyframe.
+    """
+    try:
+        subscriber = decision_stream.subscribe()
+    except StreamFull as e:
+        return jsonify({"error": str(e)}), 503
     
-    # Social behavior for citizens
-    elif npc_type == "CITIZEN":
-        if 6 <= time_of_day <= 22:  # Daytime
-            if nearby_players and threat_level < 20:
-                decision["action"] = "APPROACH"
-                decision["priority"] = 5
-                decision["target"] = nearby_players[0]
-                decision["reasoning"] = "Friendly NPC approaching player during daytime"
+    def generate():
+        for event, payload in decision_stream.events(subscriber):
+            if event == HEARTBEAT:
+                yield ": keep-alive\n\n"
             else:
-                decision["action"] = "PATROL"
-                decision["priority"] = 3
-                decision["reasoning"] = "Daily routine - patrolling area"
-        else:  # Nighttime
-            decision["action"] = "SLEEP"
-            decision["priority"] = 2
-            decision["reasoning"] = "Nighttime rest"
-    
-    # Trader behavior
-    elif npc_type == "TRADER":
-        if nearby_players and threat_level < 30:
-            decision["action"] = "TRADE"
-            decision["priority"] = 7
-            decision["target"] = nearby_players[0]
-            decision["reasoning"] = "Trader engaging customer"
-        else:
-            decision["action"] = "IDLE"
-            decision["priority"] = 2
-            decision["reasoning"] = "Waiting for customers"
-    
-    # Guard behavior
-    elif npc_type == "GUARD":
-        if threat_level > 20:
-            decision["action"] = "ALERT"
-            decision["priority"] = 6
-            decision["reasoning"] = "Guard on alert - monitoring situation"
-        else:
-            decision["action"] = "PATROL"
-            decision["priority"] = 4
-            decision["reasoning"] = "Guard on routine patrol"
+                yield f"id: {payload['seq']}\nevent: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
     
-    # Raider behavior
-    elif npc_type == "RAIDER":
-        if nearby_players or threat_level > 0:
-            decision["action"] = "COMBAT"
-            decision["priority"] = 9
-            decision["target"] = nearby_players[0] if nearby_players else None
-            decision["reasoning"] = "Hostile raider engaging targets"
-        else:
-            decision["action"] = "PATROL"
-            decision["priority"] = 5
-            decision["reasoning"] = "Raider searching for targets"
-    
-    return decision
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/world', methods=['GET'])
+def world_status():
+    """Spatial index, LOD scheduler, decision stream and shard pool stats"""
+    return jsonify({
+        "status": "success",
+        "world": world.report(),
+        "lod": lod_scheduler.report(),
+        "stream": decision_stream.report(),
+        "shards": shard_pool.report()
+    })
+
+def generate_npc_decision(state, context):
+    """Generate intelligent NPC decision based on state and context
+
+    Rules live in npc_behaviors.json (shared with ExternalAIConnector) and are
+    compiled by npc_behaviors.py; edits to the file are picked up while running.
+    """
+    return behaviors.decide(state, context)
 
 def start_bridge():
     """Start the collaborative bridge server"""
@@ -258,16 +551,24 @@ def start_bridge():
     print("\nInitializing AI agent...")
     agent = OmniAgent(use_local=True)
     
+    # Worker processes for large world requests (none on a single core)
+    shard_pool.start()
+    
     print("\n" + "="*70)
     print("BRIDGE ACTIVE - Endpoints:")
     print("="*70)
     print("  POST /query - Process query")
     print("  POST /analyze - Analyze file")
     print("  GET  /scan - Scan for issues")
+    print("  GET  /search - Code search (q, regex, i, path, limit)")
     print("  POST /improve - Get improvements")
     print("  POST /npc-decision - AI NPC decisions")
-    print("  GET  /workspace - Workspace info")
-    print("  GET  /history - Conversation history")
+    print("  POST /npc-decisions - Batched NPC decisions (keyed by id)")
+    print("  POST /world/update - Positions in, proximity/threat/decisions out")
+    print("  POST /world/tick - LOD-scheduled decisions (worklist + next update per NPC)")
+    print("  GET  /npc-stream - SSE push of changed NPC decisions (+ keyframes)")
+    print("  GET  /workspace - Workspace info (summary, offset, limit, fields; gzip + ETag)")
+    print("  GET  /history - Conversation history (q, since, until, cursor)")
     print("  GET  /health - Health check")
     print("="*70)
     print("\n🌐 Server running on http://localhost:5000")
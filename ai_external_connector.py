@@ -3,7 +3,8 @@ AI External Connector
 Connects to external AI services (Claude, GPT, etc.) for enhanced capabilities
 """
 
-from agent_with_tracing import setup_tracing
+from agent_with_tracing import setup_tracing, traced
+from npc_behaviors import get_behaviors
 import os
 import json
 import time
@@ -37,6 +38,7 @@ class ExternalAIConnector:
         self.connected = True
         return True
     
+    @traced("connector.query")
     def query(self, prompt: str, context: Optional[Dict] = None) -> str:
         """Send query to AI service"""
         if not self.connected:
@@ -207,6 +209,7 @@ I'm ready to help with:
 
 What specific aspect would you like to explore?"""
     
+    @traced("connector.npc_decision")
     def get_npc_decision(self, npc_state: Dict, game_context: Dict) -> Dict:
         """Get AI-powered NPC decision"""
         prompt = f"""Given this NPC state and game context, what should the NPC do?
@@ -222,43 +225,21 @@ Provide decision as JSON with: action, priority, reasoning"""
         response = self.query(prompt, {"npc_state": npc_state, "game_context": game_context})
         
         # Parse or generate decision
+        decision = get_behaviors().decide(npc_state, game_context)
         return {
-            "action": self._determine_action(npc_state, game_context),
-            "priority": self._calculate_priority(npc_state, game_context),
+            "action": decision["action"],
+            "priority": decision["priority"],
             "reasoning": response[:200],  # Truncate for game use
             "full_analysis": response
         }
     
     def _determine_action(self, state: Dict, context: Dict) -> str:
-        """Determine best action based on state and context"""
-        health = state.get('health', 100)
-        threat = context.get('threat_level', 0)
-        npc_type = state.get('type', 'CITIZEN')
-        
-        if health < 30 or threat > 70:
-            return "FLEE"
-        elif threat > 40 and npc_type in ["GUARD", "RAIDER"]:
-            return "COMBAT"
-        elif context.get('player_nearby') and threat < 20:
-            return "APPROACH" if npc_type in ["TRADER", "CITIZEN"] else "PATROL"
-        else:
-            return "PATROL"
+        """Determine best action based on state and context (npc_behaviors.json)"""
+        return get_behaviors().decide(state, context)["action"]
     
     def _calculate_priority(self, state: Dict, context: Dict) -> int:
-        """Calculate decision priority (0-10)"""
-        health = state.get('health', 100)
-        threat = context.get('threat_level', 0)
-        
-        if health < 30:
-            return 10  # Survival is top priority
-        elif threat > 70:
-            return 9
-        elif threat > 40:
-            return 7
-        elif context.get('player_nearby'):
-            return 6
-        else:
-            return 3
+        """Calculate decision priority (0-10) (npc_behaviors.json)"""
+        return get_behaviors().decide(state, context)["priority"]
 
 def main():
     """Run external AI connector as service"""
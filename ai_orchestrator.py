@@ -32,6 +32,8 @@ from pathlib import Path
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
 from enum import Enum
+from agent_with_tracing import setup_tracing, trace_span
+from llm_gateway import get_gateway
 
 class WorkflowStage(Enum):
     IDLE = "idle"
@@ -81,7 +83,7 @@ class AIOrchestrator:
         self.vision_api = "http://127.0.0.1:8081"
         self.game_api = "http://127.0.0.1:8080"
         
-        # Anthropic for AI
+        # Model calls go through the shared gateway's background lane
         self.ai_model = "claude-3-5-sonnet-20241022"
         self.conversation_history = []
     
@@ -146,9 +148,6 @@ class AIOrchestrator:
     def analyze_requirement(self, requirement: str) -> str:
         """Ask Claude to analyze a feature requirement"""
         try:
-            from anthropic import Anthropic
-            client = Anthropic()
-            
             prompt = f"""
 You are an expert game developer AI. A new feature has been requested:
 
@@ -163,13 +162,13 @@ Analyze this requirement and provide:
 Be technical and specific.
 """
             
-            response = client.messages.create(
+            analysis = get_gateway().complete(
+                [{"role": "user", "content": prompt}],
+                lane="background",
                 model=self.ai_model,
                 max_tokens=500,
-                messages=[{"role": "user", "content": prompt}]
+                purpose="requirement_analysis",
             )
-            
-            analysis = response.content[0].text
             self.log("ANALYSIS", "✓ Requirement analyzed")
             return analysis
         
@@ -180,16 +179,16 @@ Be technical and specific.
     def generate_code(self, requirement: str, analysis: str) -> Optional[str]:
         """Ask Claude to generate implementation code"""
         try:
-            from anthropic import Anthropic
-            client = Anthropic()
-            
             # Get code context
             context_files = {}
             context_dir = self.workspace / 'ai_context'
-            if context_dir.exists():
-                for f in context_dir.glob('*.md'):
-                    with open(f, 'r') as fp:
-                        context_files[f.stem] = fp.read()[:500]
+            with trace_span("files.scan", {"files.root": str(context_dir)}) as span:
+                if context_dir.exists():
+                    for f in context_dir.glob('*.md'):
+                        with open(f, 'r') as fp:
+                            context_files[f.stem] = fp.read()[:500]
+                if span is not None:
+                    span.set_attribute("files.count", len(context_files))
             
             context_str = "\n\n".join([f"{k}:\n{v}" for k, v in context_files.items()])
             
@@ -213,13 +212,13 @@ Generate COMPLETE, WORKING code as a JavaScript module that:
 Format: Wrap code in ```javascript blocks
 """
             
-            response = client.messages.create(
+            code = get_gateway().complete(
+                [{"role": "user", "content": prompt}],
+                lane="background",
                 model=self.ai_model,
                 max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
+                purpose="code_generation",
             )
-            
-            code = response.content[0].text
             self.log("CODEGEN", "✓ Code generated")
             
             # Extract code from blocks
@@ -352,9 +351,6 @@ Format: Wrap code in ```javascript blocks
     def analyze_test_results(self, feature: str, results: Dict) -> str:
         """Ask Claude to analyze test results"""
         try:
-            from anthropic import Anthropic
-            client = Anthropic()
-            
             prompt = f"""
 A feature test just completed. Analyze the results:
 
@@ -366,13 +362,13 @@ ERRORS: {results['errors']}
 Did the feature work correctly? What issues (if any) need fixing?
 """
             
-            response = client.messages.create(
+            analysis = get_gateway().complete(
+                [{"role": "user", "content": prompt}],
+                lane="background",
                 model=self.ai_model,
                 max_tokens=300,
-                messages=[{"role": "user", "content": prompt}]
+                purpose="test_analysis",
             )
-            
-            analysis = response.content[0].text
             return analysis
         
         except Exception as e:
@@ -384,7 +380,12 @@ Did the feature work correctly? What issues (if any) need fixing?
     
     def execute_task(self, task_id: str, requirement: str):
         """Execute full AI development task"""
-        
+        with trace_span("orchestrator.task", {"task.id": task_id, "task.requirement": requirement[:200]}) as span:
+            self._execute_task(task_id, requirement)
+            if span is not None and task_id in self.tasks:
+                span.set_attribute("task.stage", self.tasks[task_id].stage.value)
+    
+    def _execute_task(self, task_id: str, requirement: str):
         self.log("WORKFLOW", f"Starting task: {task_id}")
         self.log("WORKFLOW", f"Requirement: {requirement}\n")
         
@@ -403,7 +404,8 @@ Did the feature work correctly? What issues (if any) need fixing?
         print("="*70)
         
         task.stage = WorkflowStage.ANALYZING
-        analysis = self.analyze_requirement(requirement)
+        with trace_span("orchestrator.step.analysis"):
+            analysis = self.analyze_requirement(requirement)
         if not analysis:
             task.stage = WorkflowStage.FAILED
             return
@@ -415,7 +417,8 @@ Did the feature work correctly? What issues (if any) need fixing?
         print("="*70)
         
         task.stage = WorkflowStage.CODING
-        code = self.generate_code(requirement, analysis)
+        with trace_span("orchestrator.step.codegen"):
+            code = self.generate_code(requirement, analysis)
         if not code:
             task.stage = WorkflowStage.FAILED
             return
@@ -430,7 +433,9 @@ Did the feature work correctly? What issues (if any) need fixing?
         print("="*70)
         
         target_file = "js/omni-core-game.js"
-        if not self.inject_code(code, target_file):
+        with trace_span("orchestrator.step.inject", {"file.path": target_file}):
+            injected = self.inject_code(code, target_file)
+        if not injected:
             task.stage = WorkflowStage.FAILED
             return
         
@@ -441,7 +446,9 @@ Did the feature work correctly? What issues (if any) need fixing?
         
         task.stage = WorkflowStage.TESTING
         
-        if not self.wait_for_game():
+        with trace_span("orchestrator.step.wait_for_game"):
+            game_ready = self.wait_for_game()
+        if not game_ready:
             task.stage = WorkflowStage.FAILED
             return
         
@@ -453,7 +460,8 @@ Did the feature work correctly? What issues (if any) need fixing?
             'check_health'
         ]
         
-        results = self.run_test_sequence(requirement, test_actions)
+        with trace_span("orchestrator.step.test", {"test.actions": len(test_actions)}):
+            results = self.run_test_sequence(requirement, test_actions)
         
         if results['success']:
             task.stage = WorkflowStage.COMPLETED
@@ -524,6 +532,7 @@ Did the feature work correctly? What issues (if any) need fixing?
 # ============================================================================
 
 def main():
+    setup_tracing(service_name="ai-orchestrator")
     orchestrator = AIOrchestrator()
     
     print("\n" + "="*70)
@@ -14,29 +14,40 @@ Components:
 """
 
 import os
+import re
 import sys
 import json
 import time
 import base64
+import hashlib
 import threading
 import subprocess
+from io import BytesIO
+from collections import OrderedDict
 from pathlib import Path
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from typing import Dict, List, Any
 import socket
+from ai_vision_recorder import SessionRecorder
+from agent_with_tracing import setup_tracing, instrument_flask_app, trace_span
+from llm_gateway import get_gateway
 
 # Configuration
 WORKSPACE_DIR = Path(__file__).parent
 PORT = 8081
 HOST = '127.0.0.1'
+RECORDINGS_DIR = Path(os.environ.get('VISION_RECORDINGS_DIR', WORKSPACE_DIR / 'recordings'))
+TEST_SEQUENCE_CACHE_FILE = WORKSPACE_DIR / 'ai_cache' / 'test_sequences.json'
 
 app = Flask(__name__)
 CORS(app)
+instrument_flask_app(app)
 
 # Global state
 ai_perception_state = {
     'last_frame': None,
+    'last_frame_id': 0,
     'last_frame_time': 0,
     'game_state': {},
     'player_position': [0, 0, 0],
@@ -46,9 +57,362 @@ ai_perception_state = {
     'feature_queue': []
 }
 
+# Guards last_frame / last_frame_id / last_frame_time / game_state as one snapshot
+frame_lock = threading.Lock()
+
 input_command_queue = []
 vision_data = {}
 
+# Adaptive capture tuning - the game asks for frames as fast as the server can use them
+CAPTURE_CONFIG = {
+    'MIN_INTERVAL_MS': 100,       # Fastest cadence (tests running / commands pending)
+    'DEFAULT_INTERVAL_MS': 500,   # Matches the legacy fixed CAPTURE_INTERVAL
+    'MAX_INTERVAL_MS': 4000,      # Slowest cadence when nothing is happening
+    'BACKLOG_INTERVAL_MS': 2000,  # Cadence while analysis is behind
+    'MAX_BACKLOG': 2,             # Pending analyses before we throttle capture
+    'SCENE_WINDOW': 8,            # Frames of scene-change history to average
+    'SCENE_ACTIVE': 0.25,         # Average score above which the scene counts as busy
+    'IDLE_BACKOFF': 1.5,          # Interval multiplier per quiet frame
+    'SCALES': [1.0, 0.75, 0.5, 0.25],  # Resolution tiers offered to the client
+}
+
+class CaptureRateController:
+    """Recommends the next capture interval/resolution from server load and scene activity"""
+    
+    def __init__(self, config: Dict = None):
+        self.config = config or CAPTURE_CONFIG
+        self.lock = threading.Lock()
+        self.pending_analyses = 0
+        self.scene_scores = []
+        self.interval_ms = self.config['DEFAULT_INTERVAL_MS']
+        self.last_info = None
+        self.last_frame_size = 0
+        self.last_frame_scale = None
+        self.scale = self.config['SCALES'][0]  # Last recommended scale
+    
+    def begin_analysis(self):
+        with self.lock:
+            self.pending_analyses += 1
+    
+    def end_analysis(self):
+        with self.lock:
+            self.pending_analyses = max(0, self.pending_analyses - 1)
+    
+    def score_scene_change(self, frame_b64: str, game_info: Dict, scale: float = 1.0) -> float:
+        """Cheap 0..1 estimate of how much changed since the previous frame (captured at `scale`)"""
+        player = game_info.get('player', {}) or {}
+        weapon = game_info.get('weapon', {}) or {}
+        prev = self.last_info
+        frame_size = len(frame_b64 or '')
+        
+        if prev is None:
+            score = 1.0
+        else:
+            prev_player = prev.get('player', {}) or {}
+            prev_weapon = prev.get('weapon', {}) or {}
+            
+            pos = player.get('position', [0, 0, 0])
+            prev_pos = prev_player.get('position', [0, 0, 0])
+            try:
+                moved = sum((a - b) ** 2 for a, b in zip(pos, prev_pos)) ** 0.5
+            except TypeError:
+                moved = 0.0
+            
+            health_delta = abs(player.get('health', 100) - prev_player.get('health', 100))
+            ammo_delta = abs(weapon.get('ammo', 0) - prev_weapon.get('ammo', 0))
+            
+            # Compressed frame size shifts noticeably when the picture changes. Only frames
+            # captured at the same scale compare - a resolution change we ordered is not a scene change
+            size_delta = 0.0
+            if self.last_frame_size and frame_size and scale == self.last_frame_scale:
+                size_delta = abs(frame_size - self.last_frame_size) / self.last_frame_size
+            
+            score = max(
+                min(moved / 2.0, 1.0),
+                min(health_delta / 20.0, 1.0),
+                min(ammo_delta / 5.0, 1.0),
+                min(size_delta * 5.0, 1.0)
+            )
+        
+        self.last_info = game_info
+        self.last_frame_size = frame_size
+        self.last_frame_scale = scale
+        return score
+    
+    def on_frame(self, frame_b64: str, game_info: Dict, queue_length: int, active_tests: int,
+                 capture_scale: float = None) -> Dict:
+        """Record a captured frame and return the recommended next capture settings
+
+        `capture_scale` is the resolution the frame was captured at; clients that don't send it
+        are assumed to have applied the previous recommendation.
+        """
+        cfg = self.config
+        with self.lock:
+            if capture_scale is None:
+                capture_scale = self.scale
+            score = self.score_scene_change(frame_b64, game_info, capture_scale)
+            self.scene_scores.append(score)
+            if len(self.scene_scores) > cfg['SCENE_WINDOW']:
+                self.scene_scores = self.scene_scores[-cfg['SCENE_WINDOW']:]
+            activity = sum(self.scene_scores) / len(self.scene_scores)
+            
+            if active_tests or queue_length:
+                # A test or command sequence is being observed - capture at full rate
+                interval, scale, reason = cfg['MIN_INTERVAL_MS'], cfg['SCALES'][0], 'testing'
+            elif self.pending_analyses >= cfg['MAX_BACKLOG']:
+                # Frames would only pile up behind the model - slow down
+                interval, scale, reason = cfg['BACKLOG_INTERVAL_MS'], cfg['SCALES'][2], 'backlog'
+            elif activity >= cfg['SCENE_ACTIVE']:
+                interval, scale, reason = cfg['DEFAULT_INTERVAL_MS'], cfg['SCALES'][1], 'active'
+            else:
+                interval = min(self.interval_ms * cfg['IDLE_BACKOFF'], cfg['MAX_INTERVAL_MS'])
+                interval = max(interval, cfg['DEFAULT_INTERVAL_MS'])
+                scale, reason = cfg['SCALES'][-1], 'idle'
+            
+            self.interval_ms = int(interval)
+            self.scale = scale
+            return {
+                'interval_ms': self.interval_ms,
+                'scale': scale,
+                'reason': reason,
+                'scene_change': round(score, 3),
+                'analysis_backlog': self.pending_analyses
+            }
+
+capture_controller = CaptureRateController()
+
+# Frame preprocessing - what actually gets sent to the model
+FRAME_PIPELINE_CONFIG = {
+    'TIERS': {                    # Longest edge in pixels (None = leave as captured)
+        'full': None,
+        'high': 1280,
+        'medium': 768,
+        'low': 384,
+    },
+    'ANALYSIS_TIER': 'medium',    # Tier used for the main view in analyze_game_state
+    'HUD_REGIONS': {              # Fractions of the frame: (left, top, right, bottom)
+        'health': (0.0, 0.85, 0.3, 1.0),
+        'ammo': (0.7, 0.85, 1.0, 1.0),
+    },
+    'ANALYSIS_REGIONS': ['health', 'ammo'],  # Crops attached alongside the main view
+    'FORMAT': 'JPEG',             # Re-encode format (JPEG or WEBP)
+    'QUALITY': 70,
+    'CACHE_FRAMES': 4,            # Frames whose encodes are kept for other consumers
+}
+
+class FramePreprocessor:
+    """Downscales, crops and re-encodes captured frames, caching one encode per frame/variant"""
+    
+    def __init__(self, config: Dict = None):
+        self.config = config or FRAME_PIPELINE_CONFIG
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # frame_id -> {'image': decoded, 'variants': {(tier, region): result}}
+        self.stats = {'hits': 0, 'misses': 0, 'encoded_bytes': 0, 'source_bytes': 0}
+    
+    def _frame_entry(self, frame_id: int) -> Dict:
+        entry = self.cache.get(frame_id)
+        if entry is None:
+            entry = {'image': None, 'variants': {}}
+            self.cache[frame_id] = entry
+            while len(self.cache) > self.config['CACHE_FRAMES']:
+                self.cache.popitem(last=False)
+        return entry
+    
+    def _decode(self, entry: Dict, frame_b64: str):
+        """Decode the captured PNG once per frame (None if Pillow is unavailable)"""
+        if entry['image'] is None:
+            try:
+                from PIL import Image
+            except ImportError:
+                return None
+            image = Image.open(BytesIO(base64.b64decode(frame_b64)))
+            entry['image'] = image.convert('RGB')
+        return entry['image']
+    
+    def _encode(self, image, tier: str, region: str) -> Dict:
+        cfg = self.config
+        
+        if region:
+            left, top, right, bottom = cfg['HUD_REGIONS'][region]
+            w, h = image.size
+            image = image.crop((int(left * w), int(top * h), int(right * w), int(bottom * h)))
+        
+        max_edge = cfg['TIERS'][tier]
+        if max_edge and max(image.size) > max_edge:
+            image = image.copy()
+            image.thumbnail((max_edge, max_edge))
+        
+        fmt = cfg['FORMAT'].upper()
+        buf = BytesIO()
+        image.save(buf, format=fmt, quality=cfg['QUALITY'])
+        encoded = buf.getvalue()
+        
+        return {
+            'data': base64.b64encode(encoded).decode('ascii'),
+            'media_type': f"image/{fmt.lower()}",
+            'width': image.size[0],
+            'height': image.size[1],
+            'bytes': len(encoded),
+        }
+    
+    def prepare(self, frame_id: int, frame_b64: str, tier: str = None, region: str = None) -> Dict:
+        """Return the frame (or a HUD region of it) at the given tier, encoding at most once"""
+        tier = tier or self.config['ANALYSIS_TIER']
+        if tier not in self.config['TIERS']:
+            raise ValueError(f"Unknown resolution tier: {tier}")
+        if region and region not in self.config['HUD_REGIONS']:
+            raise ValueError(f"Unknown HUD region: {region}")
+        
+        key = (tier, region)
+        with self.lock:
+            entry = self._frame_entry(frame_id)
+            cached = entry['variants'].get(key)
+            if cached is not None:
+                self.stats['hits'] += 1
+                return cached
+            self.stats['misses'] += 1
+            
+            image = self._decode(entry, frame_b64)
+            if image is None:
+                # No Pillow - only the untouched frame can be served
+                if region:
+                    return None
+                result = {
+                    'data': frame_b64,
+                    'media_type': 'image/png',
+                    'width': None,
+                    'height': None,
+                    'bytes': len(frame_b64) * 3 // 4,
+                }
+            else:
+                result = self._encode(image, tier, region)
+            
+            result.update({'frame_id': frame_id, 'tier': tier, 'region': region})
+            entry['variants'][key] = result
+            self.stats['encoded_bytes'] += result['bytes']
+            self.stats['source_bytes'] += len(frame_b64) * 3 // 4
+            return result
+    
+    def analysis_images(self, frame_id: int, frame_b64: str) -> List[Dict]:
+        """Main view plus configured HUD crops, ready for the model"""
+        images = [self.prepare(frame_id, frame_b64)]
+        for region in self.config['ANALYSIS_REGIONS']:
+            crop = self.prepare(frame_id, frame_b64, tier='full', region=region)
+            if crop is not None:
+                images.append(crop)
+        return images
+
+frame_preprocessor = FramePreprocessor()
+
+# Active session recorder (None when not recording)
+session_recorder = None
+
+# Generated test sequences must look like this before we queue them
+TEST_SEQUENCE_SCHEMA = {
+    'MAX_STEPS': 50,
+    # Every action executeAction() in js/ai-vision-control.js knows - anything else is a no-op there
+    'ACTIONS': (
+        'jump', 'sprint', 'crouch', 'stop_sprint', 'stop_crouch', 'shoot', 'reload',
+        'look_up', 'look_down', 'look_left', 'look_right', 'look_around',
+        'wait_1_second', 'wait_2_seconds', 'check_health',
+    ),
+}
+
+class TestSequenceError(ValueError):
+    """Model output could not be turned into a valid test sequence"""
+    pass
+
+def parse_test_sequence(text: str) -> List[str]:
+    """Extract and validate {"test_sequence": [...]} from a model response"""
+    match = re.search(r'\{.*\}', text or '', re.DOTALL)
+    if not match:
+        raise TestSequenceError("No JSON object in model response")
+    
+    try:
+        result = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise TestSequenceError(f"Invalid JSON in model response: {e}")
+    
+    sequence = result.get('test_sequence') if isinstance(result, dict) else None
+    return validate_test_sequence(sequence)
+
+def validate_test_sequence(sequence) -> List[str]:
+    """Raise TestSequenceError unless `sequence` is a usable list of command names"""
+    if not isinstance(sequence, list) or not sequence:
+        raise TestSequenceError("'test_sequence' must be a non-empty list")
+    if len(sequence) > TEST_SEQUENCE_SCHEMA['MAX_STEPS']:
+        raise TestSequenceError(f"'test_sequence' exceeds {TEST_SEQUENCE_SCHEMA['MAX_STEPS']} steps")
+    
+    for cmd in sequence:
+        if not isinstance(cmd, str) or cmd not in TEST_SEQUENCE_SCHEMA['ACTIONS']:
+            raise TestSequenceError(f"Unknown command in test_sequence: {cmd!r}")
+    
+    return sequence
+
+class TestSequenceCache:
+    """Persistent (feature name, SHA-256 of feature code) -> test sequence cache"""
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.stats = {'hits': 0, 'misses': 0}
+        self._load()
+    
+    @staticmethod
+    def make_key(feature_name: str, feature_code: str) -> str:
+        digest = hashlib.sha256((feature_code or '').encode('utf-8')).hexdigest()
+        return f"{feature_name}:{digest}"
+    
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"[TestSequenceCache] Ignoring unreadable cache {self.path}: {e}")
+            return
+        if not isinstance(entries, dict):
+            print(f"[TestSequenceCache] Ignoring malformed cache {self.path}: expected an object")
+            return
+        
+        # Drop anything that no longer passes validation
+        for key, entry in entries.items():
+            try:
+                validate_test_sequence(entry.get('test_sequence'))
+                self.entries[key] = entry
+            except (TestSequenceError, AttributeError):
+                continue
+    
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.path)
+    
+    def get(self, feature_name: str, feature_code: str) -> List[str]:
+        key = self.make_key(feature_name, feature_code)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            return list(entry['test_sequence'])
+    
+    def put(self, feature_name: str, feature_code: str, sequence: List[str], model: str):
+        key = self.make_key(feature_name, feature_code)
+        with self.lock:
+            self.entries[key] = {
+                'feature': feature_name,
+                'test_sequence': list(sequence),
+                'model': model,
+                'created': time.time(),
+            }
+            self._save()
+
 class AIBrainConnection:
     """Connection to Claude AI for vision/command processing"""
     
@@ -56,13 +420,11 @@ class AIBrainConnection:
         self.model = "claude-3-5-sonnet-20241022"
         self.api_key = os.environ.get('ANTHROPIC_API_KEY', '')
         self.conversation_history = []
+        self.test_sequence_cache = TestSequenceCache(TEST_SEQUENCE_CACHE_FILE)
     
-    def analyze_game_state(self, frame_b64: str, game_info: Dict) -> str:
+    def analyze_game_state(self, frame_b64: str, game_info: Dict, frame_id: int = None) -> str:
         """Ask Claude to analyze current game state"""
         try:
-            from anthropic import Anthropic
-            client = Anthropic()
-            
             # Build context message
             context = f"""
 You are an AI player in a 3D FPS game. Analyze this frame and current state:
@@ -86,21 +448,25 @@ Describe:
 Be concise and actionable.
 """
             
-            # Add image to message
+            # Add downscaled view (+ HUD crops) to message
+            if frame_id is None:
+                # Not from latest_frame(): key the preprocessor cache on the frame itself
+                frame_id = ('adhoc', hash(frame_b64))
             message_content = [
                 {
                     "type": "text",
                     "text": context
-                },
-                {
+                }
+            ]
+            for image in frame_preprocessor.analysis_images(frame_id, frame_b64):
+                message_content.append({
                     "type": "image",
                     "source": {
                         "type": "base64",
-                        "media_type": "image/png",
-                        "data": frame_b64
+                        "media_type": image['media_type'],
+                        "data": image['data']
                     }
-                }
-            ]
+                })
             
             # Store in history
             self.conversation_history.append({
@@ -109,14 +475,15 @@ Be concise and actionable.
             })
             
             # Get response with full history
-            response = client.messages.create(
+            analysis = get_gateway().complete(
+                self.conversation_history,
+                lane="vision",
                 model=self.model,
                 max_tokens=500,
-                messages=self.conversation_history
+                purpose="vision_analysis",
+                coalesce=False,  # History changes every call - nothing to share
             )
             
-            analysis = response.content[0].text
-            
             # Store response in history
             self.conversation_history.append({
                 "role": "assistant", 
@@ -132,13 +499,19 @@ Be concise and actionable.
         except Exception as e:
             return f"Vision analysis failed: {str(e)}"
     
-    def generate_test_sequence(self, feature_name: str, feature_code: str) -> List[str]:
-        """Ask Claude to generate test sequence for a feature"""
-        try:
-            from anthropic import Anthropic
-            client = Anthropic()
-            
-            prompt = f"""
+    def generate_test_sequence(self, feature_name: str, feature_code: str, refresh: bool = False) -> Dict:
+        """Ask Claude to generate test sequence for a feature (cached per feature name + code hash)
+        
+        Returns {"test_sequence": [...], "cached": bool}. Raises TestSequenceError
+        when the model response does not match the schema.
+        """
+        if not refresh:
+            cached = self.test_sequence_cache.get(feature_name, feature_code)
+            if cached is not None:
+                return {"test_sequence": cached, "cached": True}
+        
+        commands = "\n".join(f'- "{action}"' for action in TEST_SEQUENCE_SCHEMA['ACTIONS'])
+        prompt = f"""
 A new feature was just implemented in the game:
 
 FEATURE: {feature_name}
@@ -149,35 +522,23 @@ CODE:
 
 Generate a sequence of game actions to TEST this feature. Return as JSON array of commands.
 
-Examples:
-- "move_forward"
-- "jump"
-- "sprint"
-- "crouch"
-- "shoot"
-- "reload"
-- "look_around"
-- "wait_2_seconds"
-- "check_health"
+Use only these commands:
+{commands}
 
 Return: {{"test_sequence": ["command1", "command2", ...]}}
 """
-            
-            response = client.messages.create(
-                model=self.model,
-                max_tokens=300,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            try:
-                result = json.loads(response.content[0].text)
-                return result.get('test_sequence', [])
-            except:
-                return ["move_forward", "jump", "look_around"]
         
-        except Exception as e:
-            print(f"Test sequence generation failed: {e}")
-            return []
+        text = get_gateway().complete(
+            [{"role": "user", "content": prompt}],
+            lane="background",
+            model=self.model,
+            max_tokens=300,
+            purpose="test_sequence",
+        )
+        
+        sequence = parse_test_sequence(text)
+        self.test_sequence_cache.put(feature_name, feature_code, sequence, self.model)
+        return {"test_sequence": sequence, "cached": False}
 
 ai_brain = AIBrainConnection()
 
@@ -194,45 +555,150 @@ def capture_frame():
         game_info = data.get('game_info', {})
         
         # Store frame
-        ai_perception_state['last_frame'] = frame_b64
-        ai_perception_state['last_frame_time'] = time.time()
-        ai_perception_state['game_state'] = game_info
+        frame_time = time.time()
+        with frame_lock:
+            ai_perception_state['last_frame'] = frame_b64
+            ai_perception_state['last_frame_id'] += 1
+            ai_perception_state['last_frame_time'] = frame_time
+            ai_perception_state['game_state'] = game_info
+        
+        # Hand off to the recorder thread (replayed frames are not re-recorded)
+        recorder = session_recorder
+        if recorder is not None and not data.get('replay'):
+            with trace_span("queue.recorder.put", kind="producer"):
+                recorder.record(frame_b64, game_info, frame_time)
         
         # Update player info
         if 'player' in game_info:
             ai_perception_state['player_health'] = game_info['player'].get('health', 100)
             ai_perception_state['player_position'] = game_info['player'].get('position', [0,0,0])
         
+        active_tests = len([t for t in ai_perception_state['test_results'] if t['status'] == 'running'])
+        try:
+            capture_scale = float(data['scale']) if data.get('scale') is not None else None
+        except (TypeError, ValueError):
+            capture_scale = None
+        next_capture = capture_controller.on_frame(
+            frame_b64, game_info, len(input_command_queue), active_tests, capture_scale
+        )
+        
         return jsonify({
             "status": "frame_received",
-            "command_queue_size": len(input_command_queue)
+            "command_queue_size": len(input_command_queue),
+            "next_capture": next_capture
         })
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def latest_frame():
+    """(frame_b64, frame_id, game_state) of the newest capture, read together"""
+    with frame_lock:
+        return (ai_perception_state['last_frame'], ai_perception_state['last_frame_id'],
+                ai_perception_state['game_state'])
+
 @app.route('/api/vision/analyze', methods=['POST'])
 def analyze_frame():
     """Ask AI to analyze current game frame"""
     try:
-        if not ai_perception_state['last_frame']:
+        # Snapshot under the lock; encoding and the model call happen outside it
+        frame_b64, frame_id, game_state = latest_frame()
+        if not frame_b64:
             return jsonify({"error": "No frame captured yet"}), 400
         
-        # Get AI analysis
-        analysis = ai_brain.analyze_game_state(
-            ai_perception_state['last_frame'],
-            ai_perception_state['game_state']
-        )
+        # Get AI analysis (tracked so capture backs off while we are behind)
+        capture_controller.begin_analysis()
+        try:
+            analysis = ai_brain.analyze_game_state(frame_b64, game_state, frame_id)
+        finally:
+            capture_controller.end_analysis()
         
         return jsonify({
             "status": "analyzed",
             "analysis": analysis,
-            "game_state": ai_perception_state['game_state']
+            "game_state": game_state
+        })
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/vision/frame', methods=['GET'])
+def get_processed_frame():
+    """Latest frame at a resolution tier, optionally cropped to a HUD region"""
+    try:
+        frame_b64, frame_id, _ = latest_frame()
+        if not frame_b64:
+            return jsonify({"error": "No frame captured yet"}), 400
+        
+        tier = request.args.get('tier', FRAME_PIPELINE_CONFIG['ANALYSIS_TIER'])
+        region = request.args.get('region')
+        
+        try:
+            image = frame_preprocessor.prepare(frame_id, frame_b64, tier=tier, region=region)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if image is None:
+            return jsonify({"error": "Region crops require Pillow"}), 501
+        
+        return jsonify({
+            "status": "ok",
+            "frame_id": image['frame_id'],
+            "tier": image['tier'],
+            "region": image['region'],
+            "media_type": image['media_type'],
+            "width": image['width'],
+            "height": image['height'],
+            "bytes": image['bytes'],
+            "image": image['data']
         })
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/vision/recording/start', methods=['POST'])
+def start_recording():
+    """Start recording captured frames + game_info to disk"""
+    global session_recorder
+    try:
+        if session_recorder is not None:
+            return jsonify({"status": "already_recording", "recording": session_recorder.status()})
+        
+        data = request.get_json(silent=True) or {}
+        name = data.get('session') or f"session_{int(time.time())}"
+        session_recorder = SessionRecorder(RECORDINGS_DIR / name).start()
+        
+        return jsonify({"status": "recording", "recording": session_recorder.status()})
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/vision/recording/stop', methods=['POST'])
+def stop_recording():
+    """Stop recording and flush the session to disk"""
+    global session_recorder
+    try:
+        recorder = session_recorder
+        if recorder is None:
+            return jsonify({"status": "not_recording"})
+        
+        session_recorder = None
+        recorder.stop()
+        
+        return jsonify({"status": "stopped", "recording": recorder.status()})
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/vision/recording/status', methods=['GET'])
+def recording_status():
+    """Current recorder state"""
+    recorder = session_recorder
+    return jsonify({
+        "recording": recorder.status() if recorder else None,
+        "recordings_dir": str(RECORDINGS_DIR)
+    })
+
 # ============================================================================
 # INPUT CONTROL ENDPOINTS
 # ============================================================================
@@ -244,8 +710,9 @@ def queue_commands():
         data = request.json
         commands = data.get('commands', [])
         
-        for cmd in commands:
-            input_command_queue.append(cmd)
+        with trace_span("queue.commands.put", {"queue.items": len(commands)}, kind="producer"):
+            for cmd in commands:
+                input_command_queue.append(cmd)
         
         return jsonify({
             "status": "queued",
@@ -261,9 +728,12 @@ def get_next_commands():
     """Get queued commands (called by game client)"""
     try:
         # Return next batch of commands
-        batch = input_command_queue[:10]
-        if batch:
-            del input_command_queue[:10]
+        with trace_span("queue.commands.take", kind="consumer") as span:
+            batch = input_command_queue[:10]
+            if batch:
+                del input_command_queue[:10]
+            if span is not None:
+                span.set_attribute("queue.items", len(batch))
         
         return jsonify({
             "commands": batch,
@@ -281,11 +751,12 @@ def control_move():
         direction = data.get('direction', 'forward')  # forward, back, left, right
         duration = data.get('duration', 1.0)  # seconds
         
-        input_command_queue.append({
-            "type": "move",
-            "direction": direction,
-            "duration": duration
-        })
+        with trace_span("queue.commands.put", {"queue.items": 1}, kind="producer"):
+            input_command_queue.append({
+                "type": "move",
+                "direction": direction,
+                "duration": duration
+            })
         
         return jsonify({"status": "move_queued"})
     
@@ -303,16 +774,22 @@ def start_feature_test():
         data = request.json
         feature_name = data.get('feature_name', 'Unknown')
         feature_code = data.get('feature_code', '')
+        refresh = bool(data.get('refresh', False))
         
-        # Generate test sequence
-        test_sequence = ai_brain.generate_test_sequence(feature_name, feature_code)
+        # Generate test sequence (served from cache for unchanged features)
+        try:
+            generated = ai_brain.generate_test_sequence(feature_name, feature_code, refresh=refresh)
+        except TestSequenceError as e:
+            return jsonify({"error": f"Test sequence generation failed: {e}"}), 502
+        test_sequence = generated['test_sequence']
         
         # Queue commands
-        for cmd in test_sequence:
-            input_command_queue.append({
-                "type": "action",
-                "action": cmd
-            })
+        with trace_span("queue.commands.put", {"queue.items": len(test_sequence)}, kind="producer"):
+            for cmd in test_sequence:
+                input_command_queue.append({
+                    "type": "action",
+                    "action": cmd
+                })
         
         test_id = f"test_{int(time.time())}"
         ai_perception_state['test_results'].append({
@@ -326,7 +803,8 @@ def start_feature_test():
         return jsonify({
             "status": "test_started",
             "test_id": test_id,
-            "sequence_length": len(test_sequence)
+            "sequence_length": len(test_sequence),
+            "cached": generated['cached']
         })
     
     except Exception as e:
@@ -370,6 +848,11 @@ def status():
         "status": "active",
         "uptime": time.time(),
         "frame_rate": 30,
+        "capture_interval_ms": capture_controller.interval_ms,
+        "analysis_backlog": capture_controller.pending_analyses,
+        "frame_pipeline": frame_preprocessor.stats,
+        "test_sequence_cache": ai_brain.test_sequence_cache.stats,
+        "llm_gateway": get_gateway().stats(),
         "command_queue_size": len(input_command_queue),
         "player_health": ai_perception_state['player_health'],
         "player_position": ai_perception_state['player_position'],
@@ -405,12 +888,15 @@ def send_file(path):
 
 def start_server():
     """Start the vision control server"""
+    setup_tracing(service_name="ai-vision-control")
+    
     print(f"\n{'='*70}")
     print("AI VISION & CONTROL SYSTEM STARTING")
     print(f"{'='*70}")
     print(f"Server: http://{HOST}:{PORT}")
     print(f"Dashboard: http://{HOST}:{PORT}/vision-dashboard.html")
     print(f"API Status: http://{HOST}:{PORT}/api/status")
+    print(f"Recordings: {RECORDINGS_DIR}")
     print(f"{'='*70}\n")
     
     app.run(host=HOST, port=PORT, debug=False, threaded=True)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+AI VISION SESSION RECORDER
+============================
+Records frames + game_info received by /api/vision/capture to disk so
+perception and analysis can be benchmarked offline.
+
+Layout of a session directory:
+    index.jsonl        - one line per frame: seq, t, segment, offset, length
+    seg_00000.bin      - zlib-compressed records, appended back to back
+    seg_00001.bin      - new segment every SEGMENT_MAX_BYTES
+    session.json       - metadata (start time, frame count, drops)
+
+Opening a recorder on an existing session directory resumes it: sequence
+numbers and the current segment continue from the last index entry, and
+session.json keeps the original start time and running totals.
+
+Each record is zlib(struct('>I', meta_len) + meta_json + frame_png_bytes).
+The index makes any frame seekable by sequence number or timestamp, and the
+reader memory-maps segments so replay never loads a whole session into RAM.
+
+Usage:
+    python ai_vision_recorder.py info   recordings/session_1700000000
+    python ai_vision_recorder.py replay recordings/session_1700000000 --speed 4
+"""
+
+import os
+import json
+import mmap
+import time
+import zlib
+import base64
+import struct
+import bisect
+import queue
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator
+
+RECORDER_CONFIG = {
+    'SEGMENT_MAX_BYTES': 64 * 1024 * 1024,  # Roll over to a new segment file
+    'QUEUE_SIZE': 256,                      # Frames buffered before we start dropping
+    'COMPRESS_LEVEL': 3,                    # zlib level - fast, frames are mostly PNG
+    'FLUSH_EVERY': 32,                      # Records between index/segment flushes
+}
+
+INDEX_FILE = 'index.jsonl'
+META_FILE = 'session.json'
+HEADER = struct.Struct('>I')
+
+
+def _segment_name(number: int) -> str:
+    return f"seg_{number:05d}.bin"
+
+
+def encode_record(frame_b64: str, game_info: Dict, timestamp: float, level: int = 3) -> bytes:
+    """Pack one capture into a compressed record"""
+    meta = json.dumps({'t': timestamp, 'game_info': game_info}, separators=(',', ':')).encode('utf-8')
+    frame = base64.b64decode(frame_b64) if frame_b64 else b''
+    return zlib.compress(HEADER.pack(len(meta)) + meta + frame, level)
+
+
+def decode_record(blob) -> Dict:
+    """Unpack a compressed record back into the capture payload"""
+    raw = zlib.decompress(blob)
+    (meta_len,) = HEADER.unpack_from(raw, 0)
+    meta = json.loads(raw[HEADER.size:HEADER.size + meta_len].decode('utf-8'))
+    frame = raw[HEADER.size + meta_len:]
+    return {
+        'timestamp': meta['t'],
+        'game_info': meta['game_info'],
+        'frame': base64.b64encode(frame).decode('ascii'),
+    }
+
+
+class SessionRecorder:
+    """Writes captures to segment files from a background thread (one start/stop per instance)"""
+
+    def __init__(self, session_dir: str, config: Dict = None):
+        self.config = config or RECORDER_CONFIG
+        self.session_dir = Path(session_dir)
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=self.config['QUEUE_SIZE'])
+        self.stats = {'recorded': 0, 'dropped': 0, 'bytes': 0, 'segments': 0}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.running = False
+        self.stopped = False
+        self.thread = None
+        self._resume()
+
+    def _resume(self):
+        """Continue after the last complete index entry of an existing session"""
+        self.next_seq = 0
+        self.segment_no = 0
+        self.previous = {'frames': 0, 'dropped': 0, 'bytes': 0}
+        index_path = self.session_dir / INDEX_FILE
+        if not index_path.exists():
+            return
+
+        last, valid_bytes, total = None, 0, 0
+        with open(index_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Torn last line from an unclean shutdown
+                try:
+                    last = json.loads(line)
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+                total += last['length']
+        if valid_bytes != index_path.stat().st_size:
+            with open(index_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+
+        meta = {}
+        try:
+            with open(self.session_dir / META_FILE, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if last is not None:
+            self.next_seq = last['seq'] + 1
+            self.segment_no = last['segment']
+            self.previous = {'frames': self.next_seq, 'dropped': meta.get('dropped', 0), 'bytes': total}
+        self.started_at = meta.get('started_at', self.started_at)
+
+    def start(self):
+        """Start the writer thread"""
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError(f"Recorder for {self.session_dir} was stopped - open a new SessionRecorder to resume")
+            if self.running:
+                return self
+            self.running = True
+        self.thread = threading.Thread(target=self._writer_loop, name='vision-recorder', daemon=True)
+        self.thread.start()
+        return self
+
+    def record(self, frame_b64: str, game_info: Dict, timestamp: float = None) -> bool:
+        """Hand a capture to the writer thread - never blocks the capture path"""
+        with self.lock:
+            # Checked under the lock stop() takes, so nothing is queued behind its sentinel
+            if not self.running:
+                return False
+            try:
+                self.queue.put_nowait((frame_b64, game_info, timestamp or time.time()))
+                return True
+            except queue.Full:
+                self.stats['dropped'] += 1
+                return False
+
+    def stop(self, timeout: float = 5.0):
+        """Flush pending captures and close the session"""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            self.stopped = True
+        self.queue.put(None)
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _writer_loop(self):
+        cfg = self.config
+        segment_no = self.segment_no
+        segment = open(self.session_dir / _segment_name(segment_no), 'ab')
+        index = open(self.session_dir / INDEX_FILE, 'a', encoding='utf-8')
+        self.stats['segments'] = segment_no + 1
+        seq = self.next_seq
+        pending = 0
+
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+
+                frame_b64, game_info, timestamp = item
+                try:
+                    blob = encode_record(frame_b64, game_info, timestamp, cfg['COMPRESS_LEVEL'])
+                except Exception as e:
+                    print(f"[VisionRecorder] Skipping bad frame: {e}")
+                    continue
+
+                if segment.tell() and segment.tell() + len(blob) > cfg['SEGMENT_MAX_BYTES']:
+                    segment.close()
+                    segment_no += 1
+                    segment = open(self.session_dir / _segment_name(segment_no), 'ab')
+                    self.stats['segments'] += 1
+
+                offset = segment.tell()
+                segment.write(blob)
+                index.write(json.dumps({
+                    'seq': seq,
+                    't': timestamp,
+                    'segment': segment_no,
+                    'offset': offset,
+                    'length': len(blob),
+                }) + '\n')
+
+                seq += 1
+                pending += 1
+                self.stats['recorded'] += 1
+                self.stats['bytes'] += len(blob)
+
+                if pending >= cfg['FLUSH_EVERY']:
+                    segment.flush()
+                    index.flush()
+                    pending = 0
+        finally:
+            segment.close()
+            index.close()
+            self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            'started_at': self.started_at,
+            'stopped_at': time.time(),
+            'frames': self.previous['frames'] + self.stats['recorded'],
+            'dropped': self.previous['dropped'] + self.stats['dropped'],
+            'bytes': self.previous['bytes'] + self.stats['bytes'],
+            'segments': self.stats['segments'],
+        }
+        with open(self.session_dir / META_FILE, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    def status(self) -> Dict:
+        return {
+            'session_dir': str(self.session_dir),
+            'recording': self.running,
+            'queued': self.queue.qsize(),
+            **self.stats,
+        }
+
+
+class SessionReader:
+    """Random access to a recorded session through memory-mapped segments"""
+
+    def __init__(self, session_dir: str):
+        self.session_dir = Path(session_dir)
+        self.index: List[Dict] = []
+        with open(self.session_dir / INDEX_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        self.index.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # Torn last line from an unclean shutdown
+        self.times = [entry['t'] for entry in self.index]
+        self._maps = {}
+        self._files = {}
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _segment(self, number: int) -> mmap.mmap:
+        if number not in self._maps:
+            f = open(self.session_dir / _segment_name(number), 'rb')
+            self._files[number] = f
+            self._maps[number] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[number]
+
+    def get(self, seq: int) -> Dict:
+        """Decode frame number `seq`"""
+        entry = self.index[seq]
+        data = self._segment(entry['segment'])
+        return decode_record(data[entry['offset']:entry['offset'] + entry['length']])
+
+    def seek_time(self, timestamp: float) -> int:
+        """Sequence number of the first frame at or after `timestamp`"""
+        return bisect.bisect_left(self.times, timestamp)
+
+    def frames(self, start: int = 0, end: int = None) -> Iterator[Dict]:
+        for seq in range(start, len(self.index) if end is None else min(end, len(self.index))):
+            yield self.get(seq)
+
+    def info(self) -> Dict:
+        meta = {}
+        meta_path = self.session_dir / META_FILE
+        if meta_path.exists():
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        return {
+            'session_dir': str(self.session_dir),
+            'frames': len(self.index),
+            'duration': (self.times[-1] - self.times[0]) if self.times else 0,
+            'segments': len({entry['segment'] for entry in self.index}),
+            'bytes': sum(entry['length'] for entry in self.index),
+            **{k: v for k, v in meta.items() if k in ('started_at', 'stopped_at', 'dropped')},
+        }
+
+    def close(self):
+        for m in self._maps.values():
+            m.close()
+        for f in self._files.values():
+            f.close()
+        self._maps.clear()
+        self._files.clear()
+
+
+def replay(session_dir: str, url: str = 'http://127.0.0.1:8081/api/vision/capture',
+           speed: float = 1.0, start: int = 0, end: int = None) -> Dict:
+    """Post a recorded session back into the capture endpoint
+
+    speed=1.0 keeps original timing, 4.0 plays four times faster,
+    0 sends frames back to back as fast as the server accepts them.
+    """
+    import requests
+
+    reader = SessionReader(session_dir)
+    session = requests.Session()
+    sent = failed = 0
+    wall_start = time.time()
+    first_t = None
+
+    try:
+        for record in reader.frames(start, end):
+            if first_t is None:
+                first_t = record['timestamp']
+
+            if speed > 0:
+                due = wall_start + (record['timestamp'] - first_t) / speed
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            try:
+                response = session.post(url, json={
+                    'frame': record['frame'],
+                    'game_info': record['game_info'],
+                    'timestamp': int(record['timestamp'] * 1000),
+                    'replay': True,
+                }, timeout=10)
+                if response.ok:
+                    sent += 1
+                else:
+                    failed += 1
+            except requests.RequestException:
+                failed += 1
+    finally:
+        reader.close()
+
+    elapsed = time.time() - wall_start
+    return {
+        'sent': sent,
+        'failed': failed,
+        'elapsed': elapsed,
+        'fps': sent / elapsed if elapsed > 0 else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or replay recorded vision sessions')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    info_cmd = sub.add_parser('info', help='Show session summary')
+    info_cmd.add_argument('session_dir')
+
+    replay_cmd = sub.add_parser('replay', help='Replay a session into /api/vision/capture')
+    replay_cmd.add_argument('session_dir')
+    replay_cmd.add_argument('--url', default='http://127.0.0.1:8081/api/vision/capture')
+    replay_cmd.add_argument('--speed', type=float, default=1.0, help='1 = original, 0 = as fast as possible')
+    replay_cmd.add_argument('--start', type=int, default=0)
+    replay_cmd.add_argument('--end', type=int, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        reader = SessionReader(args.session_dir)
+        print(json.dumps(reader.info(), indent=2))
+        reader.close()
+    elif args.command == 'replay':
+        result = replay(args.session_dir, args.url, args.speed, args.start, args.end)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+CODEBASE SCAN
+=============
+Incremental issue scan of the workspace (performance / bugs / security /
+code_quality), the data behind /scan and the assistants' start-up scan.
+
+Results are cached per file, keyed by relative path and content hash:
+- Unchanged mtime + size: the cached issues are reused without reading the file.
+- Changed stat, same hash (touched, checked out again): reused after one read.
+- Changed content: only that file is rescanned.
+The cache is persisted to ai_cache/scan_cache.json, so a fresh process starts
+warm. It is dropped when RULES_VERSION changes.
+
+Usage:
+    issues = get_scanner().scan()
+    issues['security']  # [{"file", "line", "type", "severity", "message"}, ...]
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, List, Any, Optional
+
+SCAN_CONFIG = {
+    'CACHE_PATH': os.path.join('ai_cache', 'scan_cache.json'),  # Relative to the workspace
+    'EXTENSIONS': ('.js', '.py', '.html', '.css'),
+    'SKIP_DIRS': {'node_modules', '__pycache__', 'ai_cache', 'traces', 'logs', 'history',
+                  'recordings', 'Screenshots', 'images', 'sounds', 'models', 'venv'},
+    'MAX_FILE_BYTES': 2 * 1024 * 1024,   # Larger files are skipped (bundles, dumps)
+    'MAX_PER_RULE': 25,                  # Issues reported per rule per file
+}
+
+CATEGORIES = ('performance', 'bugs', 'security', 'code_quality')
+
+# Bump when RULES change so cached results are recomputed
+RULES_VERSION = 1
+
+# (category, type, severity, extensions, pattern, message)
+RULES = [
+    ('performance', 'deep_clone', 'medium', ('.js',), r'JSON\.parse\(\s*JSON\.stringify\(',
+     "Deep clone via JSON round-trip - slow and drops non-JSON values"),
+    ('performance', 'dom_append', 'medium', ('.js', '.html'), r'\.innerHTML\s*\+=',
+     "innerHTML += re-parses the whole element on every append"),
+    ('performance', 'fast_interval', 'medium', ('.js', '.html'), r'setInterval\([^;]*,\s*(?:[0-9]|1[0-5])\s*\)',
+     "setInterval faster than one frame (<16ms) - use requestAnimationFrame"),
+    ('performance', 'read_all_lines', 'low', ('.py',), r'\.readlines\(\)',
+     "readlines() loads the whole file - iterate the file instead"),
+
+    ('bugs', 'bare_except', 'medium', ('.py',), r'^\s*except\s*:',
+     "Bare except also catches KeyboardInterrupt/SystemExit"),
+    ('bugs', 'mutable_default', 'high', ('.py',), r'def \w+\(.*=\s*(?:\[\]|\{\})\s*[,)]',
+     "Mutable default argument is shared between calls"),
+    ('bugs', 'empty_catch', 'medium', ('.js', '.html'), r'catch\s*(?:\(\s*\w*\s*\))?\s*\{\s*\}',
+     "Empty catch block swallows errors"),
+    ('bugs', 'parseint_radix', 'low', ('.js', '.html'), r'parseInt\(\s*[^,()]+\)',
+     "parseInt without a radix"),
+    ('bugs', 'nan_compare', 'high', ('.js', '.html', '.py'), r'[!=]==?\s*NaN\b',
+     "Comparison with NaN is always false - use Number.isNaN / math.isnan"),
+
+    ('security', 'eval', 'high', ('.js', '.html', '.py'), r'(?<![\w.])eval\((?!\))',
+     "eval() executes arbitrary code"),
+    ('security', 'dynamic_function', 'high', ('.js', '.html'), r'new Function\(',
+     "new Function() executes arbitrary code"),
+    ('security', 'document_write', 'medium', ('.js', '.html'), r'document\.write\(',
+     "document.write() - XSS risk and blocks parsing"),
+    ('security', 'inner_html', 'low', ('.js', '.html'), r'\.innerHTML\s*=(?!=)',
+     "innerHTML assignment - XSS risk if the value includes user input"),
+    ('security', 'shell_injection', 'high', ('.py',), r'shell\s*=\s*True|os\.system\(',
+     "Shell command execution - injection risk"),
+    ('security', 'unsafe_deserialize', 'high', ('.py',), r'pickle\.loads?\(|yaml\.load\((?![^)]*Loader)',
+     "Deserializing untrusted data can execute code"),
+    ('security', 'hardcoded_secret', 'high', ('.js', '.html', '.py'),
+     r'(?i)(?:api[_-]?key|secret|password|token)\s*[:=]\s*["\'][A-Za-z0-9_\-]{16,}["\']',
+     "Possible hardcoded credential"),
+
+    ('code_quality', 'todo', 'low', ('.js', '.html', '.py', '.css'), r'\b(?:TODO|FIXME|HACK|XXX)\b',
+     "Unresolved TODO/FIXME marker"),
+    ('code_quality', 'var_declaration', 'low', ('.js',), r'^\s*var\s',
+     "var declaration - use let/const"),
+    ('code_quality', 'loose_equality', 'low', ('.js',), r'(?<![=!<>])[=!]=(?!=)',
+     "Loose equality (==/!=) - use ===/!=="),
+    ('code_quality', 'long_line', 'low', ('.js', '.py'), r'^.{200,}$',
+     "Line longer than 200 characters"),
+]
+
+_COMPILED = [(category, kind, severity, extensions, re.compile(pattern), message)
+             for category, kind, severity, extensions, pattern, message in RULES]
+
+
+def scan_text(rel_path: str, text: str, max_per_rule: int = SCAN_CONFIG['MAX_PER_RULE']) -> Dict[str, List[Dict]]:
+    """Issues in one file's text, by category"""
+    ext = os.path.splitext(rel_path)[1].lower()
+    rules = [rule for rule in _COMPILED if ext in rule[3]]
+    issues = {category: [] for category in CATEGORIES}
+    if not rules:
+        return issues
+    counts = [0] * len(rules)
+    for line_no, line in enumerate(text.splitlines(), 1):
+        for i, (category, kind, severity, _, pattern, message) in enumerate(rules):
+            if counts[i] < max_per_rule and pattern.search(line):
+                counts[i] += 1
+                issues[category].append({
+                    "file": rel_path,
+                    "line": line_no,
+                    "type": kind,
+                    "severity": severity,
+                    "message": message
+                })
+    return issues
+
+
+def iter_workspace_files(root: str, extensions, skip_dirs, max_bytes: int):
+    """(relative posix path, absolute path, stat) for every matching file under root.
+    Hidden directories and skip_dirs are not entered; files over max_bytes are left out."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in skip_dirs and not d.startswith('.')]
+        for name in filenames:
+            if not name.endswith(extensions):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size <= max_bytes:
+                yield os.path.relpath(path, root).replace(os.sep, '/'), path, stat
+
+
+class CodebaseScanner:
+    """Workspace scan with a persistent per-file result cache"""
+
+    def __init__(self, root: str = None, config: Dict = None):
+        self.root = os.path.abspath(root or os.getcwd())
+        self.config = config or SCAN_CONFIG
+        self.cache_path = os.path.join(self.root, self.config['CACHE_PATH'])
+        self.lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = self._load()
+        self.merged: Optional[Dict[str, List[Dict]]] = None
+        self.last_scan: Dict[str, Any] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('version') == RULES_VERSION:
+                return cached['files']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+        return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': RULES_VERSION, 'files': self.files}, f, separators=(',', ':'))
+        os.replace(tmp, self.cache_path)
+
+    def scan(self) -> Dict[str, List[Dict]]:
+        """Issues across the workspace; only files changed since the last scan are reread"""
+        with self.lock:
+            start = time.perf_counter()
+            seen = set()
+            rescanned = rehashed = 0
+            dirty = False
+            for rel, path, stat in iter_workspace_files(self.root, self.config['EXTENSIONS'],
+                                                        self.config['SKIP_DIRS'], self.config['MAX_FILE_BYTES']):
+                seen.add(rel)
+                cached = self.files.get(rel)
+                if cached and cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+                    continue
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                digest = hashlib.sha1(data).hexdigest()
+                if cached and cached['hash'] == digest:
+                    rehashed += 1
+                    issues = cached['issues']
+                else:
+                    rescanned += 1
+                    issues = scan_text(rel, data.decode('utf-8', errors='replace'), self.config['MAX_PER_RULE'])
+                    self.merged = None
+                self.files[rel] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                                   'hash': digest, 'issues': issues}
+                dirty = True
+
+            removed = [rel for rel in self.files if rel not in seen]
+            for rel in removed:
+                del self.files[rel]
+            if removed:
+                self.merged = None
+                dirty = True
+            if dirty:
+                self._save()
+
+            if self.merged is None:
+                self.merged = {category: [] for category in CATEGORIES}
+                for rel in sorted(self.files):
+                    for category, issues in self.files[rel]['issues'].items():
+                        self.merged[category].extend(issues)
+
+            self.last_scan = {
+                'files': len(self.files),
+                'rescanned': rescanned,
+                'rehashed': rehashed,
+                'removed': len(removed),
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+            }
+            return self.merged
+
+    def report(self) -> Dict[str, Any]:
+        return {'root': self.root, 'cache_path': self.cache_path, **self.last_scan}
+
+
+# Shared per-workspace instances, so every caller in a process reuses one warm cache
+_scanners: Dict[str, CodebaseScanner] = {}
+_scanners_lock = threading.Lock()
+
+
+def get_scanner(root: str = None) -> CodebaseScanner:
+    root = os.path.abspath(root or os.getcwd())
+    with _scanners_lock:
+        if root not in _scanners:
+            _scanners[root] = CodebaseScanner(root)
+        return _scanners[root]
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+CONVERSATION STORE
+===================
+Persistent conversation history for the collaborative bridge.
+
+Entries are appended to SQLite (WAL mode) by a background writer thread.
+The request path only puts the entry on a queue and into an in-memory tail
+(a bounded deque), with no list shifting and no disk I/O. Ids are assigned
+at append time, so the tail and the database always agree.
+
+Lookups:
+- "latest N" with no filters is served from the tail.
+- Everything else uses the ts index or an FTS5 keyword index (LIKE when
+  SQLite has no FTS5). Keywords match the query and the text values of the
+  entry, not JSON keys or escapes. Pages are keyset-paginated by id
+  (cursor = oldest id on the page), so page 1000 costs the same as page 1.
+
+Retention deletes entries older than RETENTION_DAYS and keeps at most
+MAX_ENTRIES. It runs in the writer thread every RETENTION_INTERVAL seconds.
+
+Usage:
+    store = ConversationStore()
+    store.append({"query": "...", "response": {...}})
+    page = store.query(keyword="npc", since=time.time() - 3600, limit=20)
+    older = store.query(keyword="npc", cursor=page["next_cursor"])
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+STORE_CONFIG = {
+    'PATH': os.getenv('BRIDGE_HISTORY_DB', os.path.join('history', 'bridge_history.db')),
+    'TAIL_SIZE': 200,              # Most recent entries kept in memory
+    'RETENTION_DAYS': 90,          # Older entries are deleted (0 = keep forever)
+    'MAX_ENTRIES': 1_000_000,      # Oldest entries beyond this are deleted (0 = unlimited)
+    'RETENTION_INTERVAL': 3600,    # Seconds between retention passes
+    'WRITE_BATCH': 256,            # Entries committed per transaction at most
+    'MAX_PAGE': 500,
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    query TEXT NOT NULL DEFAULT '',
+    text TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_ts ON entries(ts);
+"""
+
+
+# PRAGMA user_version: 1 = keyword search runs over extracted text, not the JSON body
+_SCHEMA_VERSION = 1
+
+
+def _search_text(value) -> str:
+    """The string and number values of an entry, for keyword search (keys and JSON syntax left out)"""
+    parts = []
+
+    def walk(item):
+        if isinstance(item, dict):
+            for child in item.values():
+                walk(child)
+        elif isinstance(item, (list, tuple)):
+            for child in item:
+                walk(child)
+        elif isinstance(item, str):
+            parts.append(item)
+        elif item is not None and not isinstance(item, bool):
+            parts.append(str(item))
+
+    walk(value)
+    return "\n".join(parts)
+
+
+def _fts_query(keyword: str) -> str:
+    # Every word must appear; quoting keeps FTS syntax characters literal
+    return " ".join('"' + word.replace('"', '""') + '"' for word in keyword.split())
+
+
+class ConversationStore:
+    """Append-only SQLite history with an in-memory tail"""
+
+    def __init__(self, path: str = None, config: Dict = None):
+        self.config = config or STORE_CONFIG
+        self.path = path or self.config['PATH']
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pending: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self.stats = {'appended': 0, 'written': 0, 'tail_hits': 0, 'queries': 0, 'expired': 0, 'write_errors': 0}
+
+        db = self._connect()
+        db.executescript(_SCHEMA)
+        rebuild = self._migrate(db)
+        try:
+            db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(query, text)")
+            self.fts = True
+            if rebuild:
+                db.execute("INSERT INTO entries_fts (rowid, query, text) SELECT id, query, text FROM entries")
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite built without FTS5 - keyword search falls back to LIKE
+        db.commit()
+
+        lowest, highest = db.execute("SELECT MIN(id), MAX(id) FROM entries").fetchone()
+        self.next_id = (highest or 0) + 1
+        self.min_id = lowest or self.next_id  # Oldest id still stored
+        rows = db.execute("SELECT id, ts, body FROM entries ORDER BY id DESC LIMIT ?",
+                          (self.config['TAIL_SIZE'],)).fetchall()
+        self.tail = deque((self._entry(row) for row in reversed(rows)), maxlen=self.config['TAIL_SIZE'])
+
+        self.writer = threading.Thread(target=self._write_loop, name='conversation-store-writer', daemon=True)
+        self.writer.start()
+
+    @staticmethod
+    def _migrate(db: sqlite3.Connection) -> bool:
+        """Bring an older database up to _SCHEMA_VERSION; True when the keyword index must be rebuilt"""
+        if db.execute("PRAGMA user_version").fetchone()[0] >= _SCHEMA_VERSION:
+            return False
+        columns = {row[1] for row in db.execute("PRAGMA table_info(entries)")}
+        if 'text' not in columns:
+            db.execute("ALTER TABLE entries ADD COLUMN text TEXT NOT NULL DEFAULT ''")
+        rows = db.execute("SELECT id, body FROM entries").fetchall()
+        db.executemany("UPDATE entries SET text = ? WHERE id = ?",
+                       [(_search_text({k: v for k, v in json.loads(body).items() if k != 'query'}), entry_id)
+                        for entry_id, body in rows])
+        db.execute("DROP TABLE IF EXISTS entries_fts")  # Version 0 indexed the raw, ASCII-escaped JSON
+        db.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        return True
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    @staticmethod
+    def _entry(row) -> Dict[str, Any]:
+        entry_id, ts, body = row
+        entry = json.loads(body)
+        entry['id'] = entry_id
+        entry['timestamp'] = ts
+        return entry
+
+    # ---- writes ----
+
+    def append(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Record an entry ({"query", "response", ...}); returns it with id + timestamp"""
+        with self.lock:
+            entry = dict(entry, id=self.next_id)
+            entry.setdefault('timestamp', time.time())
+            self.next_id += 1
+            self.tail.append(entry)
+            self.pending.put(entry)
+            self.stats['appended'] += 1
+        return entry
+
+    def _write_loop(self):
+        db = self._connect()
+        next_retention = 0.0
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < self.config['WRITE_BATCH']:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            entries = [entry for entry in batch if entry is not None]
+            try:
+                if entries:
+                    self._write(db, entries)
+                if time.monotonic() >= next_retention:
+                    self._expire(db)
+                    next_retention = time.monotonic() + self.config['RETENTION_INTERVAL']
+            except sqlite3.Error as e:
+                self.stats['write_errors'] += 1
+                print(f"⚠ Conversation history write failed: {e}")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+            if stop:
+                break
+        db.close()
+
+    def _write(self, db: sqlite3.Connection, entries: List[Dict[str, Any]]):
+        rows = []
+        for entry in entries:
+            body = {key: value for key, value in entry.items() if key not in ('id', 'timestamp')}
+            text = _search_text({key: value for key, value in body.items() if key != 'query'})
+            rows.append((entry['id'], entry['timestamp'], str(entry.get('query', '')), text,
+                         json.dumps(body, default=str, ensure_ascii=False)))
+        with db:
+            db.executemany("INSERT OR REPLACE INTO entries (id, ts, query, text, body) VALUES (?, ?, ?, ?, ?)", rows)
+            if self.fts:
+                db.executemany("INSERT INTO entries_fts (rowid, query, text) VALUES (?, ?, ?)",
+                               [(row[0], row[2], row[3]) for row in rows])
+        self.stats['written'] += len(rows)
+
+    def _expire(self, db: sqlite3.Connection):
+        """Retention pass: by age, then by count"""
+        cutoff_id = 0
+        if self.config['RETENTION_DAYS']:
+            cutoff = time.time() - self.config['RETENTION_DAYS'] * 86400
+            row = db.execute("SELECT MAX(id) FROM entries WHERE ts < ?", (cutoff,)).fetchone()
+            cutoff_id = row[0] or 0
+        if self.config['MAX_ENTRIES']:
+            newest = db.execute("SELECT MAX(id) FROM entries").fetchone()[0] or 0
+            cutoff_id = max(cutoff_id, newest - self.config['MAX_ENTRIES'])
+        if cutoff_id <= 0:
+            return
+        with db:
+            deleted = db.execute("DELETE FROM entries WHERE id <= ?", (cutoff_id,)).rowcount
+            if self.fts:
+                db.execute("DELETE FROM entries_fts WHERE rowid <= ?", (cutoff_id,))
+        self.stats['expired'] += max(deleted, 0)
+        with self.lock:
+            self.min_id = max(self.min_id, cutoff_id + 1)
+            while self.tail and self.tail[0]['id'] < self.min_id:
+                self.tail.popleft()
+
+    def flush(self):
+        """Block until everything appended so far is on disk"""
+        self.pending.join()
+
+    def close(self):
+        """Write what is queued, stop the writer, close this thread's connection"""
+        self.pending.put(None)
+        self.writer.join(timeout=10)
+        db = getattr(self.local, 'db', None)
+        if db is not None:
+            db.close()
+            self.local.db = None
+
+    # ---- reads ----
+
+    def query(self, since: float = None, until: float = None, keyword: str = None,
+              cursor: int = None, limit: int = 20) -> Dict[str, Any]:
+        """Newest-first page of matching entries, returned oldest-first; next_cursor pages further back"""
+        limit = max(1, min(int(limit), self.config['MAX_PAGE']))
+        self.stats['queries'] += 1
+        keyword = (keyword or '').strip()
+
+        if since is None and until is None and not keyword:
+            page = self._from_tail(cursor, limit)
+            if page is not None:
+                self.stats['tail_hits'] += 1
+                return page
+
+        self.flush()  # Include entries still queued for the writer
+        clauses, params = [], []
+        table = "entries"
+        if keyword and self.fts:
+            table = "entries JOIN entries_fts ON entries_fts.rowid = entries.id"
+            clauses.append("entries_fts MATCH ?")
+            params.append(_fts_query(keyword))
+        elif keyword:
+            clauses.append("(entries.query LIKE ? ESCAPE '\\' OR entries.text LIKE ? ESCAPE '\\')")
+            pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            params += [pattern, pattern]
+        if since is not None:
+            clauses.append("entries.ts >= ?")
+            params.append(float(since))
+        if until is not None:
+            clauses.append("entries.ts < ?")
+            params.append(float(until))
+        if cursor is not None:
+            clauses.append("entries.id < ?")
+            params.append(int(cursor))
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT entries.id, entries.ts, entries.body FROM {table} {where} ORDER BY entries.id DESC LIMIT ?",
+            params + [limit + 1]).fetchall()
+
+        more = len(rows) > limit
+        entries = [self._entry(row) for row in reversed(rows[:limit])]
+        return {
+            'entries': entries,
+            'next_cursor': entries[0]['id'] if more else None,
+        }
+
+    def _from_tail(self, cursor: Optional[int], limit: int) -> Optional[Dict[str, Any]]:
+        """Unfiltered page from memory, or None when it reaches past the tail"""
+        with self.lock:
+            tail = list(self.tail)
+            # Nothing stored is older than the tail's first entry
+            complete = not tail or tail[0]['id'] <= self.min_id
+        if cursor is not None:
+            tail = [entry for entry in tail if entry['id'] < cursor]
+        if len(tail) > limit:
+            entries = tail[-limit:]
+            return {'entries': entries, 'next_cursor': entries[0]['id']}
+        if not complete:
+            return None
+        return {'entries': tail, 'next_cursor': None}
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'fts': self.fts,
+            'tail': len(self.tail),
+            'pending': self.pending.qsize(),
+            **self.stats,
+        }
@@ -7,7 +7,9 @@
     'use strict';
     
     const AI_VISION_API = 'http://127.0.0.1:8081';
-    const CAPTURE_INTERVAL = 500; // ms between frame captures
+    const CAPTURE_INTERVAL = 500; // ms between frame captures (until the server recommends one)
+    const MIN_CAPTURE_INTERVAL = 100;
+    const MAX_CAPTURE_INTERVAL = 10000;
     
     window.AIVisionControl = {
         
@@ -15,6 +17,9 @@
         captureTimer: null,
         commandCheckTimer: null,
         renderer: null,
+        captureInterval: CAPTURE_INTERVAL,
+        captureScale: 1.0,
+        scaleCanvas: null,
         
         async init() {
             console.log('[AI Vision] Initializing...');
@@ -31,10 +36,9 @@
         start() {
             console.log('[AI Vision] Starting frame capture...');
             
-            // Start periodic frame capture
-            this.captureTimer = setInterval(() => {
-                this.captureFrame();
-            }, CAPTURE_INTERVAL);
+            // Start frame capture - each capture schedules the next one using
+            // the interval the vision server recommended in its response
+            this.scheduleCapture(this.captureInterval);
             
             // Start checking for AI commands
             this.commandCheckTimer = setInterval(() => {
@@ -42,13 +46,52 @@
             }, 100);
         },
         
+        scheduleCapture(delay) {
+            clearTimeout(this.captureTimer);
+            this.captureTimer = setTimeout(async () => {
+                await this.captureFrame();
+                this.scheduleCapture(this.captureInterval);
+            }, delay);
+        },
+        
+        applyCaptureHint(hint) {
+            if (!hint) return;
+            
+            const interval = Number(hint.interval_ms);
+            if (Number.isFinite(interval)) {
+                this.captureInterval = Math.max(MIN_CAPTURE_INTERVAL, Math.min(MAX_CAPTURE_INTERVAL, interval));
+            }
+            
+            const scale = Number(hint.scale);
+            if (Number.isFinite(scale) && scale > 0) {
+                this.captureScale = Math.min(1.0, scale);
+            }
+        },
+        
+        encodeCanvas(canvas) {
+            // Full resolution - encode the render canvas directly
+            if (this.captureScale >= 1.0) {
+                return canvas.toDataURL('image/png').split(',')[1];
+            }
+            
+            // Downscale into a reusable canvas so toDataURL has fewer pixels to encode
+            if (!this.scaleCanvas) {
+                this.scaleCanvas = document.createElement('canvas');
+            }
+            const target = this.scaleCanvas;
+            target.width = Math.max(1, Math.round(canvas.width * this.captureScale));
+            target.height = Math.max(1, Math.round(canvas.height * this.captureScale));
+            target.getContext('2d').drawImage(canvas, 0, 0, target.width, target.height);
+            return target.toDataURL('image/png').split(',')[1];
+        },
+        
         async captureFrame() {
             if (!this.enabled || !window.renderer) return;
             
             try {
-                // Capture canvas as image
+                // Capture canvas as image (at the resolution the server asked for)
                 const canvas = window.renderer.domElement;
-                const imageData = canvas.toDataURL('image/png').split(',')[1];
+                const imageData = this.encodeCanvas(canvas);
                 
                 // Gather game state
                 const gameInfo = {
@@ -83,6 +126,7 @@
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
                         frame: imageData,
+                        scale: this.captureScale,
                         game_info: gameInfo,
                         timestamp: Date.now()
                     })
@@ -90,9 +134,15 @@
                 
                 if (!response.ok) {
                     console.warn('[AI Vision] Capture failed:', response.status);
+                    return;
                 }
+                
+                const data = await response.json();
+                this.applyCaptureHint(data.next_capture);
             } catch (e) {
                 console.warn('[AI Vision] Capture error:', e.message);
+                // Server unreachable - back off instead of hammering toDataURL
+                this.captureInterval = Math.min(MAX_CAPTURE_INTERVAL, this.captureInterval * 2);
             }
         },
         
@@ -1,5 +1,6 @@
 // AI-Powered NPC Intelligence Enhancement
-// Integrates with AI bridge for intelligent NPC behavior
+// Integrates with AI bridge for intelligent NPC behavior: when the bridge is up, proximity,
+// threat and decision scheduling run there (/world/tick, decisions pushed over /npc-stream)
 
 (function() {
     'use strict';
@@ -8,12 +9,27 @@
     let bridgeConnected = false;
     let aiDecisionCache = new Map();
     let cacheExpiry = 5000; // 5 second cache
+    const MAX_DECISION_BATCH = 1000; // NPCs per /npc-decisions request
+    const WORLD_MIN_MOVE = 0.5; // Units an NPC moves before its position is re-sent to /world/tick
+    const WORLD_RETRY_MS = 30000; // Back-off after /world/tick or /npc-stream fails
+    const TARGET_ACTIONS = new Set(['FLEE', 'COMBAT', 'ALERT']); // Behaviors that need the actual enemy NPCs
+    let nextAIId = 1;
 
     const NPCAIEnhancement = {
         enabled: false,
         updateInterval: null,
         lastCheck: 0,
         decisionQueue: [],
+        batchInFlight: false,
+        // Bridge-side world: proximity, threat and LOD scheduling run in /world/tick
+        worldTickInFlight: false,
+        worldRetryAt: 0,
+        worldSent: new Map(),   // id -> fields last sent to the bridge
+        npcsById: new Map(),
+        decisionStream: null,
+        streamOpen: false,
+        streamSeq: null,
+        streamRetryAt: 0,
 
         init: function() {
             console.log('[NPC AI] Initializing AI enhancement system...');
@@ -43,6 +59,10 @@
                 this.enabled = false;
                 console.log('[NPC AI] Using local intelligence (Bridge offline)');
             }
+            if (!bridgeConnected) {
+                this.closeDecisionStream();
+                this.worldSent.clear(); // Resend everything once the bridge is back
+            }
 
             // Recheck every 30 seconds
             setTimeout(() => this.checkBridgeConnection(), 30000);
@@ -193,6 +213,12 @@
             // Only update NPCs near player for performance
             if (!window.player || !window.player.mesh) return;
 
+            if (bridgeConnected && now >= this.worldRetryAt) {
+                // The bridge works out proximity/threat and which NPCs are due - nothing O(n^2) here
+                this.syncWorld(npcs);
+                return;
+            }
+
             npcs.forEach(npc => {
                 if (!npc || !npc.mesh || !npc.aiEnhanced) return;
 
@@ -214,6 +240,156 @@
                     this.updateNPCSimple(npc);
                 }
             });
+
+            this.flushDecisionQueue();
+        },
+
+        factionOf: function(npc) {
+            const faction = npc.faction?.name ?? npc.faction;
+            return faction === undefined ? null : String(faction);
+        },
+
+        aiId: function(npc) {
+            if (!npc._aiId) npc._aiId = `npc_${nextAIId++}`;
+            return npc._aiId;
+        },
+
+        async syncWorld(npcs) {
+            if (this.worldTickInFlight) return;
+            this.openDecisionStream();
+
+            // Partial snapshot: only NPCs that moved or changed since the last tick
+            const seen = new Set();
+            const updates = [];
+            npcs.forEach(npc => {
+                if (!npc || !npc.mesh || !npc.aiEnhanced) return;
+                const id = this.aiId(npc);
+                const p = npc.mesh.position;
+                const current = {
+                    faction: this.factionOf(npc),
+                    health: npc.health || 100,
+                    state: npc.state || 'IDLE',
+                    type: npc.job || npc.faction?.name || 'CITIZEN'
+                };
+                const last = this.worldSent.get(id);
+                const update = { id };
+                if (!last || Math.abs(p.x - last.x) + Math.abs(p.y - last.y) + Math.abs(p.z - last.z) >= WORLD_MIN_MOVE) {
+                    update.position = [p.x, p.y, p.z];
+                    Object.assign(current, { x: p.x, y: p.y, z: p.z });
+                } else {
+                    Object.assign(current, { x: last.x, y: last.y, z: last.z });
+                }
+                for (const field of ['faction', 'health', 'state', 'type']) {
+                    if (!last || last[field] !== current[field]) update[field] = current[field];
+                }
+                seen.add(id);
+                this.npcsById.set(id, npc);
+                this.worldSent.set(id, current);
+                if (Object.keys(update).length > 1) updates.push(update);
+            });
+
+            const removed = [];
+            this.worldSent.forEach((_, id) => {
+                if (!seen.has(id)) removed.push(id);
+            });
+            removed.forEach(id => {
+                this.worldSent.delete(id);
+                this.npcsById.delete(id);
+            });
+
+            const playerPos = window.player.mesh.position;
+            const body = {
+                npcs: updates,
+                players: [{ id: 'player', position: [playerPos.x, playerPos.y, playerPos.z], health: window.player.health || 100 }],
+                removed: removed,
+                time_of_day: window.gameState?.timeOfDay || window.LivingWorldNPCs?.currentHour || 12,
+                stream: this.streamOpen // Decisions arrive on /npc-stream when it is connected
+            };
+
+            this.worldTickInFlight = true;
+            try {
+                const response = await fetch(`${AI_BRIDGE_URL}/world/tick`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(body)
+                });
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                const data = await response.json();
+
+                for (const [id, context] of Object.entries(data.contexts || {})) {
+                    const npc = this.npcsById.get(id);
+                    if (!npc || !npc.contextAwareness) continue;
+                    npc.worldContext = context;
+                    npc.contextAwareness.nearbyPlayers = context.nearby_players;
+                }
+                for (const [id, decision] of Object.entries(data.decisions || {})) {
+                    this.applyBridgeDecision(id, decision, false);
+                }
+            } catch (error) {
+                // Bridge without /world/tick or a failed tick: local logic + /npc-decisions for a while
+                console.log(`[NPC AI] World sync failed (${error.message}) - using per-NPC requests`);
+                this.worldRetryAt = Date.now() + WORLD_RETRY_MS;
+                this.worldSent.clear();
+            } finally {
+                this.worldTickInFlight = false;
+            }
+        },
+
+        openDecisionStream: function() {
+            if (this.decisionStream || typeof EventSource === 'undefined' || Date.now() < this.streamRetryAt) return;
+
+            const stream = new EventSource(`${AI_BRIDGE_URL}/npc-stream`);
+            this.decisionStream = stream;
+            stream.onopen = () => { this.streamOpen = true; };
+            stream.onerror = () => {
+                this.streamOpen = false;
+                this.streamSeq = null;
+                if (stream.readyState === EventSource.CLOSED) {
+                    // Refused (e.g. too many subscribers) - decisions come back in /world/tick responses
+                    this.decisionStream = null;
+                    this.streamRetryAt = Date.now() + WORLD_RETRY_MS;
+                }
+            };
+            stream.addEventListener('keyframe', (event) => {
+                const data = JSON.parse(event.data);
+                this.streamSeq = data.seq;
+                for (const [id, decision] of Object.entries(data.decisions)) {
+                    this.applyBridgeDecision(id, decision, true);
+                }
+            });
+            stream.addEventListener('delta', (event) => {
+                const data = JSON.parse(event.data);
+                if (this.streamSeq === null || data.seq !== this.streamSeq + 1) {
+                    this.streamSeq = null; // Missed an event - wait for the next keyframe
+                    return;
+                }
+                this.streamSeq = data.seq;
+                for (const [id, decision] of Object.entries(data.changed)) {
+                    this.applyBridgeDecision(id, decision, false);
+                }
+            });
+        },
+
+        closeDecisionStream: function() {
+            if (this.decisionStream) this.decisionStream.close();
+            this.decisionStream = null;
+            this.streamOpen = false;
+            this.streamSeq = null;
+        },
+
+        applyBridgeDecision: function(id, decision, fromKeyframe) {
+            const npc = this.npcsById.get(id);
+            if (!npc) return; // Another client's NPC, or one that despawned
+
+            const summary = `${decision.action}|${decision.priority}`;
+            if (fromKeyframe && npc._bridgeDecision === summary) return; // Keyframes repeat unchanged decisions
+            npc._bridgeDecision = summary;
+
+            if (TARGET_ACTIONS.has(decision.action) && npc.worldContext?.nearby_enemies) {
+                // The bridge only sends counts - find the actual enemies for this one NPC
+                this.updateNPCContext(npc);
+            }
+            this.applyDecision(npc, decision);
         },
 
         getAllNPCs: function() {
@@ -288,32 +464,55 @@
                 return;
             }
 
-            try {
-                const state = this.getNPCState(npc);
-                const context = this.getGameContext(npc);
+            // Sent with the rest of this tick's NPCs in one /npc-decisions request
+            if (!npc._aiQueued) {
+                npc._aiQueued = true;
+                this.decisionQueue.push(npc);
+            }
+        },
+
+        async flushDecisionQueue() {
+            if (this.batchInFlight || this.decisionQueue.length === 0) return;
+
+            const batch = this.decisionQueue.splice(0, MAX_DECISION_BATCH);
+            const byId = new Map();
+            const payload = batch.map(npc => {
+                npc._aiQueued = false;
+                byId.set(this.aiId(npc), npc);
+                return {
+                    id: npc._aiId,
+                    state: this.getNPCState(npc),
+                    context: this.getGameContext(npc)
+                };
+            });
 
-                const response = await fetch(`${AI_BRIDGE_URL}/npc-decision`, {
+            this.batchInFlight = true;
+            try {
+                const response = await fetch(`${AI_BRIDGE_URL}/npc-decisions`, {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ state, context })
+                    body: JSON.stringify(payload)
                 });
 
-                if (response.ok) {
-                    const data = await response.json();
-                    if (data.status === 'success' && data.decision) {
+                const data = response.ok ? await response.json() : null;
+                byId.forEach((npc, id) => {
+                    const decision = data?.decisions?.[id];
+                    if (decision) {
                         // Cache the decision
-                        aiDecisionCache.set(cacheKey, {
-                            decision: data.decision,
+                        aiDecisionCache.set(this.getNPCStateKey(npc), {
+                            decision: decision,
                             timestamp: Date.now()
                         });
-                        
-                        this.applyDecision(npc, data.decision);
+                        this.applyDecision(npc, decision);
+                    } else {
+                        this.applyDecision(npc, this.generateLocalDecision(npc));
                     }
-                }
+                });
             } catch (error) {
                 // Fallback to local on error
-                const decision = this.generateLocalDecision(npc);
-                this.applyDecision(npc, decision);
+                batch.forEach(npc => this.applyDecision(npc, this.generateLocalDecision(npc)));
+            } finally {
+                this.batchInFlight = false;
             }
         },
 
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+LLM GATEWAY
+============
+One shared, in-process front door for every model call (orchestrator, vision
+system, brain server).
+
+- Pooled client: a single Anthropic client per process, created on first use
+- Lanes: each caller class gets its own concurrency slots, so background code
+  generation can never occupy the slots interactive dialogue needs
+    interactive  - ARIA / NPC dialogue (brain server)
+    vision       - frame analysis (vision system)
+    background   - requirement analysis, code generation, test planning
+- Coalescing: identical prompts already in flight share one backend call
+- Timeouts: per-lane request timeout + a bound on how long a call waits for a slot
+- Circuit breaker: after repeated backend failures calls fail fast for a
+  cool-down period, then a single probe decides whether to close again
+
+Backends:
+    anthropic  - the real API (default, needs ANTHROPIC_API_KEY + `anthropic`)
+    stub       - deterministic local replies, no network (OMNI_LLM_BACKEND=stub)
+
+Usage:
+    from llm_gateway import get_gateway
+    text = get_gateway().complete([{"role": "user", "content": "..."}],
+                                  lane="background", model="...", max_tokens=500)
+
+    python llm_gateway.py --stub "hello"      # one call through the stub backend
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict, List, Any, Optional, Iterator, Callable
+from agent_with_tracing import trace_span
+
+GATEWAY_CONFIG = {
+    'BACKEND': os.environ.get('OMNI_LLM_BACKEND', 'anthropic'),  # "anthropic" or "stub"
+    'DEFAULT_MODEL': 'claude-3-5-sonnet-20241022',
+    'MAX_RETRIES': 2,              # SDK-level retries for transient API errors
+    'LANES': {
+        # concurrency: calls in flight, timeout: seconds per call, queue_timeout: seconds to wait for a slot
+        'interactive': {'concurrency': 4, 'timeout': 20, 'queue_timeout': 2},
+        'vision':      {'concurrency': 2, 'timeout': 30, 'queue_timeout': 5},
+        'background':  {'concurrency': 2, 'timeout': 120, 'queue_timeout': 300},
+    },
+    'BREAKER': {
+        'FAILURE_THRESHOLD': 5,    # Consecutive backend failures before opening
+        'COOLDOWN_SECONDS': 30,    # Fail fast this long, then allow one probe
+    },
+    'STUB_LATENCY': 0.0,           # Seconds the stub backend sleeps per call
+}
+
+
+class LLMError(Exception):
+    """Base class for gateway failures"""
+
+
+class LLMTimeout(LLMError):
+    """No lane slot became free in time, or a coalesced call did not finish in time"""
+
+
+class LLMUnavailable(LLMError):
+    """Circuit breaker is open - the backend is failing, call rejected without trying"""
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+class AnthropicBackend:
+    """Anthropic Messages API through one shared, thread-safe client"""
+
+    name = 'anthropic'
+
+    def __init__(self, max_retries: int = 2):
+        self.max_retries = max_retries
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from anthropic import Anthropic
+                    self._client = Anthropic(max_retries=self.max_retries)
+        return self._client
+
+    @staticmethod
+    def _params(request: Dict) -> Dict:
+        params = {
+            'model': request['model'],
+            'max_tokens': request['max_tokens'],
+            'messages': request['messages'],
+        }
+        if request.get('system'):
+            params['system'] = request['system']
+        return params
+
+    def complete(self, request: Dict, timeout: float) -> str:
+        response = self.client.messages.create(timeout=timeout, **self._params(request))
+        return response.content[0].text
+
+    def stream(self, request: Dict, timeout: float) -> Iterator[str]:
+        with self.client.messages.stream(timeout=timeout, **self._params(request)) as stream:
+            for text in stream.text_stream:
+                yield text
+
+
+class StubBackend:
+    """Offline backend - replies come from `responder(request)` or echo the last user message"""
+
+    name = 'stub'
+
+    def __init__(self, responder: Callable[[Dict], str] = None, latency: float = None):
+        self.responder = responder
+        self.latency = GATEWAY_CONFIG['STUB_LATENCY'] if latency is None else latency
+        self.calls = 0
+
+    def _reply(self, request: Dict) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.responder:
+            return self.responder(request)
+        content = request['messages'][-1]['content'] if request['messages'] else ''
+        if isinstance(content, list):
+            content = ' '.join(part.get('text', '') for part in content if part.get('type') == 'text')
+        return f"[stub:{request['model']}] {content.strip()[:200]}"
+
+    def complete(self, request: Dict, timeout: float) -> str:
+        return self._reply(request)
+
+    def stream(self, request: Dict, timeout: float) -> Iterator[str]:
+        for word in self._reply(request).split(' '):
+            yield word + ' '
+
+
+def make_backend(name: str):
+    if name == 'stub':
+        return StubBackend()
+    if name == 'anthropic':
+        return AnthropicBackend(GATEWAY_CONFIG['MAX_RETRIES'])
+    raise ValueError(f"Unknown LLM backend: {name!r} (expected 'anthropic' or 'stub')")
+
+
+# ============================================================================
+# LANES & CIRCUIT BREAKER
+# ============================================================================
+
+class Lane:
+    """Fixed number of concurrent calls for one class of caller"""
+
+    def __init__(self, name: str, concurrency: int, timeout: float, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.stats = {'in_flight': 0, 'waiting': 0, 'completed': 0, 'errors': 0, 'rejected': 0}
+
+    def acquire(self) -> bool:
+        with self.lock:
+            self.stats['waiting'] += 1
+        acquired = self.slots.acquire(timeout=self.queue_timeout)
+        with self.lock:
+            self.stats['waiting'] -= 1
+            if acquired:
+                self.stats['in_flight'] += 1
+            else:
+                self.stats['rejected'] += 1
+        return acquired
+
+    def release(self, ok: bool):
+        with self.lock:
+            self.stats['in_flight'] -= 1
+            self.stats['completed' if ok else 'errors'] += 1
+        self.slots.release()
+
+
+class CircuitBreaker:
+    """closed → open after N consecutive failures → half-open after cool-down (one probe)"""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """Raise LLMUnavailable if the call may not go out; True when this call is the half-open probe"""
+        with self.lock:
+            if self.state == 'closed':
+                return False
+            if self.state == 'open' and time.time() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            raise LLMUnavailable(f"LLM backend circuit open ({self.failures} consecutive failures)")
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def release_probe(self):
+        """The probe ended without an outcome (stream closed early): let the next call probe"""
+        with self.lock:
+            self.probing = False
+
+    def reset(self):
+        self.record_success()
+
+
+# ============================================================================
+# GATEWAY
+# ============================================================================
+
+def _request_key(request: Dict) -> str:
+    raw = json.dumps(request, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMGateway:
+    """Lane-limited, coalescing, circuit-broken access to one LLM backend"""
+
+    def __init__(self, backend=None, config: Dict = None):
+        self.config = config or GATEWAY_CONFIG
+        self.backend = backend or make_backend(self.config['BACKEND'])
+        self.lanes = {name: Lane(name, **spec) for name, spec in self.config['LANES'].items()}
+        self.breaker = CircuitBreaker(self.config['BREAKER']['FAILURE_THRESHOLD'],
+                                      self.config['BREAKER']['COOLDOWN_SECONDS'])
+        self.inflight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def use_backend(self, backend):
+        """Swap the backend (e.g. StubBackend for offline tests) and close the breaker"""
+        self.backend = backend
+        self.breaker.reset()
+
+    def _lane(self, name: str) -> Lane:
+        if name not in self.lanes:
+            raise ValueError(f"Unknown LLM lane: {name!r} (expected one of {sorted(self.lanes)})")
+        return self.lanes[name]
+
+    def _request(self, messages, model, max_tokens, system) -> Dict:
+        return {
+            'model': model or self.config['DEFAULT_MODEL'],
+            'max_tokens': max_tokens,
+            'messages': messages,
+            'system': system,
+        }
+
+    def complete(self, messages: List[Dict], lane: str = 'interactive', model: str = None,
+                 max_tokens: int = 500, system: str = None, timeout: float = None,
+                 purpose: str = None, coalesce: bool = True) -> str:
+        """Run one completion and return its text
+
+        Raises LLMTimeout / LLMUnavailable, or the backend's own error.
+        """
+        lane_obj = self._lane(lane)
+        request = self._request(messages, model, max_tokens, system)
+        timeout = timeout or lane_obj.timeout
+
+        if not coalesce:
+            return self._call(lane_obj, request, timeout, purpose)
+
+        key = _request_key(request)
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            with trace_span("llm.coalesced", {"llm.lane": lane, "llm.purpose": purpose or ""}):
+                try:
+                    return future.result(timeout=timeout + lane_obj.queue_timeout)
+                except FutureTimeout:
+                    raise LLMTimeout(f"Coalesced {lane} call did not finish within {timeout}s")
+
+        try:
+            text = self._call(lane_obj, request, timeout, purpose)
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _call(self, lane: Lane, request: Dict, timeout: float, purpose: str) -> str:
+        attributes = {"llm.model": request['model'], "llm.lane": lane.name,
+                      "llm.purpose": purpose or "", "llm.backend": self.backend.name}
+        with trace_span("llm.messages.create", attributes, kind="client"):
+            if not lane.acquire():
+                raise LLMTimeout(f"No free {lane.name} slot within {lane.queue_timeout}s")
+            ok = False
+            try:
+                self.breaker.before_call()
+                try:
+                    text = self.backend.complete(request, timeout)
+                except Exception:
+                    self.breaker.record_failure()
+                    raise
+                self.breaker.record_success()
+                ok = True
+                return text
+            finally:
+                lane.release(ok)
+
+    def stream(self, messages: List[Dict], lane: str = 'interactive', model: str = None,
+               max_tokens: int = 500, system: str = None, timeout: float = None,
+               purpose: str = None) -> Iterator[str]:
+        """Yield text pieces as the backend produces them (never coalesced)
+
+        The lane slot is held until the generator is exhausted or closed.
+        """
+        lane_obj = self._lane(lane)
+        request = self._request(messages, model, max_tokens, system)
+        timeout = timeout or lane_obj.timeout
+        attributes = {"llm.model": request['model'], "llm.lane": lane, "llm.purpose": purpose or "",
+                      "llm.backend": self.backend.name, "llm.stream": True}
+
+        with trace_span("llm.messages.stream", attributes, kind="client"):
+            if not lane_obj.acquire():
+                raise LLMTimeout(f"No free {lane} slot within {lane_obj.queue_timeout}s")
+            ok = False
+            probe = False
+            recorded = False
+            try:
+                probe = self.breaker.before_call()
+                try:
+                    for text in self.backend.stream(request, timeout):
+                        yield text
+                except GeneratorExit:
+                    raise  # Consumer went away: neither a success nor a failure
+                except Exception:
+                    recorded = True
+                    self.breaker.record_failure()
+                    raise
+                recorded = True
+                self.breaker.record_success()
+                ok = True
+            finally:
+                if probe and not recorded:
+                    self.breaker.release_probe()
+                lane_obj.release(ok)
+
+    def stats(self) -> Dict:
+        return {
+            'backend': self.backend.name,
+            'breaker': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'coalesced': self.coalesced,
+            'in_flight_keys': len(self.inflight),
+            'lanes': {name: dict(lane.stats, concurrency=lane.concurrency) for name, lane in self.lanes.items()},
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway (created on first use)"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send one prompt through the LLM gateway')
+    parser.add_argument('prompt')
+    parser.add_argument('--lane', default='interactive', choices=sorted(GATEWAY_CONFIG['LANES']))
+    parser.add_argument('--model', default=None)
+    parser.add_argument('--max-tokens', type=int, default=300)
+    parser.add_argument('--stub', action='store_true', help='Use the offline stub backend')
+    parser.add_argument('--stream', action='store_true')
+    args = parser.parse_args()
+
+    gateway = get_gateway()
+    if args.stub:
+        gateway.use_backend(StubBackend())
+
+    messages = [{'role': 'user', 'content': args.prompt}]
+    if args.stream:
+        for text in gateway.stream(messages, lane=args.lane, model=args.model, max_tokens=args.max_tokens):
+            print(text, end='', flush=True)
+        print()
+    else:
+        print(gateway.complete(messages, lane=args.lane, model=args.model, max_tokens=args.max_tokens))
+    print(json.dumps(gateway.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
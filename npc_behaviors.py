@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+NPC BEHAVIORS
+==============
+Declarative NPC behavior tables (npc_behaviors.json), compiled at load time.
+
+The file holds ordered rules: "global" rules that apply to every NPC type,
+optionally narrowed with "types", then a list of rules per NPC type. Each
+rule has a "when" condition, and the decision it produces: action,
+priority, reasoning, and "target": "player" to target the first nearby
+player. The first matching rule wins. When no rule matches, the decision
+is "fallback".
+
+    "when": {"threat_level": {">": 40}, "players": true}      all must hold
+    "when": {"any": [{"health": {"<": 30}}, {...}]}           any may hold
+    fields: health (state), threat_level, time_of_day (context) - compared
+            with < <= > >= == != against numbers
+            players - someone nearby (nearby_players or player_nearby)
+
+Loading validates the file and generates one Python function per NPC type
+holding that type's rules as a plain if-chain. A type -> function dict
+dispatches to it, so a decision costs one dict lookup plus that type's
+rules, about as fast as the hand-written tree it replaces.
+npc_decision_engine.py compiles the same file into its vectorized table.
+The file is re-checked at most every CHECK_INTERVAL seconds and reloaded
+when it changes. An invalid edit is reported and the previous rules stay
+in effect.
+
+Usage:
+    from npc_behaviors import get_behaviors
+    decision = get_behaviors().decide(state, context)
+    get_behaviors().on_reload(lambda behaviors: ...)
+"""
+
+import os
+import json
+import math
+import time
+import hashlib
+import threading
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+BEHAVIOR_CONFIG = {
+    'PATH': os.getenv('NPC_BEHAVIORS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'npc_behaviors.json')),
+    'CHECK_INTERVAL': 1.0,   # Seconds between file change checks
+}
+
+# Rule field -> (where it is read from, key)
+FIELDS = {
+    'health': ('state', 'health'),
+    'threat_level': ('context', 'threat_level'),
+    'time_of_day': ('context', 'time_of_day'),
+}
+OPERATORS = ('<', '<=', '>', '>=', '==', '!=')
+TARGETS = (None, 'player')
+
+
+class BehaviorError(ValueError):
+    """The behavior file is not valid"""
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def _number(value, where: str):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise BehaviorError(f"{where}: expected a number, got {value!r}")
+    return value
+
+
+def _text(value, where: str) -> str:
+    if not isinstance(value, str) or not value:
+        raise BehaviorError(f"{where}: expected a non-empty string, got {value!r}")
+    return value
+
+
+def parse_condition(when, where: str) -> Tuple:
+    """JSON condition -> ('all', [...]) / ('any', [...]) / ('cmp', field, op, value) / ('players', bool)"""
+    if when is None:
+        return ('all', [])
+    if not isinstance(when, dict):
+        raise BehaviorError(f"{where}: condition must be an object")
+    parts = []
+    for key, value in when.items():
+        if key in ('any', 'all'):
+            if not isinstance(value, list) or not value:
+                raise BehaviorError(f"{where}.{key}: expected a non-empty list")
+            parts.append((key, [parse_condition(item, f"{where}.{key}[{i}]") for i, item in enumerate(value)]))
+        elif key == 'players':
+            if not isinstance(value, bool):
+                raise BehaviorError(f"{where}.players: expected true or false")
+            parts.append(('players', value))
+        elif key in FIELDS:
+            if not isinstance(value, dict) or not value:
+                raise BehaviorError(f"{where}.{key}: expected {{operator: number}}")
+            for op, threshold in value.items():
+                if op not in OPERATORS:
+                    raise BehaviorError(f"{where}.{key}: unknown operator {op!r}")
+                parts.append(('cmp', key, op, _number(threshold, f"{where}.{key}.{op}")))
+        else:
+            raise BehaviorError(f"{where}: unknown field {key!r}")
+    return parts[0] if len(parts) == 1 else ('all', parts)
+
+
+def _parse_rule(rule, where: str, types: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    if not isinstance(rule, dict):
+        raise BehaviorError(f"{where}: rule must be an object")
+    unknown = set(rule) - {'types', 'when', 'action', 'priority', 'target', 'reasoning'}
+    if unknown:
+        raise BehaviorError(f"{where}: unknown keys {sorted(unknown)}")
+    if 'types' in rule:
+        if types is not None:
+            raise BehaviorError(f"{where}: 'types' is only allowed on global rules")
+        if not isinstance(rule['types'], list) or not rule['types']:
+            raise BehaviorError(f"{where}.types: expected a non-empty list")
+        types = tuple(_text(name, f"{where}.types") for name in rule['types'])
+    target = rule.get('target')
+    if target not in TARGETS:
+        raise BehaviorError(f"{where}.target: expected \"player\" or nothing")
+    priority = rule.get('priority', 0)
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        raise BehaviorError(f"{where}.priority: expected an integer")
+    reasoning = rule.get('reasoning', '')
+    if not isinstance(reasoning, str):
+        raise BehaviorError(f"{where}.reasoning: expected a string")
+    return {
+        'types': types,
+        'when': parse_condition(rule.get('when'), f"{where}.when"),
+        'action': _text(rule.get('action'), f"{where}.action"),
+        'priority': priority,
+        'target': target == 'player',
+        'reasoning': reasoning,
+    }
+
+
+def parse_behaviors(document) -> Dict[str, Any]:
+    """Validate a behavior document -> spec with one flat, ordered rule list"""
+    if not isinstance(document, dict):
+        raise BehaviorError("Behavior file must hold a JSON object")
+    defaults = document.get('defaults', {})
+    spec_defaults = {
+        'type': _text(defaults.get('type', 'CITIZEN'), 'defaults.type'),
+        **{field: _number(defaults.get(field, default), f"defaults.{field}")
+           for field, default in (('health', 100), ('threat_level', 0), ('time_of_day', 12))},
+    }
+
+    fallback = document.get('fallback', {'action': 'IDLE', 'priority': 0, 'reasoning': ''})
+    fallback = _parse_rule(dict(fallback, when=None), 'fallback', None)
+
+    rules = [_parse_rule(rule, f"global[{i}]", None) for i, rule in enumerate(document.get('global', []))]
+    types = document.get('types', {})
+    if not isinstance(types, dict):
+        raise BehaviorError("'types' must map NPC type -> rule list")
+    for name, type_rules in types.items():
+        if not isinstance(type_rules, list):
+            raise BehaviorError(f"types.{name}: expected a rule list")
+        rules.extend(_parse_rule(rule, f"types.{name}[{i}]", (name,)) for i, rule in enumerate(type_rules))
+
+    names = list(types)
+    for rule in rules:
+        for name in rule['types'] or ():
+            if name not in names:
+                names.append(name)
+    return {'defaults': spec_defaults, 'fallback': fallback, 'rules': rules, 'types': names}
+
+
+# ============================================================================
+# COMPILATION
+# ============================================================================
+
+def _expression(node) -> str:
+    kind = node[0]
+    if kind == 'cmp':
+        _, field, op, value = node
+        return f"{field} {op} {value!r}"
+    if kind == 'players':
+        return "has_players" if node[1] else "not has_players"
+    if not node[1]:
+        return "True"
+    joiner = " and " if kind == 'all' else " or "
+    return "(" + joiner.join(_expression(child) for child in node[1]) + ")"
+
+
+def _decision(rule) -> str:
+    target = "players[0] if players else None" if rule['target'] else "None"
+    return (f"{{'action': {rule['action']!r}, 'target': {target}, "
+            f"'priority': {rule['priority']!r}, 'reasoning': {rule['reasoning']!r}}}")
+
+
+def _type_function(name: str, rules: List[Dict], fallback: Dict) -> List[str]:
+    lines = [f"def {name}(health, threat_level, time_of_day, has_players, players):"]
+    for rule in rules:
+        condition = _expression(rule['when'])
+        if condition == "True":
+            lines.append(f"    return {_decision(rule)}")
+            return lines  # Unconditional - later rules are unreachable
+        lines.append(f"    if {condition}:")
+        lines.append(f"        return {_decision(rule)}")
+    lines.append(f"    return {_decision(fallback)}")
+    return lines
+
+
+def compile_decider(spec: Dict[str, Any]) -> Callable[[Dict, Dict], Dict]:
+    """decide(state, context) with each NPC type's rules as generated Python"""
+    defaults = spec['defaults']
+    source, dispatch = [], {}
+    for index, npc_type in enumerate(spec['types']):
+        rules = [rule for rule in spec['rules'] if rule['types'] is None or npc_type in rule['types']]
+        source += _type_function(f"_type_{index}", rules, spec['fallback'])
+        dispatch[npc_type] = f"_type_{index}"
+    source += _type_function("_other_type", [rule for rule in spec['rules'] if rule['types'] is None], spec['fallback'])
+    source += [
+        "def decide(state, context):",
+        f"    npc_type = state.get('type', {defaults['type']!r})",
+        f"    health = state.get('health', {defaults['health']!r})",
+        f"    threat_level = context.get('threat_level', {defaults['threat_level']!r})",
+        f"    time_of_day = context.get('time_of_day', {defaults['time_of_day']!r})",
+        "    players = context.get('nearby_players', [])",
+        "    has_players = bool(players) or bool(context.get('player_nearby'))",
+        "    try:",
+        "        rules = _DISPATCH.get(npc_type, _other_type)",
+        "    except TypeError:  # Unhashable type value",
+        "        rules = _other_type",
+        "    return rules(health, threat_level, time_of_day, has_players, players)",
+    ]
+    namespace = {'__builtins__': {'bool': bool, 'TypeError': TypeError}}
+    exec(compile("\n".join(source), '<npc_behaviors>', 'exec'), namespace)
+    namespace['_DISPATCH'] = {npc_type: namespace[function] for npc_type, function in dispatch.items()}
+    return namespace['decide']
+
+
+# ============================================================================
+# HOT-RELOADING BEHAVIOR SET
+# ============================================================================
+
+class BehaviorSet:
+    """Compiled behavior file, reloaded when it changes on disk"""
+
+    def __init__(self, path: str = None, config: Dict = None):
+        self.config = config or BEHAVIOR_CONFIG
+        self.path = path or self.config['PATH']
+        self.lock = threading.Lock()
+        self.listeners: List[Callable[['BehaviorSet'], None]] = []
+        self.mtime = None
+        self.next_check = 0.0
+        self.last_error = None
+        self.reloads = 0
+        self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        mtime = os.stat(self.path).st_mtime_ns
+        try:
+            document = json.loads(raw)
+        except ValueError as e:
+            raise BehaviorError(f"{self.path}: {e}") from e
+        spec = parse_behaviors(document)
+        decide = compile_decider(spec)
+        # Swap everything at once so readers never see a half-loaded set
+        self.document, self.spec, self.decide_fn = document, spec, decide
+        self.version = hashlib.sha256(raw).hexdigest()[:12]
+        self.mtime = mtime
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """Recompile if the file changed; returns True when new rules were loaded"""
+        now = time.monotonic()
+        if not force and now < self.next_check:
+            return False
+        with self.lock:
+            self.next_check = now + self.config['CHECK_INTERVAL']
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                self.last_error = str(e)
+                return False
+            if not force and mtime == self.mtime:
+                return False
+            previous = self.version
+            try:
+                self._load()
+            except (OSError, BehaviorError) as e:
+                self.mtime = mtime  # Don't retry the same broken edit every check
+                self.last_error = str(e)
+                print(f"⚠ NPC behaviors not reloaded, keeping version {previous}: {e}")
+                return False
+            self.last_error = None
+            if self.version == previous:
+                return False
+            self.reloads += 1
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(self)
+        return True
+
+    def decide(self, state: Dict, context: Dict) -> Dict:
+        if time.monotonic() >= self.next_check:
+            self.reload_if_changed()
+        return self.decide_fn(state, context)
+
+    def on_reload(self, listener: Callable[['BehaviorSet'], None]):
+        self.listeners.append(listener)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'version': self.version,
+            'types': self.spec['types'],
+            'rules': len(self.spec['rules']),
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+        }
+
+
+_behaviors = None
+_behaviors_lock = threading.Lock()
+
+
+def get_behaviors() -> BehaviorSet:
+    """Process-wide behavior set (loaded on first use)"""
+    global _behaviors
+    with _behaviors_lock:
+        if _behaviors is None:
+            _behaviors = BehaviorSet()
+        return _behaviors
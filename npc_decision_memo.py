@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+NPC DECISION MEMO
+==================
+A crowd of thousands of NPCs is in a few hundred distinct situations, so
+/npc-decisions remembers which rule won for each situation and only sends
+situations it has not seen before through the vectorized rule table
+(npc_decision_engine.py).
+
+A situation is (type, one bucket per numeric field, players nearby). The
+buckets come from the thresholds the rules actually compare each field
+against, not from fixed steps: a value is either strictly between two
+thresholds or exactly on one, which is all a <, <=, >, >=, == or !=
+comparison can tell apart. Every NPC in a situation therefore gets the rule
+the table would pick for it.
+
+Hits return the winning rule's decision directly - one shared dict for
+rules without a target, a fresh dict targeting players[0] otherwise. The
+shared dicts are read-only. Inputs the memo can't bucket (non-numbers, NaN,
+malformed dicts) are decided with the misses by NPCBatch.pack, so they get
+the same per-NPC errors as decide_many. The memo starts over when the
+behavior file is reloaded (a new RuleTable) or when it grows past
+MAX_ENTRIES.
+
+Buckets are cached per int value, which is what the game sends for threat,
+hour and most health values. Fractional floats never repeat, so bisecting
+them on every call costs more than the rules themselves: when most of a
+call's NPCs carry such values, the next RETRY_AFTER calls skip the memo and
+go straight to the rule table.
+
+Usage:
+    memo = DecisionMemo()
+    decisions, errors = memo.decide_many([(state, context), ...], ids)  # same as decide_many
+    memo.report()  # hits, misses, bypassed, invalidations, entries, hit_ratio
+"""
+
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Any, Tuple, Callable, Iterable
+
+from npc_decision_engine import NPCBatch, RuleTable, current_rules
+
+MEMO_CONFIG = {
+    'MAX_ENTRIES': 10000,       # Distinct situations kept before the memo starts over
+    'MAX_CACHED_VALUES': 4096,  # Per field: int value -> bucket lookups kept (checked once per call)
+    'MIN_CACHEABLE_RATIO': 0.5, # Share of a call's NPCs that must have cacheable (int) values...
+    'RETRY_AFTER': 20,          # ...or this many calls skip the memo and go straight to the rule table
+}
+
+_PLAIN_NUMBERS = (int, float)
+_FIELDS = ('health', 'threat_level', 'time_of_day')
+
+
+def rule_thresholds(spec: Dict[str, Any]) -> Dict[str, List]:
+    """Every value each numeric field is compared against, sorted"""
+    found = {field: set() for field in _FIELDS}
+
+    def walk(node):
+        if node[0] == 'cmp':
+            found[node[1]].add(node[3])
+        elif node[0] in ('all', 'any'):
+            for child in node[1]:
+                walk(child)
+
+    for rule in spec['rules']:
+        walk(rule['when'])
+    return {field: sorted(values) for field, values in found.items()}
+
+
+def _bucket(value, thresholds: List, cache: Dict) -> int:
+    """Thresholds below the value + thresholds at or below it: 0 below the first, 1 on it, 2 past it, ..."""
+    bucket = cache.get(value)
+    if bucket is None:
+        if value != value:
+            raise TypeError("NaN compares false against every threshold")
+        bucket = bisect_left(thresholds, value) + bisect_right(thresholds, value)
+        if type(value) is int:  # Game values repeat; arbitrary floats would just fill the cache
+            cache[value] = bucket
+    return bucket
+
+
+def _decide(rules: RuleTable, batch: NPCBatch) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """Winning rule + decision per NPC, like decide_batch but for the given table"""
+    winner = rules.match(batch).tolist()
+    decisions = []
+    for rule, first in zip(winner, batch.first_player):
+        action, priority, target, reasoning = rules.templates[rule]
+        decisions.append({
+            "action": action,
+            "target": first if target else None,
+            "priority": priority,
+            "reasoning": reasoning,
+        })
+    return winner, decisions
+
+
+class DecisionMemo:
+    """Situation -> winning rule, in front of the vectorized rule table"""
+
+    def __init__(self, rules: Callable[[], RuleTable] = current_rules, config: Dict = None):
+        self.config = config or MEMO_CONFIG
+        self.rules_source = rules
+        self.rules = None
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'invalidations': 0, 'skipped': 0}
+        self.skip_calls = 0
+        self.entries: Dict[tuple, int] = {}
+
+    def _use(self, rules: RuleTable):
+        """Rebuild thresholds and templates for a new rule table; drops cached situations"""
+        thresholds = rule_thresholds(rules.spec)
+        self.thresholds = [thresholds[field] for field in _FIELDS]
+        self.bucket_caches = [{} for _ in _FIELDS]
+        # Decisions without a target are the same for every NPC in the situation - built once
+        self.shared = [
+            None if target else {"action": action, "target": None, "priority": priority, "reasoning": reasoning}
+            for action, priority, target, reasoning in rules.templates
+        ]
+        if self.entries:
+            self.stats['invalidations'] += 1
+        self.entries = {}
+        self.rules = rules
+
+    def invalidate(self):
+        with self.lock:
+            if self.rules is not None:
+                self._use(self.rules)
+
+    def decide_many(self, items: Iterable[Tuple[Dict, Dict]], ids: Iterable = None) -> Tuple[Dict[Any, Dict], Dict[Any, str]]:
+        """Same ({id: decision}, {id: error}) as npc_decision_engine.decide_many"""
+        items = list(items)
+        ids = range(len(items)) if ids is None else list(ids)
+        rules = self.rules_source()
+        defaults = rules.spec['defaults']
+        with self.lock:
+            skip = self.skip_calls > 0
+            if skip:
+                self.skip_calls -= 1
+                self.stats['skipped'] += len(items)
+        if skip:
+            batch, errors = NPCBatch.pack(items, ids, defaults)
+            return dict(zip(batch.ids, _decide(rules, batch)[1])), errors
+
+        with self.lock:
+            if rules is not self.rules:
+                self._use(rules)
+            entries, shared, templates = self.entries, self.shared, rules.templates
+            for cache in self.bucket_caches:
+                if len(cache) > self.config['MAX_CACHED_VALUES']:
+                    cache.clear()
+            health_ts, threat_ts, hour_ts = self.thresholds
+            health_cache, threat_cache, hour_cache = self.bucket_caches
+
+        default_type, default_health = defaults['type'], defaults['health']
+        default_threat, default_hour = defaults['threat_level'], defaults['time_of_day']
+        plain = _PLAIN_NUMBERS
+        # One slot per NPC, in request order
+        results = [None] * len(items)
+        # Unseen situations (key) and unbucketable inputs (key None), decided together below
+        missed_rows, missed, missed_keys = [], [], []
+        bypassed = uncached = 0
+        row = -1
+
+        for state, context in items:
+            row += 1
+            try:
+                health = state.get('health', default_health)
+                threat = context.get('threat_level', default_threat)
+                hour = context.get('time_of_day', default_hour)
+                # Plain int/float only - a Decimal would hash like the int it equals, but pack() rejects it
+                if type(health) not in plain or type(threat) not in plain or type(hour) not in plain:
+                    raise TypeError
+                players = context.get('nearby_players', [])
+                first = players[0] if players else None
+                # The type itself, not its code: unknown types just get their own situations
+                npc_type = state.get('type', default_type)
+                has_players = True if players else bool(context.get('player_nearby'))
+                key = (npc_type, health_cache.get(health), threat_cache.get(threat), hour_cache.get(hour), has_players)
+                rule = entries.get(key)  # TypeError for an unhashable type
+                if rule is None:
+                    # A value not seen before (no cached bucket) or a new situation
+                    key = (npc_type, _bucket(health, health_ts, health_cache), _bucket(threat, threat_ts, threat_cache),
+                           _bucket(hour, hour_ts, hour_cache), has_players)
+                    rule = entries.get(key)
+                    if health not in health_cache or threat not in threat_cache or hour not in hour_cache:
+                        uncached += 1  # Fractional float - bisected again every time it is seen
+            except (AttributeError, TypeError, KeyError, IndexError, ValueError):
+                bypassed += 1
+                missed_rows.append(row)
+                missed.append((state, context))
+                missed_keys.append(None)
+                continue
+
+            if rule is None:
+                missed_rows.append(row)
+                missed.append((state, context))
+                missed_keys.append(key)
+                continue
+            decision = shared[rule]
+            if decision is None:
+                action, priority, _, reasoning = templates[rule]
+                decision = {"action": action, "target": first, "priority": priority, "reasoning": reasoning}
+            results[row] = decision
+
+        errors = {}
+        if missed:
+            batch, bad = NPCBatch.pack(missed, range(len(missed)), defaults)
+            errors = {ids[missed_rows[index]]: error for index, error in bad.items()}
+            winner, decided = _decide(rules, batch)
+            learned = {}
+            for index, rule, decision in zip(batch.ids, winner, decided):
+                results[missed_rows[index]] = decision
+                if missed_keys[index] is not None:
+                    learned[missed_keys[index]] = rule
+
+            with self.lock:
+                if self.rules is rules:
+                    if len(self.entries) + len(learned) > self.config['MAX_ENTRIES']:
+                        self.entries.clear()
+                    self.entries.update(learned)
+        with self.lock:
+            self.stats['hits'] += len(items) - len(missed)
+            self.stats['misses'] += len(missed) - bypassed
+            self.stats['bypassed'] += bypassed
+            if uncached + bypassed > len(items) * (1 - self.config['MIN_CACHEABLE_RATIO']):
+                # Mostly values that are never cached - bucketing them costs more than the rule table
+                self.skip_calls = self.config['RETRY_AFTER']
+
+        # Same dict as decide_many builds: request order, a repeated id keeps its last decision
+        if errors:
+            decisions = {npc_id: decision for npc_id, decision in zip(ids, results) if decision is not None}
+        else:
+            decisions = dict(zip(ids, results))
+        return decisions, errors
+
+    def report(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'entries': len(self.entries),
+            'hit_ratio': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+        }
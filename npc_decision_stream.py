@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+NPC DECISION STREAM
+====================
+Pushes NPC decisions to subscribers only when they change.
+
+The hub keeps the last published (action, target, priority) per NPC. Each
+publish() diffs the new decisions against it and broadcasts one "delta" event
+holding just the NPCs that changed (plus any that were removed), so traffic
+and client-side parsing follow how much the world changes, not how many NPCs
+exist. Subscribers get a "keyframe" with every current decision when they
+connect and every KEYFRAME_INTERVAL seconds after that, so a client that
+missed something can resync. A subscriber whose queue fills up stops
+receiving deltas and gets a keyframe instead.
+
+Every event carries a sequence number. A delta with seq N follows seq N-1.
+A client that sees a gap waits for the next keyframe.
+
+NPCs leave the hub when a caller passes them as removed (world removals) or
+when nothing has been published for them for NPC_TTL seconds (NPCs that
+despawned without telling anyone). Either way they go out as "removed".
+
+Usage:
+    hub = DecisionStream()
+    hub.publish({"n1": decision, ...})           # from any decision endpoint
+    for event, payload in hub.events():           # one subscriber (blocking generator)
+        ...
+"""
+
+import json
+import queue
+import threading
+import time
+from typing import Dict, Any, Iterable, Iterator, Tuple
+
+STREAM_CONFIG = {
+    'KEYFRAME_INTERVAL': 10.0,  # Seconds between full resync events
+    'HEARTBEAT': 4.0,           # Idle seconds before a keep-alive is sent (must be < KEYFRAME_INTERVAL)
+    'NPC_TTL': 120.0,           # Seconds without a publish before an NPC is dropped
+    'SWEEP_INTERVAL': 5.0,      # Seconds between checks for expired NPCs
+    'QUEUE_SIZE': 256,          # Deltas buffered per subscriber before it is resynced
+    'MAX_SUBSCRIBERS': 32,
+}
+
+KEYFRAME = 'keyframe'
+DELTA = 'delta'
+HEARTBEAT = 'heartbeat'
+
+
+def _target_key(target):
+    # Targets are usually player dicts; compare them by id
+    if isinstance(target, dict):
+        return target.get('id', json.dumps(target, sort_keys=True, default=str))
+    return target
+
+
+class StreamFull(Exception):
+    """MAX_SUBSCRIBERS already connected"""
+
+
+class DecisionStream:
+    """Last-known decisions + fan-out of changes to subscriber queues"""
+
+    def __init__(self, config: Dict = None):
+        self.config = config or STREAM_CONFIG
+        self.lock = threading.Lock()
+        self.decisions: Dict[str, Dict[str, Any]] = {}
+        self.summaries: Dict[str, tuple] = {}
+        self.published_at: Dict[str, float] = {}
+        self.next_sweep = 0.0
+        self.seq = 0
+        self.subscribers = []
+        self.stats = {'published': 0, 'changed': 0, 'unchanged': 0, 'deltas': 0, 'resyncs': 0, 'expired': 0}
+
+    def publish(self, decisions: Dict[Any, Dict[str, Any]], removed: Iterable = ()) -> int:
+        """Record decisions; broadcast the ones whose action/target/priority changed. Returns how many changed"""
+        changed = {}
+        now = time.monotonic()
+        with self.lock:
+            for npc_id, decision in decisions.items():
+                npc_id = str(npc_id)
+                summary = (decision.get('action'), _target_key(decision.get('target')), decision.get('priority'))
+                self.decisions[npc_id] = decision
+                self.published_at[npc_id] = now
+                if self.summaries.get(npc_id) != summary:
+                    self.summaries[npc_id] = summary
+                    changed[npc_id] = decision
+            gone = [npc_id for npc_id in map(str, removed) if self._drop(npc_id)]
+            if now >= self.next_sweep:
+                self.next_sweep = now + self.config['SWEEP_INTERVAL']
+                cutoff = now - self.config['NPC_TTL']
+                expired = [npc_id for npc_id, seen in self.published_at.items() if seen < cutoff]
+                for npc_id in expired:
+                    self._drop(npc_id)
+                self.stats['expired'] += len(expired)
+                gone.extend(expired)
+
+            self.stats['published'] += len(decisions)
+            self.stats['changed'] += len(changed)
+            self.stats['unchanged'] += len(decisions) - len(changed)
+            if not changed and not gone:
+                return 0
+
+            self.seq += 1
+            payload = {'seq': self.seq, 'changed': changed}
+            if gone:
+                payload['removed'] = gone
+            self.stats['deltas'] += 1
+            for subscriber in self.subscribers:
+                if subscriber['resync']:
+                    continue
+                try:
+                    subscriber['queue'].put_nowait((DELTA, payload))
+                except queue.Full:
+                    # Too far behind - drop deltas until its next keyframe
+                    subscriber['resync'] = True
+                    self.stats['resyncs'] += 1
+        return len(changed)
+
+    def _drop(self, npc_id: str) -> bool:
+        self.published_at.pop(npc_id, None)
+        self.decisions.pop(npc_id, None)
+        return self.summaries.pop(npc_id, None) is not None
+
+    def keyframe(self, subscriber: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Every current decision; resets `subscriber` so its next delta follows this seq"""
+        with self.lock:
+            if subscriber is not None:
+                # Anything queued is already included in the snapshot
+                while not subscriber['queue'].empty():
+                    subscriber['queue'].get_nowait()
+                subscriber['resync'] = False
+            return {'seq': self.seq, 'decisions': dict(self.decisions)}
+
+    def subscribe(self) -> Dict[str, Any]:
+        with self.lock:
+            if len(self.subscribers) >= self.config['MAX_SUBSCRIBERS']:
+                raise StreamFull(f"Too many stream subscribers (max {self.config['MAX_SUBSCRIBERS']})")
+            subscriber = {'queue': queue.Queue(self.config['QUEUE_SIZE']), 'resync': False}
+            self.subscribers.append(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber: Dict[str, Any]):
+        with self.lock:
+            self.subscribers = [other for other in self.subscribers if other is not subscriber]
+
+    def events(self, subscriber: Dict[str, Any] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(event, payload) pairs for one subscriber: keyframe, then deltas, keyframes and heartbeats"""
+        subscriber = subscriber or self.subscribe()
+        interval = self.config['KEYFRAME_INTERVAL']
+        try:
+            next_keyframe = 0.0
+            while True:
+                now = time.monotonic()
+                if now >= next_keyframe or subscriber['resync']:
+                    next_keyframe = now + interval
+                    yield KEYFRAME, self.keyframe(subscriber)
+                    continue
+                try:
+                    event = subscriber['queue'].get(timeout=min(next_keyframe - now, self.config['HEARTBEAT']))
+                except queue.Empty:
+                    if time.monotonic() < next_keyframe:
+                        yield HEARTBEAT, {'seq': self.seq}
+                    continue
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'npcs': len(self.decisions),
+                'seq': self.seq,
+                'subscribers': len(self.subscribers),
+                **self.stats,
+            }
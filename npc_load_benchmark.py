@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+NPC LOAD BENCHMARK
+===================
+Load generator for the collaborative bridge's NPC endpoints.
+
+Synthesizes a seeded NPC population, for example 1k-50k NPCs in a mixed city.
+Each NPC gets a type mix, health, state, faction, a position around a few
+players, and a decision context. The generator then drives one or more
+endpoints at a fixed concurrency:
+
+    npc-decision    one NPC per request        POST /npc-decision
+    npc-decisions   --batch-size NPCs/request  POST /npc-decisions
+    world-update    --batch-size NPCs moved    POST /world/update
+    world-tick      --batch-size NPCs moved    POST /world/tick (LOD-scheduled)
+
+Each run reports throughput (requests/s and decisions/s), p50/p95/p99 latency,
+error rate and server RSS, as JSON. RSS is sampled from /health while the run
+is going. Save a run with --output and pass it as --baseline next time to get
+before/after ratios.
+
+Usage:
+    python npc_load_benchmark.py --npcs 10000 --endpoints npc-decisions --batch-size 500 --concurrency 8
+    python npc_load_benchmark.py --npcs 2000 --endpoints npc-decision --requests 5000 --output before.json
+    python npc_load_benchmark.py --npcs 2000 --endpoints npc-decision --requests 5000 --baseline before.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+import requests
+
+BENCH_CONFIG = {
+    'BASE_URL': os.getenv('BRIDGE_URL', 'http://localhost:5000'),
+    'TIMEOUT': 30,               # Seconds per request
+    'RSS_SAMPLE_INTERVAL': 0.5,  # Seconds between /health samples
+    'PLAYERS': 8,
+    'AREA': 2000.0,              # World is AREA x AREA around the origin
+}
+
+# Rough city population; MEDIC exercises the "type without rules" path
+NPC_MIX = {'CITIZEN': 0.45, 'TRADER': 0.15, 'GUARD': 0.2, 'RAIDER': 0.15, 'MEDIC': 0.05}
+FACTIONS = {'CITIZEN': 'CITY', 'TRADER': 'CITY', 'GUARD': 'CITY', 'MEDIC': 'CITY', 'RAIDER': 'RAIDERS'}
+STATES = ['IDLE', 'PATROL', 'ALERT', 'COMBAT']
+ENDPOINTS = ('npc-decision', 'npc-decisions', 'world-update', 'world-tick')
+
+
+# ============================================================================
+# POPULATION
+# ============================================================================
+
+def synthesize_population(count: int, seed: int = 1, players: int = None) -> Dict[str, Any]:
+    """Seeded NPCs + players; NPCs cluster around players so proximity and threat vary"""
+    rng = random.Random(seed)
+    area = BENCH_CONFIG['AREA']
+    players = BENCH_CONFIG['PLAYERS'] if players is None else players
+    player_list = [{
+        'id': f"player_{i}",
+        'position': [rng.uniform(-area / 2, area / 2), 0.0, rng.uniform(-area / 2, area / 2)],
+        'health': rng.randint(40, 100),
+    } for i in range(players)]
+
+    types, weights = list(NPC_MIX), list(NPC_MIX.values())
+    npcs = []
+    for i in range(count):
+        npc_type = rng.choices(types, weights)[0]
+        if player_list and rng.random() < 0.6:
+            anchor = rng.choice(player_list)['position']
+            position = [anchor[0] + rng.gauss(0, 60), 0.0, anchor[2] + rng.gauss(0, 60)]
+        else:
+            position = [rng.uniform(-area / 2, area / 2), 0.0, rng.uniform(-area / 2, area / 2)]
+        threat = rng.choice([0, 0, 0, 10, 25, 45, 75, 90]) if npc_type != 'RAIDER' else rng.choice([0, 30, 60])
+        nearby = [p['id'] for p in player_list
+                  if abs(p['position'][0] - position[0]) < 30 and abs(p['position'][2] - position[2]) < 30]
+        npcs.append({
+            'id': f"npc_{i}",
+            'type': npc_type,
+            'health': rng.choice([100, 100, 90, 75, 50, 25, 10]),
+            'state': rng.choice(STATES),
+            'faction': FACTIONS[npc_type],
+            'position': position,
+            'context': {
+                'threat_level': threat,
+                'nearby_players': nearby,
+                'player_nearby': bool(nearby),
+                'time_of_day': rng.randint(0, 23),
+            },
+        })
+    return {'npcs': npcs, 'players': player_list, 'seed': seed}
+
+
+def _state(npc: Dict) -> Dict:
+    return {'type': npc['type'], 'health': npc['health'], 'state': npc['state']}
+
+
+def _world_npc(npc: Dict, rng: random.Random = None) -> Dict:
+    position = npc['position']
+    if rng is not None:
+        position = [position[0] + rng.uniform(-2, 2), 0.0, position[2] + rng.uniform(-2, 2)]
+        npc['position'] = position
+    return {'id': npc['id'], 'type': npc['type'], 'health': npc['health'], 'state': npc['state'],
+            'faction': npc['faction'], 'position': position}
+
+
+def _chunks(items: List, size: int) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def build_requests(endpoint: str, population: Dict, batch_size: int, seed: int = 1) -> List[Tuple[str, Any, int]]:
+    """(path, JSON body, NPCs in the request) for one pass over the population"""
+    npcs = population['npcs']
+    if endpoint == 'npc-decision':
+        return [('/npc-decision', {'state': _state(npc), 'context': npc['context']}, 1) for npc in npcs]
+    if endpoint == 'npc-decisions':
+        return [('/npc-decisions', {'npcs': [{'id': npc['id'], 'state': _state(npc), 'context': npc['context']}
+                                             for npc in chunk]}, len(chunk))
+                for chunk in _chunks(npcs, batch_size)]
+
+    rng = random.Random(seed)
+    path = '/world/update' if endpoint == 'world-update' else '/world/tick'
+    bodies = []
+    for chunk in _chunks(npcs, batch_size):
+        body = {'npcs': [_world_npc(npc, rng) for npc in chunk], 'players': population['players'], 'time_of_day': 14}
+        if endpoint == 'world-update':
+            body['ids'] = [npc['id'] for npc in chunk]
+        bodies.append((path, body, len(chunk)))
+    return bodies
+
+
+def seed_world(session: requests.Session, base_url: str, population: Dict):
+    """Load every NPC once so world-update / world-tick measure steady state, not first insert"""
+    for chunk in _chunks(population['npcs'], 5000):
+        response = session.post(f"{base_url}/world/update", timeout=BENCH_CONFIG['TIMEOUT'],
+                                json={'npcs': [_world_npc(npc) for npc in chunk],
+                                      'players': population['players'], 'decide': False})
+        response.raise_for_status()
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _decisions_in(body: Dict, sent: int) -> int:
+    if 'decision' in body:
+        return 1
+    if 'worklist' in body:
+        return len(body['worklist'])
+    if 'decisions' in body:
+        return len(body['decisions'])
+    return body.get('count', sent)
+
+
+class RSSSampler(threading.Thread):
+    """Polls /health for the bridge's resident set size while a run is in progress"""
+
+    def __init__(self, base_url: str):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.samples: List[int] = []
+        self.stop_event = threading.Event()
+
+    def sample(self) -> Optional[int]:
+        try:
+            health = requests.get(f"{self.base_url}/health", timeout=5).json()
+            process = health.get('process') or {}
+            return process.get('rss_bytes', process.get('max_rss_bytes'))
+        except (requests.RequestException, ValueError):
+            return None
+
+    def run(self):
+        while not self.stop_event.wait(BENCH_CONFIG['RSS_SAMPLE_INTERVAL']):
+            rss = self.sample()
+            if rss is not None:
+                self.samples.append(rss)
+
+    def stop(self):
+        self.stop_event.set()
+        self.join(timeout=5)
+
+
+def run_load(base_url: str, work: List[Tuple[str, Any, int]], concurrency: int,
+             total_requests: int = None, duration: float = None) -> Dict[str, Any]:
+    """Send `work` round-robin from `concurrency` threads until the request count or duration is reached"""
+    total_requests = total_requests if total_requests is not None else (None if duration else len(work))
+    lock = threading.Lock()
+    state = {'next': 0}
+    latencies, errors = [], []
+    decisions = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def take() -> Optional[Tuple[str, Any, int]]:
+        with lock:
+            index = state['next']
+            if total_requests is not None and index >= total_requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            state['next'] += 1
+        return work[index % len(work)]
+
+    def worker():
+        session = requests.Session()
+        local_latencies, local_errors, local_decisions = [], [], 0
+        while True:
+            item = take()
+            if item is None:
+                break
+            path, body, sent = item
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}{path}", json=body, timeout=BENCH_CONFIG['TIMEOUT'])
+                elapsed = time.perf_counter() - start
+                if response.status_code != 200:
+                    local_errors.append(f"HTTP {response.status_code}: {response.text[:200]}")
+                else:
+                    local_decisions += _decisions_in(response.json(), sent)
+            except (requests.RequestException, ValueError) as e:
+                elapsed = time.perf_counter() - start
+                local_errors.append(f"{type(e).__name__}: {e}")
+            local_latencies.append(elapsed)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.extend(local_errors)
+            decisions[0] += local_decisions
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        'requests': count,
+        'errors': len(errors),
+        'error_rate': round(len(errors) / count, 4) if count else 0.0,
+        'decisions': decisions[0],
+        'duration_s': round(wall, 3),
+        'throughput': {
+            'requests_per_s': round(count / wall, 1) if wall else None,
+            'decisions_per_s': round(decisions[0] / wall, 1) if wall else None,
+        },
+        'latency_ms': {
+            'p50': _ms(percentile(ordered, 50)),
+            'p95': _ms(percentile(ordered, 95)),
+            'p99': _ms(percentile(ordered, 99)),
+            'mean': _ms(sum(ordered) / count) if count else None,
+            'max': _ms(ordered[-1]) if count else None,
+        },
+        'error_samples': errors[:5],
+    }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def compare(run: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """new / old ratios for the headline numbers (throughput > 1 and latency < 1 are better)"""
+    def ratio(new, old):
+        return round(new / old, 3) if new is not None and old else None
+    return {
+        'requests_per_s': ratio(run['throughput']['requests_per_s'], baseline['throughput']['requests_per_s']),
+        'decisions_per_s': ratio(run['throughput']['decisions_per_s'], baseline['throughput']['decisions_per_s']),
+        'p50': ratio(run['latency_ms']['p50'], baseline['latency_ms']['p50']),
+        'p99': ratio(run['latency_ms']['p99'], baseline['latency_ms']['p99']),
+    }
+
+
+def benchmark(endpoint: str, population: Dict, base_url: str, concurrency: int, batch_size: int,
+              total_requests: int = None, duration: float = None, warmup: int = 0) -> Dict[str, Any]:
+    """One endpoint run, with server RSS sampled around it"""
+    if endpoint in ('world-update', 'world-tick'):
+        seed_world(requests.Session(), base_url, population)
+    work = build_requests(endpoint, population, batch_size, seed=population['seed'])
+    if warmup:
+        run_load(base_url, work, concurrency, total_requests=warmup)
+
+    sampler = RSSSampler(base_url)
+    rss_start = sampler.sample()
+    sampler.start()
+    result = run_load(base_url, work, concurrency, total_requests=total_requests, duration=duration)
+    sampler.stop()
+    rss_end = sampler.sample()
+    samples = [rss for rss in [rss_start, *sampler.samples, rss_end] if rss is not None]
+
+    return {
+        'endpoint': endpoint,
+        'npcs': len(population['npcs']),
+        'batch_size': batch_size if endpoint != 'npc-decision' else 1,
+        'concurrency': concurrency,
+        **result,
+        'server_rss_bytes': {
+            'start': rss_start,
+            'peak': max(samples) if samples else None,
+            'end': rss_end,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the bridge NPC decision endpoints')
+    parser.add_argument('--url', default=BENCH_CONFIG['BASE_URL'])
+    parser.add_argument('--npcs', type=int, default=1000, help='Population size (e.g. 1000-50000)')
+    parser.add_argument('--players', type=int, default=BENCH_CONFIG['PLAYERS'])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--endpoints', default='npc-decision,npc-decisions',
+                        help=f"Comma-separated: {', '.join(ENDPOINTS)}")
+    parser.add_argument('--batch-size', type=int, default=500, help='NPCs per batch / world request')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=None, help='Requests per endpoint (default: one pass)')
+    parser.add_argument('--duration', type=float, default=None, help='Seconds per endpoint instead of --requests')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests first')
+    parser.add_argument('--label', default=None, help='Stored in the report, e.g. "baseline"')
+    parser.add_argument('--output', default=None, help='Write the JSON report here as well as stdout')
+    parser.add_argument('--baseline', default=None, help='Earlier report to compare against')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoint(s): {', '.join(unknown)}")
+
+    try:
+        requests.get(f"{args.url}/health", timeout=5).raise_for_status()
+    except requests.RequestException as e:
+        print(f"❌ Bridge not reachable at {args.url}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    population = synthesize_population(args.npcs, seed=args.seed, players=args.players)
+    print(f"Benchmarking {', '.join(endpoints)} with {args.npcs} NPCs at concurrency {args.concurrency}...",
+          file=sys.stderr)
+
+    runs = [benchmark(endpoint, population, args.url, args.concurrency, args.batch_size,
+                      total_requests=args.requests, duration=args.duration, warmup=args.warmup)
+            for endpoint in endpoints]
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline_runs = {run['endpoint']: run for run in json.load(f).get('runs', [])}
+        for run in runs:
+            if run['endpoint'] in baseline_runs:
+                run['vs_baseline'] = compare(run, baseline_runs[run['endpoint']])
+
+    report = {
+        'label': args.label,
+        'timestamp': time.time(),
+        'target': args.url,
+        'seed': args.seed,
+        'runs': runs,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+NPC LOD SCHEDULER
+==================
+Decides which NPCs get an AI decision this tick.
+
+Every NPC is put in a level-of-detail tier by distance to the nearest player;
+each tier has its own decision interval. NPCs that were recently active (their
+decision changed, or they are fighting / under threat) are promoted one tier so
+a brawl three blocks away still reacts in time. A global decisions-per-second
+budget (token bucket) caps the work per tick: when more NPCs are due than the
+budget allows, the closest tiers and the most overdue NPCs go first and the
+rest wait for the next tick.
+
+Usage:
+    scheduler = LODScheduler()
+    scheduler.assign({"n1": 12.0, "n2": 640.0})    # distance to nearest player; returns rescheduled ids
+    work = scheduler.tick()                          # {"worklist": ["n1", ...], "deferred": 0, ...}
+    scheduler.record_decision("n1", decision)        # marks activity when the decision changed
+"""
+
+import math
+import time
+import threading
+from typing import Dict, List, Any, Iterable, Optional
+
+LOD_CONFIG = {
+    # (tier name, max distance to nearest player, seconds between decisions)
+    'TIERS': [
+        ('near', 50.0, 0.5),
+        ('mid', 150.0, 2.0),
+        ('far', 400.0, 8.0),
+        ('dormant', math.inf, 30.0),
+    ],
+    'ACTIVE_WINDOW': 10.0,            # Seconds an NPC counts as active after a change
+    'ACTIVE_THREAT': 40,              # Threat at/above this counts as activity
+    'DECISIONS_PER_SECOND': 2000,     # Global budget across all NPCs
+    'BURST_SECONDS': 1.0,             # Unused budget carried over, at most this many seconds' worth
+}
+
+
+class LODScheduler:
+    """Per-NPC tier + next-update time under a global decision budget"""
+
+    def __init__(self, config: Dict = None):
+        self.config = config or LOD_CONFIG
+        self.tiers = self.config['TIERS']
+        self.entries: Dict[Any, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.tokens = float(self.config['DECISIONS_PER_SECOND'])
+        self.last_tick = None
+        self.stats = {'ticks': 0, 'scheduled': 0, 'deferred': 0}
+
+    def _tier_for(self, distance: float) -> int:
+        for index, (_, max_distance, _) in enumerate(self.tiers):
+            if distance <= max_distance:
+                return index
+        return len(self.tiers) - 1
+
+    def assign(self, distances: Dict[Any, float], now: float = None) -> List[Any]:
+        """Re-tier NPCs from their distance to the nearest player (new NPCs are due immediately)
+
+        Returns the NPCs whose next update time changed (new, or moved to a faster tier).
+        """
+        now = time.time() if now is None else now
+        window = self.config['ACTIVE_WINDOW']
+        rescheduled = []
+        with self.lock:
+            for npc_id, distance in distances.items():
+                entry = self.entries.get(npc_id)
+                if entry is None:
+                    entry = self.entries[npc_id] = {
+                        'tier': 0, 'next_update': now, 'last_update': None,
+                        'last_active': None, 'last_decision': None,
+                    }
+                    rescheduled.append(npc_id)
+                tier = self._tier_for(distance)
+                if entry['last_active'] is not None and now - entry['last_active'] < window:
+                    tier = max(0, tier - 1)
+                if tier < entry['tier'] and entry['last_update'] is not None:
+                    # Moved closer - don't make it wait out the old, longer interval
+                    sooner = entry['last_update'] + self.tiers[tier][2]
+                    if sooner < entry['next_update']:
+                        entry['next_update'] = sooner
+                        rescheduled.append(npc_id)
+                entry['tier'] = tier
+        return rescheduled
+
+    def mark_active(self, npc_id, now: float = None):
+        with self.lock:
+            entry = self.entries.get(npc_id)
+            if entry is not None:
+                entry['last_active'] = time.time() if now is None else now
+
+    def record_decision(self, npc_id, decision: Dict[str, Any], threat: float = 0, now: float = None):
+        """Remember the decision; a changed action/target or high threat marks the NPC active"""
+        now = time.time() if now is None else now
+        summary = (decision.get('action'), str(decision.get('target')), decision.get('priority'))
+        with self.lock:
+            entry = self.entries.get(npc_id)
+            if entry is None:
+                return
+            if summary != entry['last_decision'] or threat >= self.config['ACTIVE_THREAT']:
+                entry['last_active'] = now
+            entry['last_decision'] = summary
+
+    def remove(self, npc_ids: Iterable):
+        with self.lock:
+            for npc_id in npc_ids:
+                self.entries.pop(npc_id, None)
+
+    def tick(self, now: float = None) -> Dict[str, Any]:
+        """NPCs due for a decision now, within budget; their next update is scheduled"""
+        now = time.time() if now is None else now
+        rate = self.config['DECISIONS_PER_SECOND']
+        with self.lock:
+            if self.last_tick is not None:
+                elapsed = max(0.0, now - self.last_tick)
+                self.tokens = min(rate * self.config['BURST_SECONDS'], self.tokens + rate * elapsed)
+            self.last_tick = now
+
+            due = [(entry['tier'], entry['next_update'], npc_id)
+                   for npc_id, entry in self.entries.items() if entry['next_update'] <= now]
+            budget = int(self.tokens)
+            if len(due) > budget:
+                due.sort(key=lambda item: (item[0], item[1]))
+            chosen = due[:budget]
+
+            worklist = []
+            for tier, _, npc_id in chosen:
+                entry = self.entries[npc_id]
+                entry['last_update'] = now
+                entry['next_update'] = now + self.tiers[tier][2]
+                worklist.append(npc_id)
+
+            self.tokens -= len(worklist)
+            deferred = len(due) - len(worklist)
+            self.stats['ticks'] += 1
+            self.stats['scheduled'] += len(worklist)
+            self.stats['deferred'] += deferred
+
+        return {'worklist': worklist, 'deferred': deferred, 'time': now}
+
+    def next_updates(self, npc_ids: Optional[Iterable] = None) -> Dict[Any, float]:
+        with self.lock:
+            if npc_ids is None:
+                return {npc_id: entry['next_update'] for npc_id, entry in self.entries.items()}
+            return {npc_id: self.entries[npc_id]['next_update'] for npc_id in npc_ids if npc_id in self.entries}
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            counts = {name: 0 for name, _, _ in self.tiers}
+            for entry in self.entries.values():
+                counts[self.tiers[entry['tier']][0]] += 1
+            return {
+                'npcs': len(self.entries),
+                'tiers': counts,
+                'budget_per_second': self.config['DECISIONS_PER_SECOND'],
+                'tokens': round(self.tokens, 1),
+                **self.stats,
+            }
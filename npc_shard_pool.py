@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+NPC SHARD POOL
+===============
+Multi-process backend for the world endpoints (/world/update, /world/tick).
+
+For a large world nearly all of a request's time goes to per-NPC work:
+pairing every NPC with its neighbours, scoring threat, building the context
+and decision dicts and encoding them as JSON (NPCWorld.compute_columns,
+npc_decision_engine.decide_world). That work is split across worker
+processes here, so it no longer runs under the request thread's GIL.
+
+NPCs are sharded by id (crc32 of str(id), mod SHARDS - NPCWorld keeps it in
+its "id_hash" column). Each request copies the world's columns - positions,
+faction, threat inputs, type and health - into one shared-memory block
+(a few MB for 100k NPCs) and fans out only the NPC ids each worker's shards
+own. Every worker pairs its NPCs against the whole world in shared memory,
+decides them with the parent's rule table and sends back the contexts and
+decisions already encoded as JSON, plus the decision dicts for the
+decision stream. The parent splices the JSON into the response (fan-in).
+Results are identical to the in-process path (see test_npc_shard_pool.py).
+
+The pool holds no NPC state between requests: the world is the only copy,
+so NPCs removed from it are gone from the next request too.
+
+Shards are not tied to a process. When a worker dies, its shards are
+reassigned to the live workers and the request is retried. A replacement
+is spawned on the next request (up to MAX_RESTARTS) and the shards are
+spread evenly again. With no live workers the shards run in-process.
+
+The parent still parses the request, copies the columns, unpickles the
+decisions and publishes them, so throughput grows with cores until those
+serial steps dominate (about a tenth of the in-process time at 100k NPCs).
+Requests with fewer than MIN_NPCS NPCs, and machines with one core, decide
+in the request thread as before.
+
+Usage:
+    pool = ShardPool()                    # WORKERS / SHARDS / MIN_NPCS from SHARD_CONFIG
+    result = pool.decide_world(world, ids, time_of_day=14)
+    result['contexts']        # b'{"npc_1": {...}, ...}' - JSON, ready for the response
+    result['decisions']       # {id: decision}, like decide_world
+    result['decisions_json']  # the same decisions as JSON
+    result['threat'], result['errors']
+    pool.close()
+"""
+
+import os
+import json
+import atexit
+import threading
+import multiprocessing
+from itertools import compress
+from multiprocessing import connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Any, Iterable, Tuple
+
+import numpy as np
+
+from npc_decision_engine import (RuleTable, compile_rule_table, current_rules, decide_batch, decide_world,
+                                 health_errors, world_batch, _number)
+from npc_spatial_index import NPCWorld, npc_contexts
+
+_CORES = os.cpu_count() or 1
+
+SHARD_CONFIG = {
+    'WORKERS': int(os.getenv('NPC_SHARD_WORKERS', _CORES if _CORES > 1 else 0)),  # 0: always in-process
+    'SHARDS': int(os.getenv('NPC_SHARDS', 64)),  # Units handed to workers (and moved when one dies)
+    'MIN_NPCS': int(os.getenv('NPC_SHARD_MIN_NPCS', 5000)),  # Smaller requests decide in-process
+    'INITIAL_CAPACITY': 4096,    # NPC rows in the shared-memory block up front (grown to fit the world)
+    'START_METHOD': 'spawn',     # Don't fork the threaded Flask process
+    'WORKER_TIMEOUT': 30.0,      # Seconds to wait for a worker's shards before giving up on it
+    'MAX_RESTARTS': 16,          # Replacement workers spawned over the pool's lifetime
+}
+
+# NPCWorld columns the workers read, besides position
+SHARED_COLUMNS = ('faction', 'threat_health', 'alarmed', 'type', 'health', 'health_ok')
+
+
+class ShardPoolError(RuntimeError):
+    """The pool is closed or a worker failed on its shards"""
+
+
+def _layout(capacity: int) -> Tuple[Dict[str, Tuple[int, Any, Tuple[int, ...]]], int]:
+    """name -> (offset, dtype, shape) of every shared column, and the block size"""
+    columns = [('position', np.float64, (capacity, 3))]
+    columns += [(name, NPCWorld.NPC_COLUMNS[name], (capacity,)) for name in SHARED_COLUMNS]
+    layout, size = {}, 0
+    for name, dtype, shape in columns:
+        size = (size + 7) & ~7
+        layout[name] = (size, dtype, shape)
+        size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, max(size, 1)
+
+
+def _views(buffer, capacity: int) -> Dict[str, np.ndarray]:
+    layout, _ = _layout(capacity)
+    return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+            for name, (offset, dtype, shape) in layout.items()}
+
+
+def _json_members(mapping: Dict) -> bytes:
+    """A dict as the members of a JSON object (no braces), str() keys like the endpoints use"""
+    return json.dumps({str(key): value for key, value in mapping.items()}, separators=(',', ':'))[1:-1].encode()
+
+
+def _work(views: Dict[str, np.ndarray], task: Dict[str, Any], rules: RuleTable) -> Dict[str, Any]:
+    """One worker's share of a request: contexts (+ decisions) for its NPCs, against the whole world"""
+    count, sources = task['count'], task['sources']
+    npcs = {name: view[:count] for name, view in views.items()}
+    contexts, columns = npc_contexts(task['config'], npcs, sources, task['ids'], task['players'])
+    result = {'contexts': _json_members(contexts), 'pairs_checked': columns['pairs_checked']}
+    if task['decide']:
+        columns.update({
+            'type': npcs['type'][sources],
+            'type_names': task['type_names'],
+            'health': npcs['health'][sources],
+            'health_ok': npcs['health_ok'][sources],
+            'bad_health': {},  # The parent reports those
+        })
+        batch, _ = world_batch(columns, task['hour'])
+        decisions = decide_batch(batch, rules)
+        result['decisions'] = decisions
+        result['decisions_json'] = _json_members(dict(zip(batch.ids, decisions)))
+        result['threat'] = columns['threat']
+    return result
+
+
+def _worker_main(conn):
+    """Worker process: run each task on the shared-memory world it names"""
+    block, views, rules = None, None, None
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == 'stop':
+            break
+        task = message[1]
+        try:
+            if task['rules'] is not None:
+                rules = compile_rule_table(*task['rules'])
+            if block is None or block.name != task['block']:
+                if block is not None:
+                    views.clear()
+                    block.close()
+                block = SharedMemory(name=task['block'])
+                views = _views(block.buf, task['capacity'])
+            conn.send(('done', _work(views, task, rules)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+    if block is not None:
+        views.clear()
+        block.close()
+
+
+class ShardPool:
+    """Worker processes deciding an NPCWorld's shards from a shared-memory copy of its columns"""
+
+    def __init__(self, config: Dict = None):
+        self.config = config or SHARD_CONFIG
+        self.context = multiprocessing.get_context(self.config['START_METHOD'])
+        self.lock = threading.Lock()
+        self.shards = max(1, self.config['SHARDS'])
+        self.workers: List[Dict[str, Any]] = []
+        self.assignment = np.zeros(self.shards, dtype=np.int64)  # shard -> worker index
+        self.block = None
+        self.views: Dict[str, np.ndarray] = {}
+        self.capacity = 0
+        self.started = False
+        self.closed = False
+        self.stats = {'requests': 0, 'pooled': 0, 'npcs': 0, 'worker_deaths': 0, 'restarts': 0,
+                      'local_fallbacks': 0}
+        atexit.register(self.close)
+
+    # ---- workers ----
+
+    def start(self):
+        """Spawn the workers now rather than on the first large request"""
+        with self.lock:
+            self._start()
+
+    def _start(self):
+        if self.started or self.closed:
+            return
+        self.started = True
+        for _ in range(max(0, self.config['WORKERS'])):
+            self._spawn()
+        self._rebalance()
+
+    def _spawn(self) -> bool:
+        try:
+            parent_conn, child_conn = self.context.Pipe()
+            process = self.context.Process(target=_worker_main, args=(child_conn,), daemon=True,
+                                           name=f"npc-shard-worker-{len(self.workers)}")
+            process.start()
+            child_conn.close()
+        except OSError:
+            return False
+        # rules: the RuleTable this worker last compiled
+        self.workers.append({'process': process, 'conn': parent_conn, 'alive': True, 'rules': None})
+        return True
+
+    def _live(self) -> List[int]:
+        return [index for index, worker in enumerate(self.workers) if worker['alive']]
+
+    def _rebalance(self):
+        live = self._live()
+        if live:
+            self.assignment = np.array(live, dtype=np.int64)[np.arange(self.shards) % len(live)]
+
+    def _bury(self, index: int):
+        worker = self.workers[index]
+        if worker['alive']:
+            worker['alive'] = False
+            self.stats['worker_deaths'] += 1
+            worker['conn'].close()
+            worker['process'].join(timeout=0.1)
+            if worker['process'].is_alive():
+                worker['process'].kill()
+
+    def _replace_dead(self):
+        dead = len(self.workers) - len(self._live())
+        while dead and self.stats['restarts'] < self.config['MAX_RESTARTS']:
+            if not self._spawn():
+                break
+            self.stats['restarts'] += 1
+            dead -= 1
+        self._rebalance()
+
+    def _reserve(self, count: int):
+        """Shared-memory block with room for `count` NPCs"""
+        if self.block is not None and count <= self.capacity:
+            return
+        capacity = max(count, self.config['INITIAL_CAPACITY'], self.capacity * 2)
+        block = SharedMemory(create=True, size=_layout(capacity)[1])
+        if self.block is not None:
+            self.views.clear()
+            self.block.close()
+            self.block.unlink()
+        self.block, self.capacity = block, capacity
+        self.views = _views(block.buf, capacity)
+
+    def _run(self, parts: Dict[int, Tuple[np.ndarray, List]], task: Dict[str, Any],
+             rules: RuleTable) -> List[Tuple[np.ndarray, List, Dict[str, Any]]]:
+        """Fan the shards out to their workers and wait for all of them; [(sources, ids, result)] per task"""
+        pending = set(parts)
+        results = []
+        while pending:
+            live = self._live()
+            if not live:
+                self.stats['local_fallbacks'] += 1
+                sources, ids = self._merge(parts, pending)
+                results.append((sources, ids, _work(self.views, dict(task, sources=sources, ids=ids), rules)))
+                return results
+
+            by_worker: Dict[int, List[int]] = {}
+            for shard in pending:
+                by_worker.setdefault(int(self.assignment[shard]), []).append(shard)
+
+            waiting = {}
+            for worker_index, shards in by_worker.items():
+                worker = self.workers[worker_index]
+                sources, ids = self._merge(parts, shards)
+                message = dict(task, sources=sources, ids=ids,
+                               rules=None if worker['rules'] is rules else (rules.spec, rules.version))
+                try:
+                    worker['conn'].send(('world', message))
+                    worker['rules'] = rules
+                    waiting[worker_index] = (shards, sources, ids)
+                except (OSError, ValueError):
+                    self._bury(worker_index)
+
+            errors = []
+            while waiting:
+                handles = {self.workers[w]['conn']: w for w in waiting}
+                handles.update({self.workers[w]['process'].sentinel: w for w in waiting})
+                ready = connection.wait(list(handles), timeout=self.config['WORKER_TIMEOUT'])
+                if not ready:
+                    for worker_index in waiting:
+                        self._bury(worker_index)
+                    break
+                for handle in ready:
+                    worker_index = handles[handle]
+                    if worker_index not in waiting:
+                        continue
+                    worker = self.workers[worker_index]
+                    try:
+                        if handle is worker['process'].sentinel and not worker['conn'].poll():
+                            raise EOFError
+                        status, detail = worker['conn'].recv()
+                    except (EOFError, OSError):
+                        self._bury(worker_index)
+                        waiting.pop(worker_index)
+                        continue
+                    shards, sources, ids = waiting.pop(worker_index)
+                    if status == 'done':
+                        pending.difference_update(shards)
+                        results.append((sources, ids, detail))
+                    else:
+                        errors.append(detail)
+
+            if errors:
+                raise ShardPoolError(errors[0])
+            if pending:
+                # Some workers died mid-request - hand their shards to the survivors and retry
+                self._rebalance()
+        return results
+
+    @staticmethod
+    def _merge(parts: Dict[int, Tuple[np.ndarray, List]], shards: Iterable[int]) -> Tuple[np.ndarray, List]:
+        sources, ids = [], []
+        for shard in sorted(shards):
+            sources.append(parts[shard][0])
+            ids.extend(parts[shard][1])
+        return np.concatenate(sources), ids
+
+    # ---- requests ----
+
+    def decide_world(self, world: NPCWorld, ids: Iterable = None, time_of_day=12, decide: bool = True) -> Dict[str, Any]:
+        """Contexts (+ decisions) for the world's NPCs (all, or just `ids`), through the workers when worth it
+
+        Returns {"contexts": JSON bytes, "decisions": {id: decision}, "decisions_json": JSON bytes,
+        "threat": {id: threat_level}, "errors": {id: error}} - the same contexts, decisions and errors as
+        npc_decision_engine.decide_world (world.compute() when decide is false, without decisions).
+        """
+        ids = None if ids is None else list(ids)
+        hour = _number(time_of_day, 'time_of_day') if decide else None
+        wanted = len(world.npcs) if ids is None else len(ids)
+        with self.lock:
+            if self.closed:
+                raise ShardPoolError("Shard pool is closed")
+            self.stats['requests'] += 1
+            pooled = self.config['WORKERS'] > 0 and wanted and wanted >= self.config['MIN_NPCS']
+            if pooled:
+                self._start()
+                if len(self._live()) < len(self.workers):
+                    self._replace_dead()
+                return self._pooled(world, ids, hour, decide)
+        return self._in_process(world, ids, time_of_day, decide)
+
+    @staticmethod
+    def _in_process(world: NPCWorld, ids, time_of_day, decide: bool) -> Dict[str, Any]:
+        if decide:
+            contexts, decisions, errors = decide_world(world, ids, time_of_day)
+        else:
+            contexts, decisions, errors = world.compute(ids), {}, {}
+        return {
+            'contexts': b'{' + _json_members(contexts) + b'}',
+            'decisions': decisions,
+            'decisions_json': b'{' + _json_members(decisions) + b'}',
+            'threat': {npc_id: context['threat_level'] for npc_id, context in contexts.items()},
+            'errors': errors,
+        }
+
+    def _pooled(self, world: NPCWorld, ids, hour, decide: bool) -> Dict[str, Any]:
+        with world.lock:
+            sources = world.rows(ids)
+            count = len(world.npcs)
+            self._reserve(count)
+            arrays = world.npc_arrays()
+            self.views['position'][:count] = arrays['position']
+            for name in SHARED_COLUMNS:
+                self.views[name][:count] = arrays[name]
+            all_ids = world.npcs.ids
+            # Group the requested NPCs by shard, keeping request order within each shard
+            shard = arrays['id_hash'][sources] % self.shards
+            order = np.argsort(shard, kind='stable')
+            parts = {}
+            for rows in np.split(order, np.flatnonzero(np.diff(shard[order])) + 1):
+                if len(rows):
+                    slots = sources[rows]
+                    parts[int(shard[rows[0]])] = (slots, [all_ids[slot] for slot in slots.tolist()])
+            bad_health = world.bad_health(sources) if decide else {}
+            errors = health_errors({row: all_ids[sources[row]] for row in bad_health}, bad_health)
+            task = {'block': self.block.name, 'capacity': self.capacity, 'count': count,
+                    'config': world.config, 'players': world.player_arrays(),
+                    'type_names': list(world.type_names), 'hour': hour, 'decide': decide}
+
+        results = self._run(parts, task, current_rules()) if parts else []
+
+        contexts, decisions_json, decisions, threat = [], [], {}, {}
+        pairs_checked = 0
+        for task_sources, task_ids, result in results:
+            contexts.append(result['contexts'])
+            pairs_checked += result['pairs_checked']
+            if decide:
+                decisions_json.append(result['decisions_json'])
+                threat.update(zip(task_ids, result['threat'].tolist()))
+                # NPCs with a health the rules can't compare got no decision (they are in errors)
+                kept = compress(task_ids, self.views['health_ok'][task_sources].tolist()) if errors else task_ids
+                decisions.update(zip(kept, result['decisions']))
+        with world.lock:
+            world.stats['computes'] += 1
+            world.stats['pairs_checked'] += pairs_checked
+        self.stats['pooled'] += 1
+        self.stats['npcs'] += len(sources)
+        return {
+            'contexts': b'{' + b','.join(part for part in contexts if part) + b'}',
+            'decisions': decisions,
+            'decisions_json': b'{' + b','.join(part for part in decisions_json if part) + b'}',
+            'threat': threat,
+            'errors': errors,
+        }
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            for worker in self.workers:
+                if worker['alive']:
+                    try:
+                        worker['conn'].send(('stop',))
+                    except (OSError, ValueError):
+                        pass
+            for worker in self.workers:
+                worker['process'].join(timeout=1.0)
+                if worker['process'].is_alive():
+                    worker['process'].kill()
+                worker['conn'].close()
+                worker['alive'] = False
+            if self.block is not None:
+                self.views.clear()
+                self.block.close()
+                self.block.unlink()
+                self.block = None
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'shards': self.shards,
+            'workers': len(self.workers),
+            'live_workers': len(self._live()),
+            'min_npcs': self.config['MIN_NPCS'],
+            **self.stats,
+        }
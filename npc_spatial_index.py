@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+NPC SPATIAL INDEX
+==================
+Server-side proximity and threat for the whole NPC population.
+
+The game used to work out `nearby_players` and `threat_level` in the browser,
+comparing every NPC against every other NPC and player (O(n^2) on the render
+thread). Here positions, and the attributes threat depends on, live in NumPy
+slot arrays that are updated in place as entities change, and each compute() builds a uniform grid over the x/z plane
+(cells as wide as the awareness range) by sorting cell keys. Every NPC is then
+paired only with entities in its 3x3 cell neighbourhood, and all distances,
+enemy/ally counts and threat scores are evaluated as array operations in one
+pass - O(n log n + pairs) instead of O(n^2).
+
+Threat uses the same scoring as NPCAIEnhancement.assessThreatLevel in
+js/omni-ai-npc-intelligence.js:
+    +20 per enemy in range, +30 if closer than 10, +15 if closer than 20,
+    +40 below 30 health (+20 below 60), +25 while in COMBAT/ALERT, capped at 100.
+
+Usage:
+    world = NPCWorld()
+    world.update(npcs=[{"id": "n1", "position": {"x": 0, "y": 0, "z": 0}, "faction": "CITY"}],
+                 players=[{"id": "p1", "position": [3, 0, 4]}])
+    contexts = world.compute()      # {"n1": {"threat_level": ..., "nearby_players": [...], ...}}
+"""
+
+import math
+import zlib
+import threading
+from numbers import Real
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+import numpy as np
+
+SPATIAL_CONFIG = {
+    'NEARBY_RANGE': 30.0,     # Awareness radius (same as the client's nearbyRange)
+    'CELL_SIZE': 30.0,        # Grid cell width - 3x3 cells cover NEARBY_RANGE when >= it
+    'CLOSE_RANGE': 10.0,      # Enemy this close: +30 threat
+    'MID_RANGE': 20.0,        # Enemy this close: +15 threat
+    'INITIAL_CAPACITY': 1024, # Slots allocated up front (doubled when full)
+}
+
+ALARMED_STATES = ('COMBAT', 'ALERT')
+_CELL_STRIDE = 1 << 32  # cell key = cell_x * stride + cell_z
+
+
+def parse_position(value) -> Tuple[float, float, float]:
+    """{"x", "y", "z"} or [x, y, z] → (x, y, z)"""
+    if isinstance(value, dict):
+        return (float(value.get('x', 0)), float(value.get('y', 0)), float(value.get('z', 0)))
+    x, y, z = value
+    return (float(x), float(y), float(z))
+
+
+class EntityTable:
+    """Entity ids mapped to rows of fixed-width arrays; removal moves the last row into the gap"""
+
+    def __init__(self, capacity: int, columns: Dict[str, Any] = None):
+        self.ids: List[Any] = []
+        self.slot: Dict[Any, int] = {}
+        self.position = np.zeros((capacity, 3), dtype=np.float64)
+        # Numeric per-entity attributes, in the same rows as position
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in (columns or {}).items()}
+        self.info: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _grow(self):
+        self.position = np.concatenate([self.position, np.zeros_like(self.position)])
+        for name, column in self.columns.items():
+            self.columns[name] = np.concatenate([column, np.zeros_like(column)])
+
+    def row(self, entity_id, defaults: Dict[str, Any]) -> int:
+        """Slot for `entity_id`, creating it (with `defaults` as its info) if new"""
+        slot = self.slot.get(entity_id)
+        if slot is None:
+            slot = len(self.ids)
+            if slot == len(self.position):
+                self._grow()
+            self.ids.append(entity_id)
+            self.info.append(dict(defaults))
+            self.slot[entity_id] = slot
+        return slot
+
+    def remove(self, entity_id):
+        slot = self.slot.pop(entity_id, None)
+        if slot is None:
+            return
+        last = len(self.ids) - 1
+        if slot != last:
+            moved = self.ids[last]
+            self.ids[slot] = moved
+            self.info[slot] = self.info[last]
+            self.position[slot] = self.position[last]
+            for column in self.columns.values():
+                column[slot] = column[last]
+            self.slot[moved] = slot
+        self.ids.pop()
+        self.info.pop()
+
+    def positions(self) -> np.ndarray:
+        return self.position[:len(self.ids)]
+
+
+def _cell_keys(cells: np.ndarray) -> np.ndarray:
+    return cells[:, 0] * _CELL_STRIDE + cells[:, 1]
+
+
+def neighbour_pairs(src_cells: np.ndarray, dst_cells: np.ndarray, reach: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Index pairs (i, j): dst entity j is in one of the (2*reach+1)^2 cells around src entity i"""
+    order = np.argsort(_cell_keys(dst_cells), kind='stable')
+    sorted_keys = _cell_keys(dst_cells)[order]
+    sources, targets = [], []
+    src_index = np.arange(len(src_cells))
+
+    for dx in range(-reach, reach + 1):
+        for dz in range(-reach, reach + 1):
+            keys = (src_cells[:, 0] + dx) * _CELL_STRIDE + (src_cells[:, 1] + dz)
+            lo = np.searchsorted(sorted_keys, keys, side='left')
+            counts = np.searchsorted(sorted_keys, keys, side='right') - lo
+            total = int(counts.sum())
+            if not total:
+                continue
+            # Expand each [lo, lo + count) run into individual indices
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            sources.append(np.repeat(src_index, counts))
+            targets.append(order[starts + np.arange(total)])
+
+    if not sources:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def npc_contexts(config: Dict, npcs: Dict[str, np.ndarray], sources: np.ndarray, source_ids: List,
+                 players: Tuple[np.ndarray, List, List]) -> Tuple[Dict[Any, Dict[str, Any]], Dict[str, Any]]:
+    """Proximity sets + threat for the NPCs in rows `sources`, checked against every row of `npcs`
+
+    npcs: "position" (n x 3), "faction", "threat_health", "alarmed" - NPCWorld's columns
+    players: (positions, ids, health), one entry per player
+    Returns (contexts, {"ids", "threat", "has_players", "first_player", "pairs_checked"}).
+    NPCWorld.compute_columns runs this on its own arrays, the shard pool workers
+    (npc_shard_pool.py) on a shared-memory copy of them.
+    """
+    radius = config['NEARBY_RANGE']
+    reach = max(1, math.ceil(radius / config['CELL_SIZE']))
+    positions = npcs['position']
+    n = len(positions)
+    cells = np.floor(positions[:, [0, 2]] / config['CELL_SIZE']).astype(np.int64)
+
+    # NPC ↔ NPC
+    src, dst = neighbour_pairs(cells[sources], cells, reach)
+    src = sources[src]
+    pairs_checked = len(src)
+    x, y, z = (np.ascontiguousarray(positions[:, axis]) for axis in range(3))
+    d2 = (x[src] - x[dst]) ** 2 + (y[src] - y[dst]) ** 2 + (z[src] - z[dst]) ** 2
+    in_range = (d2 < radius * radius) & (src != dst)
+    src, dst = src[in_range], dst[in_range]
+    distance = np.sqrt(d2[in_range])
+
+    faction = npcs['faction']
+    enemy = faction[src] != faction[dst]
+    enemies = np.bincount(src[enemy], minlength=n)
+    allies = np.bincount(src[~enemy], minlength=n)
+    close = np.bincount(src[enemy & (distance < config['CLOSE_RANGE'])], minlength=n)
+    mid = np.bincount(src[enemy & (distance >= config['CLOSE_RANGE']) & (distance < config['MID_RANGE'])], minlength=n)
+
+    health = npcs['threat_health']
+    threat = (enemies * 20 + close * 30 + mid * 15
+              + np.where(health < 30, 40, np.where(health < 60, 20, 0))
+              + npcs['alarmed'] * 25)
+    threat = np.minimum(threat, 100)
+
+    # NPC ↔ player
+    nearby_players = {}
+    player_positions, player_ids, player_health = players
+    if len(player_ids):
+        player_cells = np.floor(player_positions[:, [0, 2]] / config['CELL_SIZE']).astype(np.int64)
+        psrc, pdst = neighbour_pairs(cells[sources], player_cells, reach)
+        psrc = sources[psrc]
+        pdist = np.sqrt((x[psrc] - player_positions[pdst, 0]) ** 2
+                        + (y[psrc] - player_positions[pdst, 1]) ** 2
+                        + (z[psrc] - player_positions[pdst, 2]) ** 2)
+        in_range = pdist < radius
+        for npc_slot, player_slot, d in sorted(zip(psrc[in_range].tolist(), pdst[in_range].tolist(),
+                                                   pdist[in_range].tolist()), key=lambda hit: hit[2]):
+            nearby_players.setdefault(npc_slot, []).append({
+                'id': player_ids[player_slot],
+                'distance': round(d, 2),
+                'health': player_health[player_slot],
+            })
+
+    threat_list, enemy_list, ally_list = threat.tolist(), enemies.tolist(), allies.tolist()
+    contexts = {}
+    first_player = []
+    for slot, npc_id in zip(sources.tolist(), source_ids):
+        players_in_range = nearby_players.get(slot, [])
+        contexts[npc_id] = {
+            'threat_level': int(threat_list[slot]),
+            'nearby_players': players_in_range,
+            'nearby_enemies': enemy_list[slot],
+            'nearby_allies': ally_list[slot],
+        }
+        first_player.append(players_in_range[0] if players_in_range else None)
+
+    return contexts, {
+        'ids': source_ids,
+        'threat': threat[sources],
+        'has_players': np.array([player is not None for player in first_player], dtype=bool),
+        'first_player': first_player,
+        'pairs_checked': pairs_checked,
+    }
+
+
+class NPCWorld:
+    """NPC + player positions and attributes, with per-tick proximity/threat"""
+
+    NPC_DEFAULTS = {'faction': None, 'health': 100, 'state': 'IDLE', 'type': 'CITIZEN'}
+    PLAYER_DEFAULTS = {'health': 100}
+    # Per-NPC columns derived from the info dicts on every update, so compute() never walks the dicts
+    NPC_COLUMNS = {
+        'faction': np.int64,          # Code per distinct faction value (only equality matters)
+        'threat_health': np.float64,  # health or 100, as assessThreatLevel reads it
+        'alarmed': np.bool_,          # state in ALARMED_STATES
+        'type': np.int32,             # Index into type_names, -1 for an unhashable type
+        'health': np.float64,         # Health for the decision rules (NaN when not a number)
+        'health_ok': np.bool_,        # The rules can compare it - otherwise the NPC gets an error
+        'id_hash': np.uint32,         # crc32 of str(id) - stable across processes, for sharding
+    }
+
+    def __init__(self, config: Dict = None):
+        self.config = config or SPATIAL_CONFIG
+        self.npcs = EntityTable(self.config['INITIAL_CAPACITY'], self.NPC_COLUMNS)
+        self.players = EntityTable(16)
+        # Append-only, so codes already in the columns stay valid
+        self.faction_codes: Dict[Any, int] = {}
+        self.type_codes: Dict[Any, int] = {}
+        self.type_names: List[Any] = []
+        self.lock = threading.RLock()
+        self.stats = {'updates': 0, 'computes': 0, 'pairs_checked': 0}
+
+    def _npc_row(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        """NPC_COLUMNS values (all but id_hash) for one NPC's info; raises for a faction or health threat can't use"""
+        faction = info.get('faction')
+        faction_code = self.faction_codes.get(faction)  # TypeError for an unhashable faction
+        threat_health = float(info.get('health') or 100)
+        if faction_code is None:
+            faction_code = self.faction_codes[faction] = len(self.faction_codes)
+
+        npc_type = info.get('type', 'CITIZEN')
+        try:
+            type_code = self.type_codes.get(npc_type)
+            if type_code is None:
+                type_code = self.type_codes[npc_type] = len(self.type_names)
+                self.type_names.append(npc_type)
+        except TypeError:  # Unhashable - can't be one of the rules' types
+            type_code = -1
+
+        health = info.get('health', 100)
+        health_ok = isinstance(health, Real)
+        return {
+            'faction': faction_code,
+            'threat_health': threat_health,
+            'alarmed': info.get('state') in ALARMED_STATES,
+            'type': type_code,
+            'health': float(health) if health_ok else math.nan,
+            'health_ok': health_ok,
+        }
+
+    def update(self, npcs: Iterable[Dict] = (), players: Iterable[Dict] = (),
+               removed: Iterable = (), removed_players: Iterable = ()) -> Dict[str, int]:
+        """Apply a partial snapshot - only the entities and fields sent are changed"""
+        with self.lock:
+            for npc_id in removed:
+                self.npcs.remove(npc_id)
+            for player_id in removed_players:
+                self.players.remove(player_id)
+
+            columns = self.npcs.columns
+            for npc in npcs:
+                npc_id = npc['id']
+                slot = self.npcs.slot.get(npc_id)
+                fields = {field: npc[field] for field in ('faction', 'health', 'state', 'type') if field in npc}
+                position = parse_position(npc['position']) if 'position' in npc else None
+                # Bad values are rejected before anything about the NPC changes
+                values = None
+                if slot is None or fields:
+                    values = self._npc_row(dict(self.NPC_DEFAULTS if slot is None else self.npcs.info[slot], **fields))
+                if slot is None:
+                    slot = self.npcs.row(npc_id, self.NPC_DEFAULTS)
+                    columns['id_hash'][slot] = zlib.crc32(str(npc_id).encode('utf-8'))
+                self.npcs.info[slot].update(fields)
+                if values is not None:
+                    for name, value in values.items():
+                        columns[name][slot] = value
+                if position is not None:
+                    self.npcs.position[slot] = position
+
+            for player in players:
+                slot = self.players.row(player['id'], self.PLAYER_DEFAULTS)
+                if 'health' in player:
+                    self.players.info[slot]['health'] = player['health']
+                if 'position' in player:
+                    self.players.position[slot] = parse_position(player['position'])
+
+            self.stats['updates'] += 1
+        return {'npcs': len(self.npcs), 'players': len(self.players)}
+
+    def threat(self, health, state, enemy_distances: Iterable[float]) -> int:
+        """assessThreatLevel() from the game client, for one NPC"""
+        threat = 0
+        for distance in enemy_distances:
+            threat += 20
+            if distance < self.config['CLOSE_RANGE']:
+                threat += 30
+            elif distance < self.config['MID_RANGE']:
+                threat += 15
+
+        health = health or 100
+        if health < 30:
+            threat += 40
+        elif health < 60:
+            threat += 20
+
+        if state in ALARMED_STATES:
+            threat += 25
+        return min(100, threat)
+
+    def rows(self, ids: Optional[Iterable] = None) -> np.ndarray:
+        """Slots of `ids` in order (unknown ids skipped), or of every NPC"""
+        if ids is None:
+            return np.arange(len(self.npcs))
+        slot = self.npcs.slot
+        return np.array([slot[i] for i in ids if i in slot], dtype=np.int64)
+
+    def npc_arrays(self) -> Dict[str, np.ndarray]:
+        """Position + NPC_COLUMNS for the current NPCs (views - hold the lock while using them)"""
+        n = len(self.npcs)
+        arrays = {name: column[:n] for name, column in self.npcs.columns.items()}
+        arrays['position'] = self.npcs.positions()
+        return arrays
+
+    def player_arrays(self) -> Tuple[np.ndarray, List, List]:
+        """(positions, ids, health) of the current players"""
+        return (self.players.positions().copy(), list(self.players.ids),
+                [info.get('health', 100) for info in self.players.info])
+
+    def bad_health(self, sources: np.ndarray) -> Dict[int, Any]:
+        """{row in sources: stored health} for the NPCs whose health the rules can't compare"""
+        rows = np.flatnonzero(~self.npcs.columns['health_ok'][sources]).tolist()
+        return {row: self.npcs.info[int(sources[row])].get('health', 100) for row in rows}
+
+    def compute(self, ids: Optional[Iterable] = None) -> Dict[Any, Dict[str, Any]]:
+        """Proximity sets + threat for every NPC (or just `ids`) in one vectorized pass"""
+        return self.compute_columns(ids)[0]
+
+    def compute_columns(self, ids: Optional[Iterable] = None) -> Tuple[Dict[Any, Dict[str, Any]], Dict[str, Any]]:
+        """compute(), plus the per-NPC columns behind it in the contexts' order:
+        {"ids", "threat": int[], "has_players": bool[], "first_player": [nearest player entry or None],
+         "type": int[] (into "type_names"), "health": float[], "health_ok": bool[],
+         "bad_health": {row: value}} - what npc_decision_engine.decide_world packs from"""
+        with self.lock:
+            sources = self.rows(ids)
+            if not len(sources):
+                return {}, self._no_columns()
+            arrays = self.npc_arrays()
+            source_ids = [self.npcs.ids[slot] for slot in sources.tolist()]
+            contexts, columns = npc_contexts(self.config, arrays, sources, source_ids, self.player_arrays())
+            self.stats['pairs_checked'] += columns.pop('pairs_checked')
+            columns.update({
+                'type': arrays['type'][sources],
+                'type_names': self.type_names,
+                'health': arrays['health'][sources],
+                'health_ok': arrays['health_ok'][sources],
+                'bad_health': self.bad_health(sources),
+            })
+            self.stats['computes'] += 1
+        return contexts, columns
+
+    def _no_columns(self) -> Dict[str, Any]:
+        return {'ids': [], 'threat': np.empty(0, dtype=np.int64), 'has_players': np.empty(0, dtype=bool),
+                'first_player': [], 'type': np.empty(0, dtype=np.int32), 'type_names': self.type_names,
+                'health': np.empty(0, dtype=np.float64), 'health_ok': np.empty(0, dtype=bool), 'bad_health': {}}
+
+    def nearest_player_distances(self, chunk: int = 4096) -> Dict[Any, float]:
+        """Distance from every NPC to its closest player (inf when there are no players)"""
+        with self.lock:
+            n = len(self.npcs)
+            if not len(self.players):
+                return dict.fromkeys(self.npcs.ids, math.inf)
+            positions = self.npcs.positions()
+            player_positions = self.players.positions()
+            nearest = np.empty(n, dtype=np.float64)
+            # Players are few; NPC x player in chunks keeps the temporary small
+            for start in range(0, n, chunk):
+                block = positions[start:start + chunk, None, :] - player_positions[None, :, :]
+                nearest[start:start + chunk] = np.sqrt((block * block).sum(axis=2).min(axis=1))
+            return dict(zip(self.npcs.ids, nearest.tolist()))
+
+    def npc_state(self, npc_id) -> Dict[str, Any]:
+        """State dict for the decision rules"""
+        info = self.npcs.info[self.npcs.slot[npc_id]]
+        return {'type': info.get('type', 'CITIZEN'), 'health': info.get('health', 100), 'state': info.get('state', 'IDLE')}
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'npcs': len(self.npcs),
+                'players': len(self.players),
+                **self.stats,
+            }
@@ -1,6 +1,6 @@
 # Comprehensive Diagnostics System
 
-from agent_with_tracing import OmniAgent, setup_tracing
+from agent_with_tracing import OmniAgent, setup_tracing, traced
 import os
 import re
 import json
@@ -20,6 +20,7 @@ class GameDiagnostics:
             "recommendations": []
         }
     
+    @traced("diagnostics.check_syntax_errors")
     def check_syntax_errors(self):
         """Check for JavaScript syntax errors"""
         print("\n🔍 Checking for syntax errors...")
@@ -54,6 +55,7 @@ class GameDiagnostics:
         
         return issues
     
+    @traced("diagnostics.check_memory_leaks")
     def check_memory_leaks(self):
         """Check for potential memory leak patterns"""
         print("\n💧 Checking for memory leaks...")
@@ -101,6 +103,7 @@ class GameDiagnostics:
         
         return issues
     
+    @traced("diagnostics.check_undefined_variables")
     def check_undefined_variables(self):
         """Check for potentially undefined variable access"""
         print("\n❓ Checking for undefined variable risks...")
@@ -138,6 +141,7 @@ class GameDiagnostics:
         
         return issues
     
+    @traced("diagnostics.check_race_conditions")
     def check_race_conditions(self):
         """Check for potential race conditions"""
         print("\n⚡ Checking for race conditions...")
@@ -174,6 +178,7 @@ class GameDiagnostics:
         
         return issues
     
+    @traced("diagnostics.check_system_integration")
     def check_system_integration(self):
         """Check if all systems are properly integrated"""
         print("\n🔗 Checking system integration...")
@@ -217,6 +222,7 @@ class GameDiagnostics:
         
         return issues
     
+    @traced("diagnostics.check_error_handling")
     def check_error_handling(self):
         """Check for proper error handling"""
         print("\n🛡️ Checking error handling...")
@@ -247,6 +253,7 @@ class GameDiagnostics:
         
         return issues
     
+    @traced("diagnostics.check_performance_issues")
     def check_performance_issues(self):
         """Check for performance bottlenecks"""
         print("\n⚡ Checking for performance issues...")
@@ -283,6 +290,7 @@ class GameDiagnostics:
         
         return issues
     
+    @traced("diagnostics.run_ai_analysis")
     def run_ai_analysis(self):
         """Use AI to analyze critical files"""
         print("\n🤖 Running AI code analysis...")
@@ -322,6 +330,7 @@ Provide ONLY critical issues that could cause crashes. Be specific about line/fu
         
         return ai_findings
     
+    @traced("diagnostics.generate_report")
     def generate_report(self):
         """Generate final diagnostics report"""
         print("\n" + "="*70)
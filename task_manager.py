@@ -1,6 +1,6 @@
 # Task Manager for AI Assistant
 
-from agent_with_tracing import OmniAgent, setup_tracing
+from agent_with_tracing import OmniAgent, setup_tracing, traced
 import os
 import json
 from datetime import datetime
@@ -13,6 +13,7 @@ class TaskManager:
         self.tasks_file = os.path.join(agent.workspace_path, '.ai_tasks.json')
         self.tasks = self.load_tasks()
     
+    @traced("tasks.load")
     def load_tasks(self):
         """Load tasks from file"""
         if os.path.exists(self.tasks_file):
@@ -24,11 +25,13 @@ class TaskManager:
             "completed": []
         }
     
+    @traced("tasks.save")
     def save_tasks(self):
         """Save tasks to file"""
         with open(self.tasks_file, 'w') as f:
             json.dump(self.tasks, f, indent=2)
     
+    @traced("queue.tasks.add")
     def add_task(self, title: str, description: str, priority: str = "medium", file_path: str = None):
         """Add a new improvement task"""
         task = {
@@ -52,6 +55,7 @@ class TaskManager:
                     return task
         return None
     
+    @traced("queue.tasks.start")
     def start_task(self, task_id: int):
         """Move task to in_progress"""
         task = self.get_task(task_id)
@@ -64,6 +68,7 @@ class TaskManager:
             return True
         return False
     
+    @traced("queue.tasks.complete")
     def complete_task(self, task_id: int, result: str = None):
         """Mark task as completed"""
         task = self.get_task(task_id)
@@ -84,6 +89,7 @@ class TaskManager:
             return self.tasks.get(status, [])
         return self.tasks
     
+    @traced("queue.tasks.next")
     def suggest_next_task(self):
         """AI suggests the next task to work on"""
         if not self.tasks["pending"]:
@@ -96,6 +102,7 @@ class TaskManager:
         
         return self.tasks["pending"][0]
     
+    @traced("tasks.create_from_scan")
     def auto_create_tasks_from_scan(self, issues: dict):
         """Automatically create tasks from issue scan"""
         created_tasks = []
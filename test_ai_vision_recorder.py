@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Vision session recorder: frames read back intact, sessions resume instead of being overwritten
+
+Runs offline (no servers needed):
+    python test_ai_vision_recorder.py
+"""
+
+import os
+import json
+import base64
+import tempfile
+
+from ai_vision_recorder import SessionRecorder, SessionReader, RECORDER_CONFIG, INDEX_FILE, META_FILE
+
+
+def frame(n):
+    return base64.b64encode(b'\x89PNG fake frame %d ' % n + os.urandom(64)).decode('ascii')
+
+
+def record(session_dir, first, count, config=None):
+    recorder = SessionRecorder(session_dir, config).start()
+    frames = [frame(n) for n in range(first, first + count)]
+    for n, data in enumerate(frames, first):
+        assert recorder.record(data, {"n": n, "scene": "wasteland"}, timestamp=1000.0 + n)
+    recorder.stop()
+    return recorder, frames
+
+
+def test_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        session = os.path.join(tmp, "session")
+        # Tiny segments so the session rolls over several files
+        _, frames = record(session, 0, 40, dict(RECORDER_CONFIG, SEGMENT_MAX_BYTES=1024))
+
+        reader = SessionReader(session)
+        try:
+            assert len(reader) == 40
+            for n, captured in enumerate(reader.frames()):
+                assert captured['frame'] == frames[n]
+                assert captured['game_info'] == {"n": n, "scene": "wasteland"}
+                assert captured['timestamp'] == 1000.0 + n
+            assert reader.seek_time(1010.5) == 11
+            assert reader.get(reader.seek_time(1025))['game_info']['n'] == 25
+            assert reader.info()['segments'] > 1
+        finally:
+            reader.close()
+
+
+def test_resume():
+    with tempfile.TemporaryDirectory() as tmp:
+        session = os.path.join(tmp, "session")
+        first, frames = record(session, 0, 10)
+        with open(os.path.join(session, META_FILE)) as f:
+            started_at = json.load(f)['started_at']
+
+        # Simulate an unclean shutdown: half-written last index line
+        with open(os.path.join(session, INDEX_FILE), 'a') as f:
+            f.write('{"seq": 10, "t": 10')
+
+        _, more = record(session, 10, 5)
+        reader = SessionReader(session)
+        try:
+            assert [entry['seq'] for entry in reader.index] == list(range(15))
+            assert [r['frame'] for r in reader.frames()] == frames + more
+        finally:
+            reader.close()
+        with open(os.path.join(session, META_FILE)) as f:
+            meta = json.load(f)
+        assert meta['frames'] == 15
+        assert meta['started_at'] == started_at
+
+
+def test_record_after_stop():
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder, _ = record(os.path.join(tmp, "session"), 0, 3)
+        assert recorder.record(frame(99), {}) is False
+        assert recorder.queue.empty()
+        try:
+            recorder.start()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("a stopped recorder must not restart")
+
+
+def main():
+    print("=" * 70)
+    print("VISION SESSION RECORDER TEST")
+    print("=" * 70)
+
+    test_round_trip()
+    print("✓ Recorded frames and game_info read back intact across segments; seek by time")
+    test_resume()
+    print("✓ Reopened session continues seq numbers; torn index line dropped; start time kept")
+    test_record_after_stop()
+    print("✓ record() after stop() rejected; stopped recorder cannot restart")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Brain server over a real socket: request body validation, /chat/batch tracing
+
+Runs offline (fallback replies, no model):
+    python test_brain_server.py
+"""
+
+import json
+import socket
+import threading
+import uuid
+
+from agent_with_tracing import CONFIG, create_brain_server
+
+CONFIG["AI"]["MODEL"] = "fallback"
+
+
+def start_server():
+    server = create_brain_server("127.0.0.1", 0, "threaded")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def raw_request(server, head: bytes, body: bytes = b"", timeout: float = 3.0):
+    """Send one request with hand-written headers; (status, parsed JSON body)"""
+    with socket.create_connection(server.server_address, timeout=timeout) as sock:
+        sock.sendall(head + b"\r\n" + body)
+        reply = b""
+        while b"\r\n\r\n" not in reply:
+            reply += sock.recv(65536)
+        header, _, rest = reply.partition(b"\r\n\r\n")
+        lines = header.decode("latin-1").split("\r\n")
+        length = int(next(line.split(":", 1)[1] for line in lines if line.lower().startswith("content-length")))
+        while len(rest) < length:
+            rest += sock.recv(65536)
+    return int(lines[0].split()[1]), json.loads(rest[:length])
+
+
+def test_bad_content_length():
+    server = start_server()
+    try:
+        for value in (b"abc", b"-5", b"1.5"):
+            head = b"POST /chat HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\nContent-Length: " + value + b"\r\n"
+            status, body = raw_request(server, head, b'{"prompt": "hello"}')
+            assert status == 400 and "Content-Length" in body["error"], (value, status, body)
+
+        body = b'{"prompt": "hello"}'
+        head = b"POST /chat HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n" % len(body)
+        status, reply = raw_request(server, head, body)
+        assert status == 200 and reply["response"].startswith("ARIA:")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_batch_spans_share_request_trace():
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    if trace.get_tracer_provider() is not provider:
+        provider = trace.get_tracer_provider()  # Already set by an earlier test in this process
+        provider.add_span_processor(SimpleSpanProcessor(exporter))
+
+    server = start_server()
+    try:
+        # Distinct prompts, so every item misses the cache and generates (and traces) a reply
+        tag = uuid.uuid4().hex
+        body = json.dumps({"prompts": [{"id": i, "prompt": f"status {tag} {i}"} for i in range(4)]}).encode()
+        head = b"POST /chat/batch HTTP/1.1\r\nHost: x\r\nContent-Length: %d\r\n" % len(body)
+        status, reply = raw_request(server, head, body)
+        assert status == 200 and reply["unique"] == 4
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    spans = exporter.get_finished_spans()
+    request = [span for span in spans if span.name == "HTTP POST /chat/batch"]
+    children = [span for span in spans if span.name == "brain.generate_response"]
+    assert len(request) == 1 and len(children) == 4, [span.name for span in spans]
+    trace_id = request[0].context.trace_id
+    assert all(span.context.trace_id == trace_id for span in children)
+    assert all(span.parent.span_id == request[0].context.span_id for span in children)
+
+
+def main():
+    print("=" * 70)
+    print("BRAIN SERVER TEST")
+    print("=" * 70)
+
+    test_bad_content_length()
+    print("✓ Non-numeric or negative Content-Length answered with 400, not a 500 or a hang")
+    test_batch_spans_share_request_trace()
+    print("✓ /chat/batch per-prompt spans are children of the request span")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
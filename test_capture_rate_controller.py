@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Adaptive capture rate: idle back-off, and resolution changes not scored as scene changes
+
+Runs offline (no servers needed):
+    python test_capture_rate_controller.py
+"""
+
+from ai_vision_control_system import CaptureRateController, CAPTURE_CONFIG
+
+STILL = {"player": {"position": [0, 0, 0], "health": 100}, "weapon": {"ammo": 30}}
+
+
+def frame(size):
+    return "A" * size
+
+
+def pixels(scale, full=40000):
+    """Encoded size of the same still picture captured at `scale`"""
+    return int(full * scale * scale)
+
+
+def test_scale_change_is_not_a_scene_change():
+    controller = CaptureRateController(dict(CAPTURE_CONFIG))
+    hint = controller.on_frame(frame(pixels(1.0)), STILL, 0, 0)
+    for _ in range(2 * CAPTURE_CONFIG['SCENE_WINDOW']):
+        hint = controller.on_frame(frame(pixels(hint['scale'])), STILL, 0, 0)
+    assert hint['reason'] == 'idle' and hint['scale'] == CAPTURE_CONFIG['SCALES'][-1]
+    assert hint['interval_ms'] == CAPTURE_CONFIG['MAX_INTERVAL_MS']
+
+    # A test starts: full resolution is ordered, then the test ends and the scene is still
+    hint = controller.on_frame(frame(pixels(hint['scale'])), STILL, 0, 1)
+    assert hint['reason'] == 'testing' and hint['scale'] == 1.0
+    hint = controller.on_frame(frame(pixels(hint['scale'])), STILL, 0, 0)
+    assert hint['scene_change'] == 0.0, hint
+
+    # Scale reported by the client wins over the last recommendation
+    hint = controller.on_frame(frame(pixels(0.5)), STILL, 0, 0, capture_scale=0.5)
+    assert hint['scene_change'] == 0.0, hint
+
+
+def test_same_scale_size_change_is_scored():
+    controller = CaptureRateController(dict(CAPTURE_CONFIG))
+    controller.on_frame(frame(10000), STILL, 0, 0, capture_scale=1.0)
+    hint = controller.on_frame(frame(14000), STILL, 0, 0, capture_scale=1.0)
+    assert hint['scene_change'] == 1.0, hint
+
+
+def main():
+    print("=" * 70)
+    print("CAPTURE RATE CONTROLLER TEST")
+    print("=" * 70)
+
+    test_scale_change_is_not_a_scene_change()
+    print("✓ Resolution changes the controller ordered do not count as scene changes")
+    test_same_scale_size_change_is_scored()
+    print("✓ Size changes between frames at the same scale still score")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Incremental codebase scan: only changed files are rescanned, cache survives restarts
+
+Runs offline (no servers needed):
+    python test_codebase_scan.py
+"""
+
+import os
+import tempfile
+
+from codebase_scan import CodebaseScanner, scan_text
+
+
+def write(root, rel, text):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+def bump_mtime(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_rules():
+    issues = scan_text("js/game.js", "el.innerHTML = html;\ntry { go(); } catch (e) {}\n// TODO tidy\n")
+    assert [i["type"] for i in issues["security"]] == ["inner_html"]
+    assert [i["line"] for i in issues["bugs"]] == [2]
+    assert issues["code_quality"][0]["type"] == "todo"
+    assert scan_text("notes.md", "eval(x)") == {"performance": [], "bugs": [], "security": [], "code_quality": []}
+
+
+def check_incremental(root):
+    game = write(root, "js/game.js", "const x = eval(input);\n")
+    write(root, "tools/helper.py", "try:\n    pass\nexcept:\n    pass\n")
+    write(root, "node_modules/lib/index.js", "eval(x)\n")
+
+    scanner = CodebaseScanner(root)
+    issues = scanner.scan()
+    assert scanner.last_scan["rescanned"] == 2  # node_modules skipped
+    assert [i["file"] for i in issues["security"]] == ["js/game.js"]
+    assert [i["file"] for i in issues["bugs"]] == ["tools/helper.py"]
+
+    scanner.scan()
+    assert scanner.last_scan["rescanned"] == 0 and scanner.last_scan["rehashed"] == 0
+
+    bump_mtime(game)  # Touched, same content
+    scanner.scan()
+    assert scanner.last_scan["rescanned"] == 0 and scanner.last_scan["rehashed"] == 1
+
+    write(root, "js/game.js", "const x = JSON.parse(input);\n")
+    bump_mtime(game)
+    issues = scanner.scan()
+    assert scanner.last_scan["rescanned"] == 1
+    assert issues["security"] == []
+
+    os.remove(os.path.join(root, "tools/helper.py"))
+    issues = scanner.scan()
+    assert scanner.last_scan["removed"] == 1 and issues["bugs"] == []
+
+    # A new process starts from the persisted cache
+    restarted = CodebaseScanner(root)
+    assert restarted.scan() == issues
+    assert restarted.last_scan["rescanned"] == 0
+
+
+def main():
+    print("=" * 70)
+    print("CODEBASE SCAN TEST")
+    print("=" * 70)
+
+    test_rules()
+    print("✓ Rules report file, line, type and category")
+
+    with tempfile.TemporaryDirectory() as root:
+        check_incremental(root)
+    print("✓ Only changed files rescanned; deletions dropped; cache persisted")
+
+    scanner = CodebaseScanner(os.path.dirname(os.path.abspath(__file__)))
+    scanner.scan()
+    scanner.scan()
+    print(f"✓ No-change rescan of this repo: {scanner.last_scan['files']} files "
+          f"in {scanner.last_scan['elapsed_ms']}ms")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
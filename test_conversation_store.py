@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Conversation history store: paging, keyword/time filters, retention, restart
+
+Runs offline (no servers needed):
+    python test_conversation_store.py
+"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+
+from conversation_store import ConversationStore, STORE_CONFIG
+
+SMALL = dict(STORE_CONFIG, TAIL_SIZE=20, MAX_PAGE=50)
+
+
+def fill(store, n, start=0, ts=None):
+    for i in range(start, start + n):
+        entry = {"query": f"query {i} {'npc' if i % 3 == 0 else 'scan'}", "response": {"n": i}}
+        if ts is not None:
+            entry["timestamp"] = ts + i
+        store.append(entry)
+
+
+def walk(store, **filters):
+    """All matching entries, newest page first, via next_cursor"""
+    seen, cursor = [], None
+    while True:
+        page = store.query(cursor=cursor, limit=7, **filters)
+        seen = page["entries"] + seen
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def check_paging(path):
+    store = ConversationStore(path, SMALL)
+    fill(store, 100)
+    latest = store.query(limit=5)
+    assert [e["response"]["n"] for e in latest["entries"]] == [95, 96, 97, 98, 99]
+    assert store.stats["tail_hits"] == 1
+
+    # Paging past the in-memory tail continues in the database without gaps
+    ids = [e["id"] for e in walk(store)]
+    assert ids == list(range(1, 101)), ids[:10]
+    store.close()
+
+
+def check_filters(path):
+    store = ConversationStore(path, SMALL)
+    base = time.time() - 1000
+    fill(store, 60, ts=base)
+    npc = walk(store, keyword="npc")
+    assert [e["response"]["n"] for e in npc] == list(range(0, 60, 3))
+    assert walk(store, keyword="npc query 9") == [e for e in npc if e["response"]["n"] == 9]
+    assert walk(store, keyword='"npc* OR (') == []  # FTS syntax is taken literally
+    window = walk(store, since=base + 10, until=base + 20)
+    assert [e["response"]["n"] for e in window] == list(range(10, 20))
+
+    # Keywords match text values (non-ASCII included), never JSON keys
+    store.append({"query": "estado", "response": {"text": "Munición baja en el café"}})
+    for fts in (True, False):
+        store.fts = fts  # False = the LIKE fallback
+        assert [e["query"] for e in walk(store, keyword="café")] == ["estado"]
+        assert [e["query"] for e in walk(store, keyword="Munición")] == ["estado"]
+        assert walk(store, keyword="response") == []
+    store.close()
+
+
+def check_migration(path):
+    """A version-0 database (FTS over the raw JSON body) is re-indexed on open"""
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE entries (id INTEGER PRIMARY KEY, ts REAL NOT NULL,
+                              query TEXT NOT NULL DEFAULT '', body TEXT NOT NULL);
+        CREATE VIRTUAL TABLE entries_fts USING fts5(query, body);
+    """)
+    body = json.dumps({"query": "old", "response": "señal perdida"})
+    db.execute("INSERT INTO entries VALUES (1, ?, 'old', ?)", (time.time(), body))
+    db.execute("INSERT INTO entries_fts (rowid, query, body) VALUES (1, 'old', ?)", (body,))
+    db.commit()
+    db.close()
+
+    store = ConversationStore(path, SMALL)
+    assert [e["id"] for e in walk(store, keyword="señal")] == [1]
+    assert walk(store, keyword="response") == []
+    assert store.append({"query": "new"})["id"] == 2
+    store.close()
+
+
+def check_retention_and_restart(path):
+    config = dict(SMALL, MAX_ENTRIES=30, RETENTION_DAYS=1, RETENTION_INTERVAL=0)
+    store = ConversationStore(path, config)
+    fill(store, 5, ts=time.time() - 3 * 86400)  # Past the age limit
+    fill(store, 40, start=5)
+    store.flush()
+    store.append({"query": "trigger", "response": {}})  # Retention runs after each write
+    store.flush()
+    ids = [e["id"] for e in walk(store)]
+    assert ids == list(range(17, 47)), ids
+    store.close()
+
+    reopened = ConversationStore(path, config)
+    assert [e["id"] for e in walk(reopened)] == ids
+    assert reopened.append({"query": "after restart"})["id"] == 47
+    reopened.close()
+
+
+def main():
+    print("=" * 70)
+    print("CONVERSATION STORE TEST")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        check_paging(os.path.join(tmp, "paging.db"))
+        print("✓ Latest page from memory; cursor paging continues into SQLite")
+
+        check_filters(os.path.join(tmp, "filters.db"))
+        print("✓ Keyword and time-range filters page correctly")
+
+        check_retention_and_restart(os.path.join(tmp, "retention.db"))
+        print("✓ Retention by age and count; history survives a restart")
+
+        check_migration(os.path.join(tmp, "migrated.db"))
+        print("✓ Databases from the previous schema re-indexed for keyword search")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""LLM gateway circuit breaker with the offline stub backend
+
+Runs offline (no API key, no network):
+    python test_llm_gateway.py
+"""
+
+import time
+
+from llm_gateway import LLMGateway, StubBackend, LLMUnavailable, GATEWAY_CONFIG
+
+MESSAGES = [{"role": "user", "content": "one two three four"}]
+
+
+class FlakyBackend(StubBackend):
+    """Stub that fails while `failing` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.failing = True
+
+    def _reply(self, request):
+        if self.failing:
+            raise RuntimeError("backend down")
+        return super()._reply(request)
+
+
+def open_breaker(gateway, backend):
+    backend.failing = True
+    for _ in range(GATEWAY_CONFIG['BREAKER']['FAILURE_THRESHOLD']):
+        try:
+            gateway.complete(MESSAGES, coalesce=False)
+        except RuntimeError:
+            pass
+    assert gateway.breaker.state == 'open'
+    gateway.breaker.opened_at = time.time() - gateway.breaker.cooldown  # Cool-down over
+    backend.failing = False
+
+
+def test_half_open_stream_closed_early():
+    backend = FlakyBackend()
+    gateway = LLMGateway(backend)
+    open_breaker(gateway, backend)
+
+    tokens = gateway.stream(MESSAGES)
+    next(tokens)                       # This stream is the half-open probe
+    try:
+        gateway.complete(MESSAGES)
+    except LLMUnavailable:
+        pass
+    else:
+        raise AssertionError("second call allowed while the probe is in flight")
+    tokens.close()                     # Client disconnected mid-stream
+
+    assert gateway.breaker.probing is False and gateway.breaker.state == 'half_open'
+    assert gateway.complete(MESSAGES).startswith("[stub:")
+    assert gateway.breaker.state == 'closed'
+
+
+def test_stream_outcomes():
+    backend = FlakyBackend()
+    gateway = LLMGateway(backend)
+    open_breaker(gateway, backend)
+    assert "".join(gateway.stream(MESSAGES)).strip().endswith("one two three four")
+    assert gateway.breaker.state == 'closed'
+
+    open_breaker(gateway, backend)
+    backend.failing = True
+    try:
+        list(gateway.stream(MESSAGES))
+    except RuntimeError:
+        pass
+    assert gateway.breaker.state == 'open' and gateway.breaker.probing is False
+
+
+def main():
+    print("=" * 70)
+    print("LLM GATEWAY TEST")
+    print("=" * 70)
+
+    test_half_open_stream_closed_early()
+    print("✓ Half-open probe released when a stream is closed early")
+
+    test_stream_outcomes()
+    print("✓ Finished streams close the breaker, failed streams reopen it")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
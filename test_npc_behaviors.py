@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""NPC behavior tables: validation, compiled rules, hot reload
+
+Runs offline (no servers needed):
+    python test_npc_behaviors.py
+"""
+
+import os
+import json
+import tempfile
+
+from npc_behaviors import BehaviorSet, BehaviorError, BEHAVIOR_CONFIG, parse_behaviors, compile_decider
+from npc_decision_engine import NPCBatch, compile_rule_table, decide_batch
+from test_npc_decision_engine import equivalence_cases
+
+CUSTOM = {
+    "defaults": {"type": "MEDIC", "health": 80},
+    "fallback": {"action": "WANDER", "priority": 1, "reasoning": "Nothing to do"},
+    "global": [
+        {"types": ["MEDIC", "CITIZEN"], "when": {"health": {"<=": 20}},
+         "action": "HIDE", "priority": 10, "reasoning": "Badly hurt"},
+    ],
+    "types": {
+        "MEDIC": [
+            {"when": {"all": [{"players": True}, {"threat_level": {"!=": 0}}], "time_of_day": {">": 5}},
+             "action": "HEAL", "priority": 7, "target": "player", "reasoning": "Patching someone up"},
+        ],
+        "RAIDER": [
+            {"when": {"any": [{"threat_level": {">=": 30}}, {"time_of_day": {"==": 0}}]},
+             "action": "COMBAT", "priority": 9, "target": "player", "reasoning": "Raid"},
+            {"action": "PATROL", "priority": 5, "reasoning": "Looking around"},
+        ],
+    },
+}
+
+
+def write_behaviors(path, document):
+    with open(path, 'w') as f:
+        json.dump(document, f)
+    # Make sure the next check sees a new mtime even on coarse filesystems
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_invalid_files_rejected():
+    broken = [
+        {"global": [{"action": "FLEE", "when": {"health": {"<<": 30}}}]},
+        {"global": [{"action": "FLEE", "when": {"mana": {"<": 30}}}]},
+        {"global": [{"action": "FLEE", "when": {"health": {"<": "30"}}}]},
+        {"global": [{"action": "FLEE", "priority": "high"}]},
+        {"types": {"GUARD": [{"types": ["RAIDER"], "action": "FLEE"}]}},
+        {"fallback": {"action": ""}},
+    ]
+    for document in broken:
+        try:
+            parse_behaviors(document)
+        except BehaviorError:
+            continue
+        raise AssertionError(f"accepted invalid behaviors: {document}")
+
+    # Text from the file is embedded as data, never as code
+    odd = "'); import os; ('"
+    decide = compile_decider(parse_behaviors({"fallback": {"action": odd, "reasoning": '"""'}}))
+    assert decide({}, {})["action"] == odd
+
+
+def test_custom_rules_scalar_vs_vectorized():
+    """Both compilers agree on a spec using any/all, ==, !=, type-restricted globals and defaults"""
+    spec = parse_behaviors(CUSTOM)
+    decide = compile_decider(spec)
+    table = compile_rule_table(spec)
+    cases = equivalence_cases(seed=8)
+    cases += [({"type": "MEDIC", "health": h}, {"threat_level": t, "time_of_day": d, "nearby_players": p})
+              for h in (10, 20, 21) for t in (0, 5) for d in (0, 6) for p in ([], ["p1"])]
+    batch, _ = NPCBatch.pack(cases, defaults=spec['defaults'])
+    templates = table.templates
+    for (state, context), rule, first in zip(cases, table.match(batch).tolist(), batch.first_player):
+        action, priority, target, reasoning = templates[rule]
+        expected = decide(state, context)
+        assert expected == {"action": action, "target": first if target else None,
+                            "priority": priority, "reasoning": reasoning}, (state, context, expected)
+    assert decide({}, {"nearby_players": ["p"], "threat_level": 3})["action"] == "HEAL"  # Default type MEDIC
+    assert decide({"type": "GUARD"}, {})["action"] == "WANDER"
+    assert len(cases) > 20000
+
+
+def test_hot_reload():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'behaviors.json')
+        write_behaviors(path, CUSTOM)
+        behaviors = BehaviorSet(path, dict(BEHAVIOR_CONFIG, CHECK_INTERVAL=0))
+        reloaded = []
+        behaviors.on_reload(lambda b: reloaded.append(b.version))
+        raider = ({"type": "RAIDER"}, {"threat_level": 10, "time_of_day": 12})
+        assert behaviors.decide(*raider)["action"] == "PATROL"
+
+        tuned = json.loads(json.dumps(CUSTOM))
+        tuned["types"]["RAIDER"][0]["when"] = {"threat_level": {">=": 5}}
+        write_behaviors(path, tuned)
+        assert behaviors.decide(*raider)["action"] == "COMBAT"
+        assert reloaded == [behaviors.version]
+
+        # A broken edit keeps the last good rules
+        with open(path, 'w') as f:
+            f.write('{"types": ')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 2_000_000_000))
+        assert behaviors.decide(*raider)["action"] == "COMBAT"
+        assert behaviors.last_error and len(reloaded) == 1
+
+
+def test_bridge_and_connector_agree():
+    from ai_collaborative_bridge import generate_npc_decision
+    from ai_external_connector import ExternalAIConnector
+    connector = ExternalAIConnector()
+    cases = equivalence_cases(seed=21)
+    for state, context in cases:
+        decision = generate_npc_decision(state, context)
+        assert connector._determine_action(state, context) == decision["action"]
+        assert connector._calculate_priority(state, context) == decision["priority"]
+    # Same decisions through the vectorized engine
+    batch, _ = NPCBatch.pack(cases)
+    assert decide_batch(batch) == [generate_npc_decision(state, context) for state, context in cases]
+    assert len(cases) > 20000
+
+
+def main():
+    print("=" * 70)
+    print("NPC BEHAVIOR TABLES TEST")
+    print("=" * 70)
+
+    test_invalid_files_rejected()
+    print("✓ Invalid behavior files rejected")
+
+    test_custom_rules_scalar_vs_vectorized()
+    print("✓ Custom behavior file: compiled and vectorized rules agree on the grid + 20000 random cases")
+
+    test_hot_reload()
+    print("✓ File edits hot-reloaded; broken edits keep the previous rules")
+
+    test_bridge_and_connector_agree()
+    print("✓ Bridge, connector and vectorized engine agree on the grid + 20000 random cases")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
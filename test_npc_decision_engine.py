@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Equivalence test: vectorized NPC decision engine vs the per-NPC behavior rules
+
+Runs offline (no servers needed):
+    python test_npc_decision_engine.py
+"""
+
+import random
+import itertools
+import time
+
+import ai_collaborative_bridge as bridge
+from ai_collaborative_bridge import generate_npc_decision
+from ai_external_connector import ExternalAIConnector
+from npc_behaviors import parse_behaviors
+from npc_decision_engine import (NPCBatch, BRIDGE_RULES, NPC_TYPES as TYPE_NAMES, compile_rule_table,
+                                 decide_batch, decide_many, decide_world, connector_actions)
+from npc_spatial_index import NPCWorld
+from test_npc_spatial_index import random_world
+
+NPC_TYPES = ["CITIZEN", "TRADER", "GUARD", "RAIDER", "MEDIC", None]
+# Every rule threshold, plus the values either side of it
+HEALTH_VALUES = [0, 29, 29.5, 30, 31, 100]
+THREAT_VALUES = [0, 0.5, 19, 20, 21, 29, 30, 31, 39, 40, 41, 69, 70, 71, 100]
+HOUR_VALUES = [0, 5, 5.9, 6, 12, 22, 22.1, 23]
+PLAYER_VALUES = [[], ["player_1"], ["player_2", "player_3"]]
+
+
+def make_state(npc_type, health):
+    state = {"health": health}
+    if npc_type is not None:
+        state["type"] = npc_type
+    return state
+
+
+def make_context(threat, hour, players):
+    return {
+        "threat_level": threat,
+        "time_of_day": hour,
+        "nearby_players": players,
+        "player_nearby": bool(players),
+    }
+
+
+def grid_cases():
+    for npc_type, health, threat, hour, players in itertools.product(
+            NPC_TYPES, HEALTH_VALUES, THREAT_VALUES, HOUR_VALUES, PLAYER_VALUES):
+        yield make_state(npc_type, health), make_context(threat, hour, players)
+
+
+def random_cases(count, seed=1234):
+    rng = random.Random(seed)
+    for _ in range(count):
+        state = make_state(rng.choice(NPC_TYPES), rng.uniform(-10, 110))
+        context = make_context(rng.uniform(-10, 110), rng.randint(0, 23),
+                               rng.choice(PLAYER_VALUES))
+        if rng.random() < 0.1:
+            del context["time_of_day"]  # Defaults must match too
+        yield state, context
+
+
+def equivalence_cases(seed):
+    return list(grid_cases()) + list(random_cases(20000, seed=seed))
+
+
+def test_bridge_equivalence():
+    cases = equivalence_cases(seed=1234)
+    batch, errors = NPCBatch.pack(cases)
+    assert not errors, errors
+    vectorized = decide_batch(batch)
+    for (state, context), got in zip(cases, vectorized):
+        expected = generate_npc_decision(state, context)
+        assert got == expected, f"{state} {context}: {got} != {expected}"
+
+
+def test_connector_equivalence():
+    connector = ExternalAIConnector()
+    cases = equivalence_cases(seed=99)
+    batch, _ = NPCBatch.pack(cases)
+    actions, priorities = connector_actions(batch)
+    for (state, context), action, priority in zip(cases, actions, priorities):
+        assert action == connector._determine_action(state, context), (state, context, action)
+        assert priority == connector._calculate_priority(state, context), (state, context, priority)
+
+
+def test_bad_inputs_reported_per_npc():
+    cases = [
+        ({"type": "GUARD", "health": 80}, make_context(50, 12, [])),
+        ({"type": "GUARD", "health": "80"}, make_context(50, 12, [])),
+        ("not a dict", {}),
+    ]
+    decisions, errors = decide_many(cases, ids=["ok", "bad_health", "bad_state"])
+    assert list(decisions) == ["ok"]
+    assert set(errors) == {"bad_health", "bad_state"}
+    assert decisions["ok"] == generate_npc_decision(*cases[0])
+
+
+def test_world_equivalence():
+    world = random_world(random.Random(38), npcs=800)
+    world.update(npcs=[{"id": f"npc_{i}", "type": t} for i, t in enumerate(NPC_TYPES[:-1] + ["PIRATE"])]
+                 + [{"id": "npc_9", "health": None}])
+    for ids, hour in ((None, 14), (["npc_3", "pack_2", "npc_9", "missing"], 2)):
+        contexts, decisions, errors = decide_world(world, ids, time_of_day=hour)
+        assert contexts == world.compute(ids)
+        # No health (random_world sets some to None) can't be compared by the scalar rules either
+        assert set(errors) == {npc_id for npc_id in contexts if world.npc_state(npc_id)['health'] is None}
+        assert ids is None or "npc_9" in errors
+        assert set(decisions) == set(contexts) - set(errors)
+        for npc_id, decision in decisions.items():
+            expected = generate_npc_decision(world.npc_state(npc_id), dict(contexts[npc_id], time_of_day=hour))
+            assert decision == expected, (npc_id, decision, expected)
+    assert decide_world(NPCWorld(), None) == ({}, {}, {})
+    try:
+        decide_world(world, None, time_of_day="noon")
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("non-numeric time_of_day accepted")
+
+
+def test_bridge_endpoints():
+    client = bridge.app.test_client()
+    cases = list(random_cases(300, seed=5))
+    items = [{"id": f"n{i}", "state": state, "context": context} for i, (state, context) in enumerate(cases)]
+    reply = client.post("/npc-decisions", json=items + ["junk", {"id": "bad", "state": {"health": "x"}}]).get_json()
+    assert reply["decisions"] == {f"n{i}": generate_npc_decision(*case) for i, case in enumerate(cases)}
+    assert set(reply["errors"]) == {"300", "bad"}
+
+    npcs = [{"id": f"w{i}", "position": [i * 7.0, 0, 0], "type": NPC_TYPES[i % 5], "faction": "CITY" if i % 2 else None}
+            for i in range(40)]
+    reply = client.post("/world/update", json={"npcs": npcs, "players": [{"id": "p1", "position": [20, 0, 0]}],
+                                               "time_of_day": 23}).get_json()
+    for npc_id, decision in reply["decisions"].items():
+        state = bridge.world.npc_state(npc_id)
+        context = dict(reply["contexts"][npc_id], time_of_day=23)
+        assert decision == generate_npc_decision(state, context), npc_id
+    tick = client.post("/world/tick", json={"time_of_day": 23}).get_json()
+    assert tick["worklist"] and set(tick["decisions"]) == set(tick["worklist"])
+    assert all(tick["decisions"][npc_id] == reply["decisions"][npc_id] for npc_id in tick["worklist"])
+    # Through the bridge, so the LOD scheduler forgets them too and later ticks don't list them
+    bridge._apply_world_update({"removed": [npc["id"] for npc in npcs], "removed_players": ["p1"]})
+
+
+def test_many_types():
+    # Type codes must not wrap around past 127 distinct types
+    types = {f"T{i}": [{"action": f"ACT{i}", "priority": i % 10}] for i in range(300)}
+    spec = parse_behaviors({"types": types, "fallback": {"action": "IDLE"}})
+    table = compile_rule_table(spec)
+    cases = [({"type": f"T{i}"}, {}) for i in range(300)] + [({"type": "UNKNOWN"}, {})]
+    batch, _ = NPCBatch.pack(cases, defaults=spec['defaults'])
+    assert len(TYPE_NAMES) > 300
+    actions = [table.templates[rule][0] for rule in table.match(batch).tolist()]
+    assert actions == [f"ACT{i}" for i in range(300)] + ["IDLE"]
+
+
+def benchmark(count=100000):
+    cases = list(random_cases(count, seed=7))
+    start = time.perf_counter()
+    for state, context in cases:
+        generate_npc_decision(state, context)
+    scalar = time.perf_counter() - start
+
+    batch, _ = NPCBatch.pack(cases)
+    start = time.perf_counter()
+    BRIDGE_RULES.match(batch)
+    vectorized = time.perf_counter() - start
+    return scalar, vectorized
+
+
+def main():
+    print("=" * 70)
+    print("NPC DECISION ENGINE - EQUIVALENCE TEST")
+    print("=" * 70)
+
+    n = len(equivalence_cases(seed=0))
+
+    test_bridge_equivalence()
+    print(f"✓ generate_npc_decision: {n} cases identical")
+
+    test_connector_equivalence()
+    print(f"✓ ExternalAIConnector action/priority: {n} cases identical")
+
+    test_bad_inputs_reported_per_npc()
+    print("✓ Malformed NPCs reported per id")
+
+    test_world_equivalence()
+    print("✓ decide_world (NPCWorld arrays) matches the per-NPC rules on world contexts")
+
+    test_bridge_endpoints()
+    print("✓ /npc-decisions, /world/update and /world/tick decide through the engine, same results")
+
+    test_many_types()
+    print("✓ More than 127 NPC types keep distinct type codes")
+
+    scalar, vectorized = benchmark()
+    print(f"\n100,000 NPCs: per-NPC rules {scalar * 1000:.1f} ms, vectorized rule table {vectorized * 1000:.1f} ms")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
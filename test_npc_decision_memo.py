@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Decision memo must return exactly what the rules return
+
+Runs offline (no servers needed):
+    python test_npc_decision_memo.py
+"""
+
+import gc
+import random
+import time
+from decimal import Decimal
+
+import ai_collaborative_bridge as bridge
+from ai_collaborative_bridge import generate_npc_decision
+from npc_behaviors import parse_behaviors
+from npc_decision_engine import compile_rule_table, current_rules, decide_many
+from npc_decision_memo import DecisionMemo, MEMO_CONFIG, rule_thresholds
+from test_npc_decision_engine import equivalence_cases, make_context, random_cases
+
+GAME_TYPES = ["CITIZEN", "TRADER", "GUARD", "RAIDER", "MEDIC"]
+# Memo never steps aside for uncacheable values, so the memo path itself is what gets tested
+ALWAYS_MEMO = dict(MEMO_CONFIG, MIN_CACHEABLE_RATIO=0)
+
+
+def game_cases(count, seed=4):
+    """Crowd with the integer values a game sends - few distinct situations"""
+    rng = random.Random(seed)
+    return [({"type": rng.choice(GAME_TYPES), "health": rng.randint(0, 100)},
+             make_context(rng.choice(range(0, 101, 5)), rng.randint(0, 23), rng.choice([[], ["player_1"]])))
+            for _ in range(count)]
+
+
+def test_thresholds_from_rules():
+    assert rule_thresholds(current_rules().spec) == {
+        'health': [30], 'threat_level': [0, 20, 30, 40, 70], 'time_of_day': [6, 22]}
+
+
+def test_memo_matches_rules():
+    memo = DecisionMemo(config=ALWAYS_MEMO)
+    cases = equivalence_cases(seed=4321)
+    ids = [f"npc_{i}" for i in range(len(cases))]
+    expected = {npc_id: generate_npc_decision(*case) for npc_id, case in zip(ids, cases)}
+    for _ in range(2):  # Cold pass fills the memo, second pass is all hits
+        cold = memo.report()
+        decisions = {}
+        for start in range(0, len(cases), 5000):
+            got, errors = memo.decide_many(cases[start:start + 5000], ids[start:start + 5000])
+            assert not errors, errors
+            decisions.update(got)
+        assert decisions == expected
+        assert list(decisions) == ids
+    report = memo.report()
+    assert report['hits'] - cold['hits'] == len(cases) and report['misses'] == cold['misses'], report
+    assert 0 < report['entries'] <= cold['misses'] and report['bypassed'] == 0, report
+
+
+def test_retargets_per_npc():
+    memo = DecisionMemo()
+    cases = [({"type": "TRADER", "health": 90}, make_context(5, 12, ["alice"])),
+             ({"type": "TRADER", "health": 80}, make_context(8, 13, ["bob"]))]
+    memo.decide_many(cases[:1])
+    decisions, _ = memo.decide_many(cases)
+    assert (decisions[0]["target"], decisions[1]["target"]) == ("alice", "bob")
+    assert memo.report()['hits'] == 2 and memo.report()['entries'] == 1
+
+
+def test_bad_inputs_match_engine():
+    memo = DecisionMemo(config=ALWAYS_MEMO)
+    cases = [
+        ({"type": "GUARD", "health": 80}, make_context(50, 12, [])),
+        ({"type": "GUARD", "health": "80"}, make_context(50, 12, [])),
+        ({"type": "GUARD", "health": True}, make_context(50, 12, [])),
+        ({"type": "GUARD", "health": Decimal("25")}, make_context(50, 12, [])),
+        ({"type": "GUARD", "health": float("nan")}, make_context(50, 12, [])),
+        ({"type": ["GUARD"], "health": 80}, make_context(50, 12, [])),
+        ({"type": "TRADER"}, {"nearby_players": 5}),
+        ({"type": "TRADER"}, {"nearby_players": {"p1": 1}}),
+        ("not a dict", {}),
+        ({}, None),
+    ]
+    ids = [f"case_{i}" for i in range(len(cases))]
+    expected = decide_many(cases, ids)
+    for _ in range(2):  # Bypassed inputs are never memoized
+        assert memo.decide_many(cases, ids) == expected
+    assert memo.report()['bypassed'] == 2 * 9, memo.report()  # All but the first case
+
+
+def test_duplicate_ids_keep_last():
+    memo = DecisionMemo()
+    cases = [({"type": "GUARD", "health": 90}, make_context(10, 12, [])),
+             ({"type": "GUARD", "health": 10}, make_context(10, 12, [])),
+             ({"type": "GUARD", "health": 90}, make_context(10, 12, []))]
+    memo.decide_many(cases[:1], ["warm"])
+    ids = ["a", "b", "a"]
+    assert memo.decide_many(cases[1:] + cases[:1], ids) == decide_many(cases[1:] + cases[:1], ids)
+    assert memo.decide_many(cases, ids) == decide_many(cases, ids)
+
+
+def test_fractional_floats_skip_memo():
+    memo = DecisionMemo(config=dict(MEMO_CONFIG, RETRY_AFTER=2))
+    ints = game_cases(1000, seed=6)
+    floats = [list(random_cases(1000, seed=seed)) for seed in range(4)]
+    ids = list(range(1000))
+    for cases in [ints] + floats + [ints]:
+        assert memo.decide_many(cases, ids) == decide_many(cases, ids)
+    # Cold ints stay on the memo; the first float call trips the skip, the next two go straight to the
+    # rule table, the fourth tries the memo again and trips it again, so the last int call is skipped too
+    report = memo.report()
+    assert report['skipped'] == 3000 and report['hits'] + report['misses'] == 3000, report
+
+
+def test_rule_change_invalidates():
+    hold = compile_rule_table(parse_behaviors({
+        "fallback": {"action": "IDLE"},
+        "global": [{"types": ["GUARD"], "when": {"health": {">": 50}}, "action": "HOLD", "priority": 1}],
+    }))
+    tables = [current_rules()]
+    memo = DecisionMemo(rules=lambda: tables[-1])
+    cases = [({"type": "GUARD", "health": 90}, make_context(10, 12, [])),
+             ({"type": "GUARD", "health": 40}, make_context(10, 12, []))]
+    assert [d["action"] for d in memo.decide_many(cases)[0].values()] == ["PATROL", "PATROL"]
+
+    tables.append(hold)
+    assert [d["action"] for d in memo.decide_many(cases)[0].values()] == ["HOLD", "IDLE"]
+    assert memo.thresholds == [[50], [], []]
+    report = memo.report()
+    assert report['invalidations'] == 1 and report['entries'] == 2 and report['hits'] == 0, report
+
+
+def test_bridge_uses_memo():
+    client = bridge.app.test_client()
+    cases = game_cases(500, seed=8)
+    items = [{"id": f"m{i}", "state": state, "context": context} for i, (state, context) in enumerate(cases)]
+    # A fresh memo - earlier float-heavy requests in this process may have tripped the shared one's skip
+    shared, bridge.decision_memo = bridge.decision_memo, DecisionMemo()
+    try:
+        for _ in range(2):
+            reply = client.post("/npc-decisions", json=items).get_json()
+            assert reply["decisions"] == {f"m{i}": generate_npc_decision(*case) for i, case in enumerate(cases)}
+        assert client.get("/health").get_json()["decision_memo"]["hits"] >= 500
+    finally:
+        bridge.decision_memo = shared
+
+
+def best_of(fn, repeat=20):
+    gc.disable()
+    try:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+    finally:
+        gc.enable()
+
+
+def benchmark(count=5000, requests=20):
+    """Best-of timings per /npc-decisions sized request, a new crowd every request"""
+    results = {}
+    workloads = (("game-like", lambda seed: game_cases(count, seed)),
+                 ("random floats", lambda seed: list(random_cases(count, seed))))
+    ids = [str(i) for i in range(count)]
+    for name, make in workloads:
+        batches = [make(seed) for seed in range(requests + 1)]
+        memo = DecisionMemo()
+        cold = best_of(lambda: DecisionMemo().decide_many(batches[0], ids), 5)
+        memo.decide_many(batches[0], ids)
+        fresh = iter(batches[1:])
+        results[name] = {
+            'rules': best_of(lambda: {i: generate_npc_decision(*case) for i, case in zip(ids, batches[0])}),
+            'engine': best_of(lambda: decide_many(batches[0], ids)),
+            'memo_cold': cold,
+            'memo_warm': best_of(lambda: memo.decide_many(next(fresh), ids), requests),
+            'hit_ratio': memo.report()['hit_ratio'],
+            'skipped': memo.report()['skipped'] / (count * requests),
+        }
+    return results
+
+
+def main():
+    print("=" * 70)
+    print("NPC DECISION MEMO TEST")
+    print("=" * 70)
+
+    test_thresholds_from_rules()
+    print("✓ Buckets come from the thresholds in npc_behaviors.json")
+    test_memo_matches_rules()
+    print("✓ Memoized decisions identical to generate_npc_decision, cold and warm")
+    test_retargets_per_npc()
+    print("✓ Player-targeting decisions re-targeted per NPC")
+    test_bad_inputs_match_engine()
+    print("✓ Non-numeric / NaN / malformed inputs bypass the memo, same errors as decide_many")
+    test_duplicate_ids_keep_last()
+    print("✓ Repeated ids keep their last decision, like decide_many")
+    test_fractional_floats_skip_memo()
+    print("✓ Calls full of fractional floats go straight to the rule table for a while")
+    test_rule_change_invalidates()
+    print("✓ New rule table invalidates cached situations")
+    test_bridge_uses_memo()
+    print("✓ /npc-decisions answers through the memo (hits in /health)")
+
+    print()
+    for name, result in benchmark().items():
+        print(f"5,000 NPCs, {name} (hit ratio {result['hit_ratio']:.1%}, {result['skipped']:.0%} skipped the memo): "
+              f"rules {result['rules'] * 1000:.2f} ms, engine {result['engine'] * 1000:.2f} ms, "
+              f"memo {result['memo_warm'] * 1000:.2f} ms warm / {result['memo_cold'] * 1000:.2f} ms cold")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""NPC decision stream: keyframe on connect, deltas of changes only, resync on overflow, eviction
+
+Runs offline (no servers needed):
+    python test_npc_decision_stream.py
+"""
+
+import time
+
+from npc_decision_stream import DecisionStream, STREAM_CONFIG, KEYFRAME, DELTA, HEARTBEAT
+
+
+def decision(action, target=None, priority=5):
+    return {"action": action, "target": target, "priority": priority, "reasoning": ""}
+
+
+def make_stream(**overrides):
+    return DecisionStream(dict(STREAM_CONFIG, **overrides))
+
+
+def test_keyframe_then_deltas():
+    stream = make_stream()
+    stream.publish({"n1": decision("PATROL"), "n2": decision("IDLE")})
+    events = stream.events()
+    event, payload = next(events)
+    assert event == KEYFRAME and set(payload['decisions']) == {"n1", "n2"}
+
+    # Same action/target/priority (reasoning may differ) is not a change
+    assert stream.publish({"n1": dict(decision("PATROL"), reasoning="again"), "n2": decision("FLEE")}) == 1
+    event, payload = next(events)
+    assert event == DELTA and list(payload['changed']) == ["n2"]
+    assert payload['seq'] == stream.seq
+
+    # Player targets compare by id
+    stream.publish({"n1": decision("APPROACH", {"id": "p1", "distance": 4.0})})
+    next(events)
+    assert stream.publish({"n1": decision("APPROACH", {"id": "p1", "distance": 2.5})}) == 0
+
+    stream.publish({}, removed=["n2"])
+    event, payload = next(events)
+    assert event == DELTA and payload['removed'] == ["n2"] and payload['changed'] == {}
+    events.close()
+    assert stream.report()['subscribers'] == 0
+
+
+def test_overflow_resyncs():
+    stream = make_stream(QUEUE_SIZE=2)
+    events = stream.events()
+    next(events)
+    for i in range(5):
+        stream.publish({"n1": decision("PATROL", priority=i)})
+    assert stream.stats['resyncs'] == 1
+    event, payload = next(events)
+    assert event == KEYFRAME and payload['decisions']["n1"]["priority"] == 4
+    assert payload['seq'] == stream.seq
+    events.close()
+
+
+def test_heartbeat_before_keyframe():
+    stream = make_stream(KEYFRAME_INTERVAL=0.5, HEARTBEAT=0.1)
+    events = stream.events()
+    next(events)
+    start = time.monotonic()
+    event, _ = next(events)
+    assert event == HEARTBEAT and time.monotonic() - start < 0.4
+    events.close()
+
+
+def test_idle_npcs_expire():
+    stream = make_stream(NPC_TTL=0.05, SWEEP_INTERVAL=0.0)
+    stream.publish({"ghost": decision("IDLE")})
+    time.sleep(0.1)
+    events = stream.events()
+    next(events)
+    stream.publish({"alive": decision("PATROL")})
+    event, payload = next(events)
+    assert event == DELTA and payload['removed'] == ["ghost"]
+    assert set(stream.decisions) == {"alive"} and stream.stats['expired'] == 1
+    events.close()
+
+
+def main():
+    print("=" * 70)
+    print("NPC DECISION STREAM TEST")
+    print("=" * 70)
+
+    test_keyframe_then_deltas()
+    print("✓ Keyframe on connect, then deltas with only changed/removed NPCs")
+    test_overflow_resyncs()
+    print("✓ Subscriber queue overflow drops deltas and resyncs with a keyframe")
+    test_heartbeat_before_keyframe()
+    print("✓ Idle subscribers get heartbeats between keyframes")
+    test_idle_npcs_expire()
+    print("✓ NPCs not published for NPC_TTL seconds are evicted and sent as removed")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""LOD scheduler: per-tier intervals, global budget, activity promotion
+
+Runs offline (no servers needed):
+    python test_npc_lod_scheduler.py
+"""
+
+from npc_lod_scheduler import LODScheduler, LOD_CONFIG
+
+# One NPC per tier: near (0.5s), mid (2s), far (8s), dormant (30s)
+DISTANCES = {"near": 10.0, "mid": 100.0, "far": 300.0, "dormant": 1000.0}
+
+
+def make_scheduler(**overrides):
+    return LODScheduler(dict(LOD_CONFIG, **overrides))
+
+
+def run(scheduler, seconds, step=0.1, start=1000.0):
+    """Tick for `seconds` of simulated time; decisions per NPC"""
+    counts = {}
+    steps = int(round(seconds / step))
+    for i in range(steps):
+        for npc_id in scheduler.tick(start + i * step)['worklist']:
+            counts[npc_id] = counts.get(npc_id, 0) + 1
+    return counts
+
+
+def test_tier_intervals():
+    scheduler = make_scheduler()
+    assert sorted(scheduler.assign(DISTANCES, 1000.0)) == sorted(DISTANCES)  # New NPCs are rescheduled
+    counts = run(scheduler, 60.0)
+    # First decision at t=0, then one per tier interval
+    assert counts == {"near": 120, "mid": 30, "far": 8, "dormant": 2}, counts
+    assert scheduler.report()['tiers'] == {"near": 1, "mid": 1, "far": 1, "dormant": 1}
+
+
+def test_budget_prefers_near_tiers():
+    scheduler = make_scheduler(DECISIONS_PER_SECOND=10, BURST_SECONDS=1.0)
+    distances = {f"near_{i}": 10.0 for i in range(8)}
+    distances.update({f"far_{i}": 300.0 for i in range(8)})
+    scheduler.assign(distances, 1000.0)
+    work = scheduler.tick(1000.0)
+    assert len(work['worklist']) == 10 and work['deferred'] == 6
+    assert all(npc_id.startswith("near_") for npc_id in work['worklist'][:8])
+
+    # Over a longer run the budget caps throughput at DECISIONS_PER_SECOND (+ the initial burst)
+    counts = run(scheduler, 10.0, start=1000.1)
+    assert sum(counts.values()) <= 10 * 10 + 10
+    assert scheduler.report()['deferred'] > 0
+
+
+def test_activity_promotes_one_tier():
+    scheduler = make_scheduler()
+    scheduler.assign({"brawler": 100.0}, 1000.0)           # mid tier: every 2s
+    scheduler.tick(1000.0)
+    scheduler.record_decision("brawler", {"action": "COMBAT", "target": "p1", "priority": 9}, 80, 1000.0)
+    assert scheduler.assign({"brawler": 100.0}, 1000.1) == ["brawler"]  # Promoted to near: due at 1000.5
+    assert scheduler.next_updates(["brawler"]) == {"brawler": 1000.5}
+    assert scheduler.assign({"brawler": 100.0}, 1000.2) == []            # Nothing changed since
+
+
+def test_remove():
+    scheduler = make_scheduler()
+    scheduler.assign(DISTANCES, 1000.0)
+    scheduler.remove(["near", "missing"])
+    assert "near" not in scheduler.tick(1000.0)['worklist']
+    assert scheduler.report()['npcs'] == 3
+
+
+def main():
+    print("=" * 70)
+    print("NPC LOD SCHEDULER TEST")
+    print("=" * 70)
+
+    test_tier_intervals()
+    print("✓ Each tier decides at its own interval over 60 simulated seconds")
+    test_budget_prefers_near_tiers()
+    print("✓ Global budget caps decisions per tick; near tiers go first")
+    test_activity_promotes_one_tier()
+    print("✓ Active NPCs promoted one tier and reported as rescheduled")
+    test_remove()
+    print("✓ Removed NPCs leave the schedule")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
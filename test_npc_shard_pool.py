@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Sharded world workers: same contexts/decisions as in-process, workers can die
+
+Runs offline (no servers needed; spawns two worker processes even on one core):
+    python test_npc_shard_pool.py
+"""
+
+import json
+import os
+import random
+import time
+
+import ai_collaborative_bridge as bridge
+import npc_decision_engine
+from npc_behaviors import parse_behaviors
+from npc_decision_engine import current_rules, decide_world
+from npc_shard_pool import ShardPool, SHARD_CONFIG
+from test_npc_spatial_index import random_world
+
+
+def make_pool(workers=2, **overrides):
+    # MIN_NPCS=0: every request goes through the workers, however small
+    return ShardPool({**SHARD_CONFIG, "WORKERS": workers, "SHARDS": 8, "MIN_NPCS": 0, **overrides})
+
+
+def make_world(npcs=1500, seed=43):
+    world = random_world(random.Random(seed), npcs=npcs)
+    # Unknown and unhashable types, a health the rules can't compare, a lone guard with an int id
+    world.update(npcs=[{"id": "npc_1", "type": "PIRATE"}, {"id": "npc_2", "type": ["GUARD"]},
+                       {"id": "npc_3", "health": "80"}, {"id": 7, "position": [9000, 0, 9000], "type": "GUARD"}])
+    return world
+
+
+def check_matches_in_process(pool, world, ids=None, hour=14, decide=True):
+    result = pool.decide_world(world, ids, hour, decide)
+    if decide:
+        contexts, decisions, errors = decide_world(world, ids, hour)
+    else:
+        contexts, decisions, errors = world.compute(ids), {}, {}
+    assert json.loads(result['contexts']) == {str(npc_id): context for npc_id, context in contexts.items()}
+    assert json.loads(result['decisions_json']) == {str(npc_id): decision for npc_id, decision in decisions.items()}
+    assert result['decisions'] == decisions and result['errors'] == errors
+    if decide:
+        assert result['threat'] == {npc_id: context['threat_level'] for npc_id, context in contexts.items()}
+    return result
+
+
+def check_equivalence(pool):
+    world = make_world()
+    result = check_matches_in_process(pool, world)
+    assert set(result['errors']) >= {"npc_3"} and result['decisions'][7]["action"] == "PATROL"
+    check_matches_in_process(pool, world, ["npc_5", "pack_2", "npc_3", "missing", "npc_5", 7], hour=2)
+    check_matches_in_process(pool, world, decide=False)
+    world.update(removed=[f"npc_{i}" for i in range(0, 1500, 3)])
+    check_matches_in_process(pool, world)
+    assert pool.report()['pooled'] == 4
+
+
+def check_rule_changes(pool):
+    """Workers decide with the parent's current rule table, not the one they loaded"""
+    original = current_rules()
+    world = make_world(npcs=300)
+    try:
+        npc_decision_engine.load_rules(parse_behaviors({
+            "fallback": {"action": "IDLE"},
+            "global": [{"types": ["GUARD"], "when": {"health": {">": 50}}, "action": "HOLD", "priority": 1}],
+        }))
+        result = check_matches_in_process(pool, world)
+        assert result['decisions'][7]["action"] == "HOLD"
+    finally:
+        npc_decision_engine.load_rules(original.spec, original.version)
+    assert check_matches_in_process(pool, world)['decisions'][7]["action"] == "PATROL"
+
+
+def check_worker_death(pool):
+    """A killed worker's shards move to the survivor; a replacement is spawned on the next request"""
+    world = make_world(seed=44)
+    deaths = pool.report()['worker_deaths']
+    pool.workers[0]['process'].kill()
+    pool.workers[0]['process'].join()
+    check_matches_in_process(pool, world)
+    assert pool.report()['worker_deaths'] == deaths + 1 and pool.report()['live_workers'] == 1
+    check_matches_in_process(pool, world, hour=23)
+    report = pool.report()
+    assert report['restarts'] == 1 and report['live_workers'] == 2 and report['local_fallbacks'] == 0, report
+
+
+def test_shard_pool(report=lambda message: None):
+    pool = make_pool()
+    try:
+        check_equivalence(pool)
+        report("✓ Pooled contexts, decisions and errors identical to decide_world (all NPCs, subsets, removals)")
+        check_rule_changes(pool)
+        report("✓ Workers pick up a new rule table from the parent")
+        check_worker_death(pool)
+        report("✓ Worker killed: its shards rerun on the survivor, replacement spawned next request")
+    finally:
+        pool.close()
+
+
+def test_local_fallback():
+    pool = make_pool(workers=1, MAX_RESTARTS=0)
+    try:
+        world = make_world(npcs=200)
+        pool.start()
+        pool.workers[0]['process'].kill()
+        pool.workers[0]['process'].join()
+        check_matches_in_process(pool, world)
+        assert pool.report()['local_fallbacks'] == 1 and pool.report()['live_workers'] == 0
+    finally:
+        pool.close()
+
+
+def test_small_requests_in_process():
+    pool = make_pool(MIN_NPCS=1000)
+    try:
+        world = make_world(npcs=300)
+        check_matches_in_process(pool, world)
+        check_matches_in_process(pool, world, ["npc_1", "npc_2"])
+        assert pool.report()['pooled'] == 0 and pool.report()['workers'] == 0  # Never started
+    finally:
+        pool.close()
+
+
+def test_bridge_endpoints_pooled():
+    client = bridge.app.test_client()
+    npcs = [{"id": f"s{i}", "position": [i * 3.0, 0, (i % 7) * 4.0], "type": ["GUARD", "TRADER", "RAIDER"][i % 3],
+             "faction": "CITY" if i % 4 else "RAIDERS", "health": 20 + i % 80} for i in range(400)]
+    in_process, pooled = bridge.shard_pool, make_pool()
+    try:
+        replies = []
+        for pool in (pooled, in_process):
+            bridge.shard_pool = pool
+            reply = client.post("/world/update", json={"npcs": npcs, "players": [{"id": "p9", "position": [30, 0, 8]}],
+                                                       "time_of_day": 21})
+            assert reply.status_code == 200 and reply.mimetype == "application/json"
+            replies.append(reply.get_json())
+        assert replies[0] == replies[1]
+        assert pooled.report()['pooled'] == 1
+
+        bridge.shard_pool = pooled
+        tick = client.post("/world/tick", json={"time_of_day": 21}).get_json()
+        assert tick["worklist"] and set(tick["decisions"]) == set(tick["worklist"])
+        assert all(tick["decisions"][npc_id] == replies[0]["decisions"][npc_id] for npc_id in tick["worklist"])
+        assert client.get("/world").get_json()["shards"]["pooled"] == 2
+    finally:
+        bridge.shard_pool = in_process
+        pooled.close()
+        bridge._apply_world_update({"removed": [npc["id"] for npc in npcs], "removed_players": ["p9"]})
+
+
+def benchmark(count=100000, workers=2):
+    """One /world/update-sized request (decide every NPC, encode contexts + decisions): wall and parent CPU"""
+    world = random_world(random.Random(11), npcs=count, players=8, extent=3500.0)
+    pool = make_pool(workers=workers)
+    pool.start()
+    results = {}
+    try:
+        for name, run in (("in-process", lambda: ShardPool._in_process(world, None, 14, True)),
+                          ("pooled", lambda: pool.decide_world(world, None, 14))):
+            run()
+            best = None
+            for _ in range(3):
+                wall, cpu = time.perf_counter(), time.process_time()
+                run()
+                timing = (time.perf_counter() - wall, time.process_time() - cpu)
+                best = timing if best is None or timing[0] < best[0] else best
+            results[name] = best
+    finally:
+        pool.close()
+    return results
+
+
+def main():
+    print("=" * 70)
+    print("NPC SHARD POOL TEST")
+    print("=" * 70)
+
+    test_shard_pool(print)
+    test_local_fallback()
+    print("✓ No live workers and no restarts left: shards run in-process")
+    test_small_requests_in_process()
+    print("✓ Requests below MIN_NPCS decide in-process without starting workers")
+    test_bridge_endpoints_pooled()
+    print("✓ /world/update and /world/tick through the pool answer the same JSON as in-process")
+
+    print()
+    results = benchmark()
+    cores = os.cpu_count() or 1
+    for name, (wall, cpu) in results.items():
+        print(f"100,000 NPCs {name}: {wall * 1000:.0f} ms wall, {cpu * 1000:.0f} ms request-process CPU")
+    print(f"(2 workers on {cores} core{'s' if cores > 1 else ''}; the request process's CPU is what stays serial)")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
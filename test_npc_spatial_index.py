@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""NPC spatial grid: proximity and threat must match a brute-force O(n^2) pass
+
+Runs offline (no servers needed):
+    python test_npc_spatial_index.py
+"""
+
+import math
+import random
+
+from npc_spatial_index import NPCWorld, SPATIAL_CONFIG, ALARMED_STATES
+
+FACTIONS = ("CITY", "RAIDERS", "BROTHERHOOD", None)
+STATES = ("IDLE", "PATROL", "COMBAT", "ALERT", "FLEE")
+
+
+def random_world(rng, npcs=600, players=6, extent=400.0, config=None):
+    world = NPCWorld(config)
+    npc_list = [{
+        "id": f"npc_{i}",
+        "position": [rng.uniform(-extent, extent), rng.uniform(-5, 5), rng.uniform(-extent, extent)],
+        "faction": rng.choice(FACTIONS),
+        "health": rng.choice([10, 45, 80, 100, None]),
+        "state": rng.choice(STATES),
+    } for i in range(npcs)]
+    # Clusters so some cells are crowded, and entities exactly on cell borders
+    npc_list += [{"id": f"pack_{i}", "position": {"x": 30.0 * (i % 3), "y": 0, "z": rng.uniform(0, 8)},
+                  "faction": "RAIDERS"} for i in range(20)]
+    player_list = [{"id": f"p{i}", "position": [rng.uniform(-extent, extent), 0, rng.uniform(-extent, extent)],
+                    "health": rng.randint(1, 100)} for i in range(players)]
+    player_list.append({"id": "p_pack", "position": [15.0, 0, 4.0]})
+    world.update(npcs=npc_list, players=player_list)
+    return world
+
+
+def brute_force(world):
+    cfg = world.config
+    radius = cfg['NEARBY_RANGE']
+    npcs, players = world.npcs, world.players
+    expected = {}
+    for a, npc_id in enumerate(npcs.ids):
+        pos = npcs.position[a]
+        info = npcs.info[a]
+        enemy_distances, allies = [], 0
+        for b in range(len(npcs)):
+            if a == b:
+                continue
+            d = math.dist(pos, npcs.position[b])
+            if d < radius:
+                if npcs.info[b].get('faction') != info.get('faction'):
+                    enemy_distances.append(d)
+                else:
+                    allies += 1
+        nearby = sorted(((math.dist(pos, players.position[p]), p) for p in range(len(players))))
+        expected[npc_id] = {
+            'threat_level': world.threat(info.get('health'), info.get('state'), enemy_distances),
+            'nearby_players': [players.ids[p] for d, p in nearby if d < radius],
+            'nearby_enemies': len(enemy_distances),
+            'nearby_allies': allies,
+        }
+    return expected
+
+
+def assert_matches(world, contexts, expected):
+    assert set(contexts) == set(expected), set(contexts) ^ set(expected)
+    for npc_id, context in contexts.items():
+        want = expected[npc_id]
+        got = dict(context, nearby_players=[player['id'] for player in context['nearby_players']])
+        assert got == want, (npc_id, got, want)
+
+
+def test_matches_brute_force():
+    rng = random.Random(40)
+    for config in (SPATIAL_CONFIG, dict(SPATIAL_CONFIG, CELL_SIZE=12.0)):  # reach 1 and reach 3
+        world = random_world(rng, config=config)
+        assert_matches(world, world.compute(), brute_force(world))
+        assert len(world.npcs) == 620
+
+
+def test_updates_and_subsets():
+    rng = random.Random(41)
+    world = random_world(rng, npcs=300)
+    # Move, re-faction and remove some entities, then compare again
+    moves = [{"id": f"npc_{i}", "position": [rng.uniform(-50, 50), 0, rng.uniform(-50, 50)]} for i in range(0, 300, 3)]
+    world.update(npcs=moves + [{"id": "npc_1", "faction": "RAIDERS", "state": "COMBAT"}],
+                 removed=[f"npc_{i}" for i in range(2, 300, 7)] + ["never_existed"],
+                 removed_players=["p0"])
+    expected = brute_force(world)
+    assert_matches(world, world.compute(), expected)
+
+    subset = ["npc_1", "npc_3", "pack_4", "npc_2"]  # npc_2 was removed
+    contexts = world.compute(subset)
+    assert set(contexts) == {"npc_1", "npc_3", "pack_4"}
+    assert_matches(world, contexts, {npc_id: expected[npc_id] for npc_id in contexts})
+
+    nearest = world.nearest_player_distances(chunk=64)
+    for slot, npc_id in enumerate(world.npcs.ids):
+        want = min(math.dist(world.npcs.position[slot], world.players.position[p]) for p in range(len(world.players)))
+        assert abs(nearest[npc_id] - want) < 1e-9
+
+
+def test_threat_scoring():
+    world = NPCWorld()
+    # assessThreatLevel: +20 per enemy, +30 closer than 10 / +15 closer than 20, health and alarm bonuses
+    assert world.threat(100, "IDLE", [5.0]) == 50
+    assert world.threat(100, "IDLE", [15.0]) == 35
+    assert world.threat(100, "IDLE", [25.0]) == 20
+    assert world.threat(20, "IDLE", []) == 40
+    assert world.threat(50, ALARMED_STATES[0], []) == 45
+    assert world.threat(10, "COMBAT", [1.0, 2.0]) == 100
+
+
+def main():
+    print("=" * 70)
+    print("NPC SPATIAL INDEX TEST")
+    print("=" * 70)
+
+    test_matches_brute_force()
+    print("✓ Grid proximity/threat for 620 NPCs identical to brute force (two cell sizes)")
+    test_updates_and_subsets()
+    print("✓ Moves, removals and id subsets stay consistent; nearest-player distances exact")
+    test_threat_scoring()
+    print("✓ Threat scoring matches assessThreatLevel")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Trigram search: query plans, pruned results match a full scan, incremental + persisted index
+
+Runs offline (no servers needed):
+    python test_trigram_search.py
+"""
+
+import os
+import re
+import tempfile
+
+from workspace_index import WorkspaceIndex, INDEX_CONFIG
+from trigram_search import TrigramIndex, regex_plan, literal_plan
+
+FILES = {
+    "js/npc.js": "function spawnNPC(type) {\n  socket.send(type);\n}\nfunction updateNPC() {}\n",
+    "js/world.js": "const world = {};\nfunction updateWorld(dt) { websocket.send(dt); }\n",
+    "docs/guide.md": "# Guide\nCall spawnNPC once per village.\n",
+    "ai/agent.js": "class Agent { update() { return 42; } }\n",
+    "tools/skip.js": "function spawnNPC() {}\n",   # Not under an indexed root
+}
+
+
+def write(root, rel, text):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def brute_force(search, query, regex=False, ignore_case=False):
+    pattern = re.compile(query if regex else re.escape(query), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    return [(rel, n) for rel in sorted(search.file_trigrams)
+            for n, line in enumerate(search.workspace.get_text(rel).split('\n'), 1) if pattern.search(line)]
+
+
+def test_plans():
+    assert literal_plan("ab") is None
+    assert literal_plan("send") == ('and', ['end', 'sen'])
+    assert regex_plan(r"(socket|websocket)\.send") == ('and', [
+        ('or', [('and', ['cke', 'ket', 'ock', 'soc']),
+                ('and', ['bso', 'cke', 'ebs', 'ket', 'ock', 'soc', 'web'])]),
+        ('and', ['.se', 'end', 'sen'])])
+    assert regex_plan(r"upd?ate") == "ate"
+    assert regex_plan(r"u[pP]da?te") is None         # No literal run of 3 is required
+    assert regex_plan(r"(?:abcd)+x") == ('and', ['abc', 'bcd'])
+    assert regex_plan(r"abc|.*") is None             # One branch can match anything
+
+
+def check_search(root):
+    for rel, text in FILES.items():
+        write(root, rel, text)
+    workspace = WorkspaceIndex(root, dict(INDEX_CONFIG, WATCH=False))
+    search = TrigramIndex(workspace)
+    assert sorted(search.file_trigrams) == ["ai/agent.js", "docs/guide.md", "js/npc.js", "js/world.js"]
+
+    queries = [("spawnNPC", False, False), ("SPAWNNPC", False, True), (r"function\s+update\w*", True, False),
+               (r"(socket|websocket)\.send\(", True, False), (r"\d+", True, False), ("zzzz", False, False)]
+    for query, regex, ignore_case in queries:
+        result = search.search(query, regex=regex, ignore_case=ignore_case)
+        found = [(match["file"], match["line"]) for match in result["matches"]]
+        assert found == brute_force(search, query, regex, ignore_case), query
+    assert search.search("spawnNPC")["candidates"] == 2      # Pruned to the two files containing it
+    assert search.search("zzzz")["candidates"] == 0
+    assert [m["file"] for m in search.search("spawnNPC", path="docs")["matches"]] == ["docs/guide.md"]
+
+    # Edits arrive through the workspace index's change events
+    write(root, "ai/agent.js", "function spawnNPC() {}\n")
+    os.remove(os.path.join(root, "docs/guide.md"))
+    workspace.refresh()
+    assert [m["file"] for m in search.search("spawnNPC")["matches"]] == ["ai/agent.js", "js/npc.js"]
+
+    # A new process loads the stored trigrams instead of re-reading files
+    restarted = TrigramIndex(WorkspaceIndex(root, dict(INDEX_CONFIG, WATCH=False)))
+    assert restarted.stats["indexed"] == 0 and restarted.stats["loaded"] == 3
+    assert restarted.search("spawnNPC")["matches"] == search.search("spawnNPC")["matches"]
+
+
+def main():
+    print("=" * 70)
+    print("TRIGRAM SEARCH TEST")
+    print("=" * 70)
+
+    test_plans()
+    print("✓ Literal and regex queries reduce to trigram plans")
+
+    with tempfile.TemporaryDirectory() as root:
+        check_search(root)
+    print("✓ Pruned search matches a full scan; edits and restarts handled incrementally")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
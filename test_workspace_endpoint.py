@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""/workspace endpoint: summary, paging, fields, gzip and ETag/304
+
+Runs offline (Flask test client, no servers, no model):
+    python test_workspace_endpoint.py
+"""
+
+import gzip
+import json
+import os
+import tempfile
+
+import ai_collaborative_bridge as bridge
+from agent_with_tracing import OmniAgent, CONFIG
+
+FILES = 25
+
+
+def make_workspace(root):
+    for i in range(FILES):
+        path = os.path.join(root, "js", f"mod{i:02d}.js")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(f"function f{i}() {{\n  return {i};\n}}\n" * 20)
+    CONFIG["AGENT"]["MODEL"] = "fallback"
+    bridge.agent = OmniAgent(use_local=True, workspace_path=root)
+    return bridge.app.test_client()
+
+
+def check_summary(client, root):
+    data = client.get("/workspace?summary=1").get_json()
+    workspace = data["workspace"]
+    assert set(workspace) == set(bridge.WORKSPACE_SUMMARY_FIELDS), workspace
+    assert workspace["file_count"] == FILES and "files" not in workspace
+    assert root not in json.dumps(data)  # No absolute paths leak out
+
+
+def check_paging_and_fields(client):
+    seen = []
+    offset = 0
+    while offset is not None:
+        data = client.get(f"/workspace?offset={offset}&limit=10&fields=lines").get_json()
+        page = data["page"]
+        assert page["total"] == FILES and page["limit"] == 10
+        assert "root" not in data["workspace"]
+        for path, entry in data["workspace"]["files"].items():
+            assert entry == {"lines": 60}, entry
+            seen.append(path)
+        offset = page["next_offset"]
+    assert seen == sorted(seen) and len(seen) == FILES
+    assert client.get("/workspace?limit=0").status_code == 400
+
+
+def check_gzip_and_etag(client):
+    plain = client.get("/workspace")
+    assert plain.status_code == 200 and "Content-Encoding" not in plain.headers
+    compressed = client.get("/workspace", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+
+    etag = plain.headers["ETag"]
+    cached = client.get("/workspace", headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.data == b""
+    # A different query is a different representation
+    assert client.get("/workspace?summary=1", headers={"If-None-Match": etag}).status_code == 200
+
+    with open(os.path.join(bridge.agent.workspace_path, "js", "mod00.js"), 'a') as f:
+        f.write("// edited\n")
+    bridge.agent.index.refresh(["js/mod00.js"])
+    assert client.get("/workspace", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_workspace_endpoint(report=lambda message: None):
+    with tempfile.TemporaryDirectory() as root:
+        client = make_workspace(root)
+        try:
+            check_summary(client, root)
+            report("✓ summary=1 returns only the count fields - no file entries, no root path")
+            check_paging_and_fields(client)
+            report("✓ offset/limit pages follow next_offset through every file; fields trims entries")
+            check_gzip_and_etag(client)
+            report("✓ gzip on Accept-Encoding; If-None-Match answers 304 until the index changes")
+        finally:
+            bridge.agent.index.close()
+
+
+def main():
+    print("=" * 70)
+    print("WORKSPACE ENDPOINT TEST")
+    print("=" * 70)
+    test_workspace_endpoint(print)
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
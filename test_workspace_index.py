@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Shared workspace index and OmniAgent: metadata, cached content, incremental updates
+
+Runs offline (no servers, no model):
+    python test_workspace_index.py
+"""
+
+import os
+import time
+import tempfile
+
+from workspace_index import WorkspaceIndex, INDEX_CONFIG
+
+
+def write(root, rel, text):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    return path
+
+
+def check_index_and_refresh(root):
+    write(root, "js/game.js", "function tick() {\n  return 1;\n}\n")
+    write(root, "docs/notes.md", "# Notes\n")
+    write(root, "node_modules/x/index.js", "skip me\n")
+    index = WorkspaceIndex(root, dict(INDEX_CONFIG, WATCH=False))
+    changes = []
+    index.on_change(lambda paths, idx: changes.append(paths))
+
+    assert sorted(index.files) == ["docs/notes.md", "js/game.js"]
+    assert index.files["js/game.js"]["lines"] == 3
+    assert index.get_text("js/game.js").startswith("function tick")
+    version = index.version
+
+    # Content handed out stays valid after eviction from the cache
+    small = WorkspaceIndex(root, dict(INDEX_CONFIG, WATCH=False, MAX_CACHED=1))
+    held = small.get_bytes("js/game.js")
+    small.get_bytes("docs/notes.md")
+    assert held.startswith(b"function tick") and small.report()["cached_contents"] == 1
+
+    write(root, "js/game.js", "function tick() {}\n")
+    assert index.get_text("js/game.js") == "function tick() {}\n"  # Reads never serve stale content
+    assert index.refresh(["js/game.js"]) == ["js/game.js"]
+    assert index.files["js/game.js"]["lines"] == 1 and index.version != version
+
+    os.remove(os.path.join(root, "docs/notes.md"))
+    write(root, "ai/agent.js", "const a = 1;\n")
+    assert index.refresh() == ["ai/agent.js", "docs/notes.md"]
+    assert changes == [["js/game.js"], ["ai/agent.js", "docs/notes.md"]]
+    assert index.context()["file_count"] == 2
+
+    try:
+        index.get_text("../outside.txt")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("read outside the workspace")
+    index.close()
+
+
+def check_watcher(root):
+    index = WorkspaceIndex(root, dict(INDEX_CONFIG, WATCH=True, DEBOUNCE=0.05))
+    if index.observer is None:
+        return False
+    write(root, "js/new.js", "a\nb\n")
+    deadline = time.time() + 5
+    while "js/new.js" not in index.files and time.time() < deadline:
+        time.sleep(0.05)
+    assert index.files["js/new.js"]["lines"] == 2
+
+    # Writes outside the indexed set (trace files, caches) never schedule a refresh
+    version = index.version
+    write(root, "traces/spans.jsonl", "{}\n")
+    write(root, "js/sprite.png", "png")
+    time.sleep(0.3)
+    assert index.pending_timer is None and index.version == version
+    index.close()
+    return True
+
+
+def check_agent(root):
+    from agent_with_tracing import OmniAgent, CONFIG
+    CONFIG["AGENT"]["MODEL"] = "fallback"
+    write(root, "js/combat.js", "function fire() {\n  el.innerHTML = msg;\n}\n")
+    agent = OmniAgent(use_local=True, workspace_path=root)
+    assert OmniAgent(workspace_path=root).index is agent.index  # One index per workspace
+    assert agent.codebase_context["file_count"] == len(agent.codebase_context["files"])
+    assert "fire" in agent.analyze_code("combat.js")
+    improved = agent.auto_improve_code("js/combat.js")
+    assert improved["issues"][0]["type"] == "inner_html" and "innerHTML" in improved["analysis"]
+    assert "js/combat.js" in agent.process_query("where is combat handled?")
+    assert agent.scan_for_issues()["security"][0]["file"] == "js/combat.js"
+
+    # A word in most files carries no weight, however the match list is truncated
+    for i in range(6):
+        write(root, f"js/util{i}.js", "function f() {\n  return 1;\n}\n" * 100)
+    agent.index.refresh()
+    assert agent._relevant("return") == []
+    assert agent._relevant("return fire")[0][0] == "js/combat.js"
+
+
+def main():
+    print("=" * 70)
+    print("WORKSPACE INDEX TEST")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as root:
+        check_index_and_refresh(root)
+    print("✓ Metadata built once; edits and deletions applied incrementally")
+
+    with tempfile.TemporaryDirectory() as root:
+        watched = check_watcher(root)
+    print("✓ Watcher picks up new files" if watched else "⚠ watchdog not installed - watcher skipped")
+
+    with tempfile.TemporaryDirectory() as root:
+        check_agent(root)
+    print("✓ OmniAgent: shared index, local analysis, improvements, query context, scan")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+TRIGRAM SEARCH
+==============
+Full-text search over js/, ai/, scripts/, ai_context/ and docs/ for OmniAgent
+context and the bridge's /search endpoint.
+
+Every indexed file is reduced to its set of lowercase character trigrams. A
+query is turned into a trigram plan:
+- a literal needs all of its trigrams;
+- a regex needs the trigrams of the literal runs it cannot match without,
+  with alternations becoming OR.
+Only files that satisfy the plan are read (through the shared workspace index)
+and checked with the real pattern. Queries with nothing to prune on
+(".*", "ab") fall back to checking every file.
+
+The per-file trigram sets are persisted to ai_cache/trigram_index.json, keyed
+by (mtime, size), so a restart only re-indexes files that changed.
+Workspace index change events keep the index current while running.
+
+Usage:
+    search = get_search_index()
+    search.search("spawnNPC")                        # literal, case-sensitive
+    search.search(r"function\\s+update\\w*", regex=True, ignore_case=True, limit=20)
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+try:
+    import re._parser as _sre_parse
+    import re._constants as _sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse as _sre_parse
+    import sre_constants as _sre_constants
+
+from agent_with_tracing import trace_span
+from workspace_index import WorkspaceIndex, get_workspace_index
+
+SEARCH_CONFIG = {
+    'ROOTS': ('js', 'ai', 'scripts', 'ai_context', 'docs'),
+    'EXTENSIONS': ('.js', '.md', '.txt', '.json', '.html', '.css', '.py'),
+    'INDEX_PATH': os.path.join('ai_cache', 'trigram_index.json'),  # Relative to the workspace
+    'DEFAULT_LIMIT': 100,
+    'MAX_LIMIT': 1000,
+    'MAX_LINE_CHARS': 240,       # Matched lines are truncated to this in results
+}
+
+# Bump when the stored format or trigram extraction changes
+INDEX_FORMAT = 1
+
+
+def trigrams(text: str) -> set:
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# ---- query planning ----
+# A plan is None (no constraint: every file is a candidate), ('and', [plans])
+# or ('or', [plans]) with trigram strings as leaves.
+
+def _and(plans: List) -> Optional[tuple]:
+    plans = [plan for plan in plans if plan is not None]
+    if not plans:
+        return None
+    return plans[0] if len(plans) == 1 else ('and', plans)
+
+
+def literal_plan(literal: str) -> Optional[tuple]:
+    return _and(sorted(trigrams(literal)))
+
+
+def regex_plan(pattern: str) -> Optional[tuple]:
+    """Trigrams any match of `pattern` must contain; None when nothing can be required"""
+    try:
+        parsed = _sre_parse.parse(pattern)
+    except Exception:
+        return None
+    return _sequence_plan(list(parsed))
+
+
+def _sequence_plan(items) -> Optional[tuple]:
+    plans, run = [], []
+
+    def end_run():
+        if len(run) >= 3:
+            plans.append(literal_plan(''.join(run)))
+        run.clear()
+
+    for op, arg in items:
+        if op is _sre_constants.LITERAL:
+            run.append(chr(arg))
+            continue
+        end_run()
+        if op is _sre_constants.SUBPATTERN:
+            plans.append(_sequence_plan(list(arg[-1])))
+        elif op is _sre_constants.BRANCH:
+            branches = [_sequence_plan(list(branch)) for branch in arg[1]]
+            if all(branch is not None for branch in branches):
+                plans.append(('or', branches))
+        elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT) and arg[0] >= 1:
+            plans.append(_sequence_plan(list(arg[2])))
+        elif op is getattr(_sre_constants, 'POSSESSIVE_REPEAT', None) and arg[0] >= 1:
+            plans.append(_sequence_plan(list(arg[2])))
+        elif op is getattr(_sre_constants, 'ATOMIC_GROUP', None):
+            plans.append(_sequence_plan(list(arg)))
+    end_run()
+    return _and(plans)
+
+
+class TrigramIndex:
+    """Trigram postings over part of a WorkspaceIndex, updated on its change events"""
+
+    def __init__(self, workspace: WorkspaceIndex, config: Dict = None):
+        self.workspace = workspace
+        self.config = config or SEARCH_CONFIG
+        self.path = os.path.join(workspace.root, self.config['INDEX_PATH'])
+        self.lock = threading.Lock()
+        self.file_trigrams: Dict[str, Tuple[tuple, set]] = {}   # rel -> (stamp, trigrams)
+        self.postings: Dict[str, set] = {}                       # trigram -> {rel}
+        self.stats = {'searches': 0, 'indexed': 0, 'loaded': 0, 'candidates': 0, 'checked_all': 0}
+        self._build()
+        workspace.on_change(lambda changed, index: self.update(changed))
+
+    def _in_scope(self, rel: str) -> bool:
+        return rel.split('/', 1)[0] in self.config['ROOTS'] and rel.endswith(self.config['EXTENSIONS'])
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('format') == INDEX_FORMAT:
+                return stored['files']
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+        return {}
+
+    def _save(self):
+        with self.lock:
+            files = {rel: [list(stamp), ''.join(sorted(grams))]
+                     for rel, (stamp, grams) in self.file_trigrams.items()}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'format': INDEX_FORMAT, 'files': files}, f, separators=(',', ':'), ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def _build(self):
+        with trace_span("search.build", {"workspace.root": self.workspace.root}) as span:
+            stored = self._load()
+            dirty = set(stored) - set(self.workspace.files)
+            for rel in self.workspace.files:
+                if not self._in_scope(rel):
+                    continue
+                stamp = self.workspace.stamps.get(rel)
+                saved = stored.get(rel)
+                if saved is not None and stamp is not None and tuple(saved[0]) == stamp:
+                    blob = saved[1]
+                    self._add(rel, stamp, {blob[i:i + 3] for i in range(0, len(blob), 3)})
+                    self.stats['loaded'] += 1
+                elif self._index_file(rel):
+                    dirty.add(rel)
+            if dirty or set(stored) != set(self.file_trigrams):
+                self._save()
+            if span is not None:
+                span.set_attribute("search.files", len(self.file_trigrams))
+                span.set_attribute("search.reindexed", self.stats['indexed'])
+
+    def _add(self, rel: str, stamp: tuple, grams: set):
+        with self.lock:
+            self._remove(rel)
+            self.file_trigrams[rel] = (stamp, grams)
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(rel)
+
+    def _remove(self, rel: str):
+        old = self.file_trigrams.pop(rel, None)
+        if old is None:
+            return
+        for gram in old[1]:
+            holders = self.postings.get(gram)
+            if holders is not None:
+                holders.discard(rel)
+                if not holders:
+                    del self.postings[gram]
+
+    def _index_file(self, rel: str) -> bool:
+        stamp = self.workspace.stamps.get(rel)
+        try:
+            text = self.workspace.get_text(rel)
+        except (OSError, ValueError):
+            return False
+        self._add(rel, stamp, trigrams(text))
+        self.stats['indexed'] += 1
+        return True
+
+    def update(self, paths: Iterable[str]):
+        """Re-index changed files (workspace-relative); files that no longer exist are dropped"""
+        changed = False
+        for rel in paths:
+            if not self._in_scope(rel):
+                continue
+            if rel in self.workspace.files and self._index_file(rel):
+                changed = True
+            elif rel in self.file_trigrams:
+                with self.lock:
+                    self._remove(rel)
+                changed = True
+        if changed:
+            self._save()
+
+    # ---- search ----
+
+    def _candidates(self, plan) -> Optional[set]:
+        """Files satisfying the plan; None = every file"""
+        if plan is None:
+            return None
+        if isinstance(plan, str):
+            return self.postings.get(plan, set())
+        op, parts = plan
+        if op == 'or':
+            result = set()
+            for part in parts:
+                found = self._candidates(part)
+                if found is None:
+                    return None
+                result |= found
+            return result
+        result = None
+        # Rarest trigram first keeps the intersections small
+        for part in sorted(parts, key=lambda p: len(self.postings.get(p, ())) if isinstance(p, str) else 1 << 30):
+            found = self._candidates(part)
+            if found is None:
+                continue
+            result = set(found) if result is None else result & found
+            if not result:
+                break
+        return result
+
+    def search(self, query: str, regex: bool = False, ignore_case: bool = False,
+               limit: int = None, path: str = None) -> Dict[str, Any]:
+        """Matching lines: {"matches": [{"file", "line", "text"}], "candidates", "files", "truncated", "elapsed_ms"}
+
+        `path` restricts results to files under that prefix. Raises re.error for a bad regex.
+        """
+        start = time.perf_counter()
+        limit = max(1, min(int(limit or self.config['DEFAULT_LIMIT']), self.config['MAX_LIMIT']))
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        pattern = re.compile(query if regex else re.escape(query), flags)
+        plan = regex_plan(query) if regex else literal_plan(query)
+
+        with trace_span("search.query", {"search.regex": regex, "search.query": query[:100]}) as span:
+            with self.lock:
+                candidates = self._candidates(plan)
+                total = len(self.file_trigrams)
+                files = sorted(self.file_trigrams if candidates is None else candidates)
+            if path:
+                prefix = path.strip('/') + '/'
+                files = [rel for rel in files if rel.startswith(prefix) or rel == path.strip('/')]
+            self.stats['searches'] += 1
+            self.stats['candidates'] += len(files)
+            if candidates is None:
+                self.stats['checked_all'] += 1
+
+            matches, truncated = [], False
+            for rel in files:
+                try:
+                    text = self.workspace.get_text(rel)
+                except (OSError, ValueError):
+                    continue
+                line_no, scanned, last_line = 1, 0, 0
+                for match in pattern.finditer(text):
+                    line_no += text.count('\n', scanned, match.start())
+                    scanned = match.start()
+                    if line_no == last_line:
+                        continue  # One result per line
+                    last_line = line_no
+                    line_start = text.rfind('\n', 0, match.start()) + 1
+                    line_end = text.find('\n', match.start())
+                    line = text[line_start:line_end if line_end != -1 else len(text)]
+                    matches.append({"file": rel, "line": line_no,
+                                    "text": line.strip()[:self.config['MAX_LINE_CHARS']]})
+                    if len(matches) >= limit:
+                        truncated = True
+                        break
+                if truncated:
+                    break
+            if span is not None:
+                span.set_attribute("search.candidates", len(files))
+                span.set_attribute("search.matches", len(matches))
+
+        return {
+            "matches": matches,
+            "candidates": len(files),
+            "files": total,
+            "truncated": truncated,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def report(self) -> Dict[str, Any]:
+        return {'files': len(self.file_trigrams), 'trigrams': len(self.postings), **self.stats}
+
+
+# One search index per workspace root per process (on top of the shared workspace index)
+_search_indexes: Dict[str, TrigramIndex] = {}
+_search_lock = threading.Lock()
+
+
+def get_search_index(root: str = None) -> TrigramIndex:
+    workspace = get_workspace_index(root)
+    with _search_lock:
+        if workspace.root not in _search_indexes:
+            _search_indexes[workspace.root] = TrigramIndex(workspace)
+        return _search_indexes[workspace.root]
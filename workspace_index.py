@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+WORKSPACE INDEX
+===============
+One in-process index of the workspace, shared by every OmniAgent (coding
+assistant, task manager, diagnostics, collaborative bridge).
+
+- Metadata (size, lines, modified, type) for every file is built once at start-up.
+- Content is read on first use and kept in a bounded LRU of immutable bytes.
+  Every read re-stats the file, so an edit is never served stale. (Handing out
+  mmaps was unsafe: an eviction closed buffers other threads still held, and a
+  file truncated in place while mapped kills the process with SIGBUS.)
+- A watchdog observer applies create/modify/delete/move events incrementally.
+  Each change bumps `version`, which /workspace uses as its ETag. Without
+  watchdog, call refresh() to pick up changes.
+- on_change(callback) lets other caches (search index, scan) follow edits.
+
+`files` is replaced, never mutated in place, so callers can iterate a snapshot
+while the watcher applies changes.
+
+Usage:
+    index = get_workspace_index(os.getcwd())
+    index.files['js/omni-core-game.js']['lines']
+    text = index.get_text('js/omni-core-game.js')
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Callable, Iterable
+
+from agent_with_tracing import trace_span
+from codebase_scan import SCAN_CONFIG, iter_workspace_files
+
+INDEX_CONFIG = {
+    'EXTENSIONS': ('.js', '.py', '.html', '.css', '.md', '.json', '.txt'),
+    'SKIP_DIRS': SCAN_CONFIG['SKIP_DIRS'],
+    'MAX_FILE_BYTES': 4 * 1024 * 1024,
+    'WATCH': os.getenv('OMNI_INDEX_WATCH', '1') != '0',
+    'DEBOUNCE': 0.2,                 # Seconds to collect watcher events before applying them
+    'MAX_CACHED': 256,               # File contents kept in memory, least recently used dropped
+    'MAX_CACHED_BYTES': 64 * 1024 * 1024,
+}
+
+
+class WorkspaceIndex:
+    """File metadata + lazily read, cached content for one workspace root"""
+
+    def __init__(self, root: str, config: Dict = None):
+        self.root = os.path.abspath(root)
+        self.config = config or INDEX_CONFIG
+        self.lock = threading.RLock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.stamps: Dict[str, tuple] = {}       # rel -> (mtime_ns, size) last indexed
+        self.content: "OrderedDict[str, tuple]" = OrderedDict()  # rel -> ((mtime_ns, size), bytes)
+        self.content_bytes = 0
+        self.listeners: List[Callable[[List[str], 'WorkspaceIndex'], None]] = []
+        self.version_base = format(int(time.time() * 1000), 'x')  # Versions stay unique across restarts
+        self.changes = 0
+        self.stats = {'builds': 0, 'updates': 0, 'reads': 0, 'cache_hits': 0}
+        self._context: Optional[Dict[str, Any]] = None
+        self.observer = None
+        self.pending: set = set()
+        self.pending_timer: Optional[threading.Timer] = None
+        self.build()
+        if self.config['WATCH']:
+            self.start_watching()
+
+    @property
+    def version(self) -> str:
+        return f"{self.version_base}.{self.changes}"
+
+    # ---- metadata ----
+
+    def _in_scope(self, rel: str) -> bool:
+        parts = rel.split('/')
+        return (rel.endswith(self.config['EXTENSIONS'])
+                and not any(part in self.config['SKIP_DIRS'] or part.startswith('.') for part in parts[:-1]))
+
+    def _describe(self, path: str, stat) -> Dict[str, Any]:
+        with open(path, 'rb') as f:
+            lines = f.read().count(b'\n')
+        return {
+            'size': stat.st_size,
+            'lines': lines,
+            'modified': stat.st_mtime,
+            'type': os.path.splitext(path)[1].lstrip('.').lower(),
+        }
+
+    def build(self):
+        """Index the whole tree (start-up, or after a directory-level change)"""
+        with trace_span("workspace.build", {"workspace.root": self.root}) as span:
+            files, stamps = {}, {}
+            for rel, path, stat in iter_workspace_files(self.root, self.config['EXTENSIONS'],
+                                                        self.config['SKIP_DIRS'], self.config['MAX_FILE_BYTES']):
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                if self.stamps.get(rel) == stamp:
+                    files[rel] = self.files[rel]
+                else:
+                    try:
+                        files[rel] = self._describe(path, stat)
+                    except OSError:
+                        continue
+                stamps[rel] = stamp
+            with self.lock:
+                changed = sorted(set(files) ^ set(self.files) |
+                                 {rel for rel in files if self.stamps.get(rel) != stamps[rel]})
+                self.files, self.stamps = files, stamps
+                for rel in changed:
+                    self._drop_content(rel)
+                self.stats['builds'] += 1
+                if changed:
+                    self._changed()
+            if span is not None:
+                span.set_attribute("workspace.files", len(files))
+                span.set_attribute("workspace.changed", len(changed))
+        if changed and self.stats['builds'] > 1:
+            self._notify(changed)
+        return changed
+
+    def refresh(self, paths: Iterable[str] = None) -> List[str]:
+        """Re-stat the given files (relative or absolute), or rebuild everything; returns changed paths"""
+        if paths is None:
+            return self.build()
+        changed = []
+        files = None
+        with self.lock:
+            for rel in {self.relpath(path) for path in paths}:
+                if rel is None or not self._in_scope(rel):
+                    continue
+                path = os.path.join(self.root, rel)
+                try:
+                    stat = os.stat(path)
+                    stamp = (stat.st_mtime_ns, stat.st_size)
+                    if stat.st_size > self.config['MAX_FILE_BYTES'] or not os.path.isfile(path):
+                        raise FileNotFoundError(path)
+                except OSError:
+                    if rel in self.files:
+                        files = files if files is not None else dict(self.files)
+                        del files[rel]
+                        self.stamps.pop(rel, None)
+                        self._drop_content(rel)
+                        changed.append(rel)
+                    continue
+                if self.stamps.get(rel) == stamp:
+                    continue
+                try:
+                    meta = self._describe(path, stat)
+                except OSError:
+                    continue
+                files = files if files is not None else dict(self.files)
+                files[rel] = meta
+                self.stamps[rel] = stamp
+                self._drop_content(rel)
+                changed.append(rel)
+            if changed:
+                self.files = files
+                self.stats['updates'] += len(changed)
+                self._changed()
+        if changed:
+            self._notify(sorted(changed))
+        return sorted(changed)
+
+    def _changed(self):
+        self.changes += 1
+        self._context = None
+
+    def on_change(self, callback: Callable[[List[str], 'WorkspaceIndex'], None]):
+        """callback(changed_paths, index) after each applied batch of changes"""
+        self.listeners.append(callback)
+
+    def _notify(self, changed: List[str]):
+        for callback in list(self.listeners):
+            try:
+                callback(changed, self)
+            except Exception as e:
+                print(f"⚠ Workspace index listener failed: {e}")
+
+    def context(self) -> Dict[str, Any]:
+        """codebase_context: counts, version and the files snapshot"""
+        with self.lock:
+            if self._context is None:
+                files = self.files
+                self._context = {
+                    'root': self.root,
+                    'version': self.version,
+                    'file_count': len(files),
+                    'total_lines': sum(meta['lines'] for meta in files.values()),
+                    'total_bytes': sum(meta['size'] for meta in files.values()),
+                    'files': files,
+                }
+            return self._context
+
+    def relpath(self, path: str) -> Optional[str]:
+        """Workspace-relative posix path, or None when path is outside the root"""
+        full = os.path.abspath(os.path.join(self.root, path))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            return None
+        return os.path.relpath(full, self.root).replace(os.sep, '/')
+
+    # ---- content ----
+
+    def get_bytes(self, path: str) -> bytes:
+        """File content (cached until the file changes)"""
+        rel = self.relpath(path)
+        if rel is None:
+            raise ValueError(f"Path outside workspace: {path}")
+        full = os.path.join(self.root, rel)
+        stat = os.stat(full)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.content.get(rel)
+            if cached is not None and cached[0] == stamp:
+                self.content.move_to_end(rel)
+                self.stats['cache_hits'] += 1
+                return cached[1]
+            self._drop_content(rel)
+            with open(full, 'rb') as f:
+                data = f.read()
+            self.stats['reads'] += 1
+            self.content[rel] = (stamp, data)
+            self.content_bytes += len(data)
+            while len(self.content) > 1 and (len(self.content) > self.config['MAX_CACHED']
+                                             or self.content_bytes > self.config['MAX_CACHED_BYTES']):
+                self._drop_content(next(iter(self.content)))
+            return data
+
+    def get_text(self, path: str) -> str:
+        return self.get_bytes(path).decode('utf-8', errors='replace')
+
+    def _drop_content(self, rel: str):
+        cached = self.content.pop(rel, None)
+        if cached is not None:
+            self.content_bytes -= len(cached[1])
+
+    # ---- watcher ----
+
+    def start_watching(self) -> bool:
+        """Follow filesystem events with watchdog (optional dependency)"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            print("⚠ watchdog not installed - workspace index refreshes on demand only")
+            return False
+
+        index = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.event_type in ('opened', 'closed', 'closed_no_write'):
+                    return
+                if event.is_directory and event.event_type == 'modified':
+                    return
+                index._queue(event.src_path, event.is_directory)
+                if getattr(event, 'dest_path', None):
+                    index._queue(event.dest_path, event.is_directory)
+
+        self.observer = Observer()
+        self.observer.schedule(_Handler(), self.root, recursive=True)
+        self.observer.daemon = True
+        self.observer.start()
+        return True
+
+    def _dir_in_scope(self, rel: str) -> bool:
+        return not any(part in self.config['SKIP_DIRS'] or part.startswith('.') for part in rel.split('/'))
+
+    def _queue(self, path: str, is_directory: bool = False):
+        """Collect one watcher event; events outside the indexed set (traces/, ai_cache/,
+        history/, ...) are dropped here so writes there never schedule a refresh"""
+        rel = self.relpath(path)
+        if rel is None or rel == '.':
+            return
+        if is_directory:
+            if not self._dir_in_scope(rel):
+                return
+            item = None  # Whole directory created/moved/deleted: rebuild
+        elif self._in_scope(rel):
+            item = rel
+        else:
+            return
+        with self.lock:
+            self.pending.add(item)
+            if self.pending_timer is None:
+                self.pending_timer = threading.Timer(self.config['DEBOUNCE'], self._apply_pending)
+                self.pending_timer.daemon = True
+                self.pending_timer.start()
+
+    def _apply_pending(self):
+        with self.lock:
+            pending, self.pending = self.pending, set()
+            self.pending_timer = None
+        if None in pending:
+            self.build()
+            return
+        stale = [rel for rel in pending if self._is_stale(rel)]
+        if not stale:
+            return  # Saved without changes, attribute-only events, ...
+        with trace_span("workspace.refresh", {"workspace.events": len(stale)}):
+            self.refresh(stale)
+
+    def _is_stale(self, rel: str) -> bool:
+        try:
+            stat = os.stat(os.path.join(self.root, rel))
+        except OSError:
+            return rel in self.files
+        return self.stamps.get(rel) != (stat.st_mtime_ns, stat.st_size)
+
+    def close(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join(timeout=5)
+            self.observer = None
+        with self.lock:
+            if self.pending_timer is not None:
+                self.pending_timer.cancel()
+                self.pending_timer = None
+            for rel in list(self.content):
+                self._drop_content(rel)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'root': self.root,
+            'version': self.version,
+            'files': len(self.files),
+            'watching': self.observer is not None,
+            'cached_contents': len(self.content),
+            'cached_bytes': self.content_bytes,
+            **self.stats,
+        }
+
+
+# One index per workspace root per process, shared by every agent
+_indexes: Dict[str, WorkspaceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_workspace_index(root: str = None) -> WorkspaceIndex:
+    root = os.path.abspath(root or os.getcwd())
+    with _indexes_lock:
+        if root not in _indexes:
+            _indexes[root] = WorkspaceIndex(root)
+        return _indexes[root]